@@ -1,417 +1,513 @@
 # -*- coding: utf-8 -*-
-from dash import Dash, dcc, html, dash_table, Input, Output, State, callback_context, dash
-import dash_bootstrap_components as dbc
-import plotly.graph_objects as go
-import pandas as pd
-
-
-
-app = Dash(
-    __name__,
-    external_stylesheets=[dbc.themes.MINTY, dbc.icons.FONT_AWESOME],
-)
-
-# make dataframe from assets
-
-df_income = pd.read_csv("assets/real-median-household-income-NY.csv")
-df_housing = pd.read_csv("assets/median-listing-price-NY.csv")
-df_unemployment = pd.read_csv("assets/unemployment-rate-NY.csv")
-df_gas_price = pd.read_csv("assets/Gasoline_Retail_Prices_Weekly_Average_by_Region__Beginning_2007.csv")
-
-# change 'observation_date' column to 'Year'
-df_income['Year'] = pd.to_datetime(df_income['observation_date']).dt.year
-df_housing['Year'] = pd.to_datetime(df_housing['observation_date']).dt.year
-df_unemployment['Year'] = pd.to_datetime(df_unemployment['observation_date']).dt.year
-
-# remove 'observation_date' column
-df_income = df_income.drop(columns=['observation_date'])
-df_housing = df_housing.drop(columns=['observation_date'])
-df_unemployment = df_unemployment.drop(columns=['observation_date'])
-
-# cleaning gas price data
-df_gas_price["Date"] = pd.to_datetime(df_gas_price["Date"])
-df_gas_price["Year"] = df_gas_price["Date"].dt.year
-df_yearly_avg_gas_price = df_gas_price.groupby("Year")["New York State Average ($/gal)"].mean().reset_index()
-df_yearly_avg_gas_price = df_yearly_avg_gas_price.rename(columns={"New York State Average ($/gal)": "Average Gas Price"})
-df_yearly_avg_gas_price["Average Gas Price"] = df_yearly_avg_gas_price["Average Gas Price"].round(2)
-
-
-# rename other info columns
-df_income = df_income.rename(columns={"MEHOINUSNYA672N": "Median Household Income"})
-df_housing = df_housing.rename(columns={"MEDLISPRINY": "Median Housing Price"})
-df_unemployment = df_unemployment.rename(columns={"NYUR": "Unemployment Rate"})
-
-# merge all 3 dataframes + drop NaN values
-merged_df = df_income.merge(df_housing, on='Year', how='outer') \
-                     .merge(df_unemployment, on='Year', how='outer') \
-                     .merge(df_yearly_avg_gas_price, on='Year', how='outer')
-df = merged_df.dropna()
-
-MIN_YR = df['Year'].min()
-MAX_YR = df['Year'].max()
-
-COLORS = {
-    "Median Household Income": "#3cb521",
-    "Median Housing Price": "#fd7e14",
-    "Unemployment Rate": "#446e9b",
-    "Average Gas Price" : "#fcba03",
-    "background": "whitesmoke",
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import functools
+import os
+import time
+
+import metrics
+
+# dash, plotly and pandas are imported inside create_app() and the state
+# properties below, so importing this module (tests, tooling, gunicorn
+# --preload) costs next to nothing
+
+
+
+DEFAULT_CONFIG = {
+    # figure cache settings: max number of cached figures, and whether to build
+    # every (indicator, year range) combination during warm_up(). warming makes
+    # room for all of them on top of figure_cache_size
+    "figure_cache_size": 512,
+    "figure_cache_warm": False,
+
+    # results history: "server" keeps each session's rows in memory on the server and
+    # the browser only holds a session token, "shared" keeps them on the server in a
+    # diskcache under history_cache_dir that every worker process reads (needs the
+    # optional diskcache package), "client" keeps the rows in the dcc.Store.
+    # either way only the newest history_max_rows rows are kept, and the results
+    # table is paged, sorted and filtered on the server (see results.py). a
+    # session's requests can land on any worker, so production_config() turns
+    # "server" into "shared" whenever there is more than one. shared sessions
+    # expire history_expire seconds after their last new rows
+    "history_mode": "server",
+    "history_max_rows": 300,
+    "history_max_sessions": 1000,
+    "history_cache_dir": ".cache/history",
+    "history_expire": 86400,
+
+    # clientside mode sends the merged dataframe to the browser once and runs the
+    # dashboard callback there (assets/clientside.js), so slider and dropdown changes
+    # make no server requests. history is then always kept in the browser
+    "clientside_mode": False,
+
+    # most points the weekly gas price chart sends to the browser, about the
+    # chart width in pixels. zooming resamples the visible window
+    "gas_max_points": 1000,
+
+    # background callbacks: the regional charts are built in a separate process
+    # (dash's DiskcacheManager, needs the optional diskcache, multiprocess and
+    # psutil packages), so a long build doesn't hold a request thread and a
+    # build the user has already moved on from is killed. the browser polls
+    # for the result every background_interval ms and the card title shows the
+    # progress meanwhile. results are kept under background_cache_dir for
+    # background_cache_expire seconds, keyed by the inputs and the dataset
+    # version and shared by every worker, and a cached result is sent without
+    # starting a job. without the packages the charts are built in the request
+    "background_enabled": False,
+    "background_cache_dir": ".cache/background",
+    "background_cache_expire": 3600,
+    "background_interval": 250,
+
+    # states and metro areas besides New York, one folder each under areas_dir
+    # (see areas.py). an area is loaded on first use and at most
+    # area_cache_size of them stay loaded besides New York, the least recently
+    # used is dropped. clientside mode only has New York
+    "areas_dir": "areas",
+    "area_cache_size": 8,
+
+    # binary cache of the parsed asset frames, see data.IngestCache
+    "ingest_cache_enabled": True,
+    "ingest_cache_dir": ".cache/ingest",
+    "ingest_cache_hash": False,
+
+    # seconds between checks of the asset files for new rows, 0 turns it off.
+    # new rows are merged into the loaded data without a restart, see
+    # DashboardState.refresh(). other areas pick up changed files the next
+    # time they are loaded
+    "refresh_interval": 0,
+
+    # callback timings, payload sizes and cache hits in the Prometheus text
+    # format at metrics_path. each worker reports its own, labelled with its
+    # pid. the debug header adds a Server-Timing header with the stages of
+    # each callback response
+    "metrics_enabled": True,
+    "metrics_path": "/metrics",
+    "metrics_debug_header": False,
+
+    # csv (and parquet, with pyarrow installed) downloads of the selected
+    # indicator and of the regional gas prices under export.EXPORT_PATH,
+    # encoded export_chunk_rows rows at a time while they are sent
+    "export_enabled": True,
+    "export_chunk_rows": 10000,
+
+    # load the data and build the layout in create_app() instead of on the
+    # first request
+    "warm_up": False,
+
+    # serving. debug turns on the dash dev tools and hot reload, only for
+    # development. workers/threads are read by gunicorn.conf.py (0 workers
+    # means one per CPU). responses over compress_min_size bytes are gzip or
+    # brotli compressed, and files under assets/ are cached by browsers for
+    # static_max_age seconds (dash adds a ?m=<mtime> to their urls, so edits
+    # still get picked up)
+    "debug": True,
+    "host": "127.0.0.1",
+    "port": 8050,
+    "workers": 0,
+    "threads": 4,
+    "compress": True,
+    "compress_min_size": 500,
+    "static_max_age": 31536000,
 }
 
 
+def config_from_env(environ=None, prefix="APP_"):
+    # APP_<KEY> environment variables override DEFAULT_CONFIG, for example
+    # APP_DEBUG=0 or APP_HISTORY_MODE=client
+    environ = os.environ if environ is None else environ
+    config = {}
+    for key, default in DEFAULT_CONFIG.items():
+        value = environ.get(prefix + key.upper())
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            value = value.strip().lower() in ("1", "true", "yes", "on")
+        elif isinstance(default, int):
+            value = int(value)
+        config[key] = value
+    return config
 
-"""
-==========================================================================
-Markdown Text
-"""
 
-asset_allocation_text = dcc.Markdown(
-    """
-> Explore how changes in the cost of living and housing market dynamics affect household income over time. 
+def worker_count(config):
+    # the number of server processes gunicorn.conf.py starts
+    return config["workers"] or os.cpu_count() or 1
 
-> Adjust the year range and compare trends in median household income, unemployment rates, and housing prices.
-  Select an indicator to see how it evolves between the years.
-    """
-)
 
-footer = html.Div(
-    dcc.Markdown(
-        """
-         The data presented in this analysis is based on publicly available sources and is
-        intended for general informational purposes only. It is not meant to replace
-        professional financial, economic, or policy advice. The trends and visualizations
-        presented here should not be interpreted as financial recommendations and should be
-        considered alongside other resources and expert guidance when making financial or
-        investment decisions. 
-        """
-    ),
-    className="p-2 mt-5 bg-primary text-white small",
-)
+def production_config(environ=None):
+    # the settings of gunicorn.conf.py and wsgi.py: APP_* variables with debug
+    # off. server history in memory lives in one process, the other workers
+    # would answer a session with an empty table, so several workers share it
+    # through a diskcache
+    config = dict(DEFAULT_CONFIG, debug=False)
+    config.update(config_from_env(environ))
+    if worker_count(config) > 1 and config["history_mode"] == "server":
+        config["history_mode"] = "shared"
+    return config
 
 
 
 """
 ==========================================================================
-Tables
+Startup Timing
 """
-results_table = dash_table.DataTable(
-    id="results_table",
-    columns=[
-        {"name": "Year", "id": "Year", "type": "numeric"},
-        {"name": "Change", "id": "Change", "type": "text"},
-        {"name": "Median Household Income", "id": "Median Household Income", "type": "numeric", "format": {"specifier": "$,.0f"}},
-        {"name": "Unemployment Rate", "id": "Unemployment Rate", "type": "numeric", "format": {"specifier": ".1f"}},
-        {"name": "Median Housing Price", "id": "Median Housing Price", "type": "numeric", "format": {"specifier": "$,.0f"}},
-        {"name": "Average Gas Price", "id": "Average Gas Price", "type": "numeric", "format": {"specifier": "$,.2f"}},
-    ],
-    page_size=15,
-    data=df.to_dict("records"),
-    style_table={"height": "300px", "overflowY": "auto"},
-    style_header={
-        'whiteSpace': 'normal',
-        'height': 'auto',
-        'lineHeight': '1.5',
-        'textAlign': 'center',
-    },
-)
 
+class StartupTimer:
+    # wall time spent in each startup stage, see report()
+    def __init__(self):
+        self.stages = OrderedDict()
 
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
 
-"""
-==========================================================================
-Figures
-"""
-
-def make_line_chart(dff, selected_indicator):
-    start = int(dff.iloc[0]["Year"])  # start year
-    end = int(dff.iloc[-1]["Year"])  # end year
-    yrs = len(dff["Year"]) - 1
-    dtick = 1 if yrs < 16 else 2 if yrs in range(16, 30) else 5
-
-    fig = go.Figure()
-
-    dff = dff.copy()
-
-    fig.add_trace(
-        go.Scatter(
-            x=dff["Year"],
-            y=dff["Median Household Income"],
-            name="Median Household Income",
-            marker_color=COLORS["Median Household Income"],
-            yaxis="y",
-        )
-    )
-
-    fig.add_trace(
-        go.Scatter(
-            x=dff["Year"],
-            y=dff[selected_indicator],
-            name=selected_indicator,
-            marker_color=COLORS.get(selected_indicator),
-            yaxis="y2",
-            hoverlabel=dict(
-                bgcolor="white",
-                font_size=12,
-                font_family="Arial",
-                align="left",
-                namelength=-1
-            )
-        )
-    )
-
-    indicator_ranges = {
-        "Median Housing Price": {"yaxis2": {"range": [350000, 650000], "tickprefix": "$"}},
-        "Unemployment Rate": {"yaxis2": {"range": [3.0, 9.0], "ticksuffix": "%", "tickformat": ".1f"}},
-        "Average Gas Price": {"yaxis2": {"range": [2.00, 4.50], "tickprefix": "$", "tickformat": ".2f"}},
-    }
-
-    indicator_range = indicator_ranges[selected_indicator]
-
-    fig.update_layout(
-        title=f"Median Household Income vs. {selected_indicator} Trends ({start} - {end})",
-        template="none",
-        showlegend=True,
-        legend=dict(
-            x=0.5,
-            y=1.1,
-            xanchor="right",
-            yanchor="top",
-            orientation="h",
-        ),
-        height=400,
-        margin=dict(l=80, r=90, t=80, b=55),
-        yaxis=dict(
-            title="Median Household Income ($)",
-            tickprefix="$",
-            range=[75000, 87000],
-            title_standoff=10,
-        ),
-        hoverlabel=dict(
-            bgcolor="white",
-            font_size=12,
-            font_family="Arial",
-            align="left",
-            namelength=-1
-        ),
-        yaxis2=dict(
-            title=f"{selected_indicator}",
-            overlaying="y",
-            side="right",
-            fixedrange=True,
-            title_standoff=15,
-            range=indicator_range['yaxis2']['range'],
-            tickprefix=indicator_range['yaxis2'].get('tickprefix', ''),
-            ticksuffix=indicator_range['yaxis2'].get('ticksuffix', ''),
-            tickformat = indicator_range['yaxis2'].get('tickformat', ''),
-        ),
-        xaxis=dict(title="Years", fixedrange=True, dtick=dtick),
-    )
-
-    return fig
-
-
-def make_bar_graph(dff, selected_indicator, year_range):
-    start_year = year_range[0]
-    end_year = year_range[1]
-
-    df_start = dff[dff["Year"] == start_year]
-    df_end = dff[dff["Year"] == end_year]
-
-    indicator_start = df_start[selected_indicator].iloc[0] if not df_start.empty else None
-    indicator_end = df_end[selected_indicator].iloc[0] if not df_end.empty else None
-
-    fig = go.Figure(
-        go.Bar(
-            x=[f"{start_year}", f"{end_year}"],
-            y=[indicator_start, indicator_end],
-            name=f"{selected_indicator}",
-            marker_color=COLORS.get(selected_indicator),
-        )
-    )
-
-    indicator_ranges = {
-        "Median Housing Price": {"yaxis": {"range": [0, 650000], "tickprefix": "$"}},
-        "Unemployment Rate": {"yaxis": {"range": [0.0, 9.0], "ticksuffix": "%"}},
-        "Average Gas Price": {"yaxis": {"range": [0.00, 5.00], "tickprefix": "$", "tickformat": ".2f"}},
-    }
-
-    indicator_range = indicator_ranges[selected_indicator]
-
-    fig.update_layout(
-        title=f"{selected_indicator} at {start_year} vs. {end_year}",
-        template="none",
-        showlegend=True,
-        legend=dict(
-            x=0.5,
-            y=1.1,
-            xanchor="center",
-            yanchor="top",
-            orientation="h",
-        ),
-        height=400,
-        margin=dict(l=80, r=90, t=80, b=55),
-        xaxis=dict(
-            title="Year",
-            tickvals=[start_year, end_year],
-        ),
-        yaxis=dict(
-            title=selected_indicator,
-            range = indicator_range['yaxis']['range'],
-            tickprefix = indicator_range['yaxis'].get('tickprefix', ''),
-            ticksuffix = indicator_range['yaxis'].get('ticksuffix', ''),
-            tickformat = indicator_range['yaxis'].get('tickformat', ''),
-        ),
-        bargap=0.45,
-        plot_bgcolor=COLORS["background"],
-
-    )
-
-    return fig
-
+    def report(self):
+        lines = [f"{name:<24}{seconds * 1000:>9.1f} ms" for name, seconds in self.stages.items()]
+        lines.append(f"{'total':<24}{sum(self.stages.values()) * 1000:>9.1f} ms")
+        return "\n".join(lines)
 
 
 
 """
 ==========================================================================
-Make Tabs
+App State
 """
 
-# =======Play tab components
-
-asset_allocation_card = dbc.Card(asset_allocation_text, className="mt-2")
-
-slider_card = dbc.Card(
-    [
-        html.H4("Select Year Range...", className="card-title"),
-        dcc.RangeSlider(
-            id="year_range_slider",
-            marks={year: str(year) for year in range(MIN_YR, MAX_YR + 1)},
-            min=MIN_YR,
-            max=MAX_YR,
-            step=1,
-            value=[MIN_YR, MAX_YR],
-            included=True,
-        ),
-    ],
-    body=True,
-    className="mt-4",
-    style={"margin-bottom": "10px"},
-)
-
-indicator_dropdown_card = dbc.Card(
-    dbc.CardBody(
-        [
-            html.H4("Select Indicator", className="card-title"),
-            dbc.Row(
-                [
-                    dbc.Col(
-                        dcc.Dropdown(
-                            id="indicator_dropdown",
-                            options=[
-                                {'label': 'Median Housing Price', 'value': 'Median Housing Price'},
-                                {'label': 'Unemployment Rate', 'value': 'Unemployment Rate'},
-                                {'label': 'Average Gas Price', 'value': 'Average Gas Price'}
-                            ],
-                            value="Median Housing Price",
-                            style={"width": "100%"},
-                        ),
-                    ),
-                ]
-            )
-        ]
-    ),
-    style={"width": "100%", "margin": "0 auto"}
-)
-
-results_card = dbc.Card(
-    [
-        dbc.CardHeader("Results"),
-        html.Div(results_table),
-    ],
-    className="mt-4",
-)
+class DashboardState:
+    # everything the callbacks share. the dataset, figure module and layout are
+    # created on first use (or by warm_up) so create_app() itself stays cheap
+    def __init__(self, config, timer):
+        self.config = config
+        self.timer = timer
+        self.metrics = metrics.Metrics()
+        self._dataset = None
+        self._datasets = None
+        self._area_names = None
+        self._figures = None
+        self._figure_cache = None
+        self._history = None
+        self._background_cache = None
+        self._layout = None
+        self._watcher = None
+        self._lock = threading.RLock()
+        self.callbacks = {}
+
+    @property
+    def dataset(self):
+        if self._dataset is None:
+            with self._lock:
+                if self._dataset is None:
+                    with self.timer.stage("import data"):
+                        import data
+                    with self.timer.stage("load data"):
+                        # started first, so rows added while loading are seen
+                        self._watcher = data.AssetWatcher()
+                        self._dataset = self.load_dataset()
+        return self._dataset
+
+    def load_dataset(self, area=None):
+        import data
+        return data.load_dataset(
+            self.config["ingest_cache_enabled"],
+            self.config["ingest_cache_dir"],
+            self.config["ingest_cache_hash"],
+            area,
+        )
 
-# ========= Build tabs
-tabs = dbc.Tabs(
-    [
-        dbc.Tab(
-            [asset_allocation_card, slider_card, indicator_dropdown_card],
-            id="tab-1",
-            label="Play",
-        ),
-        dbc.Tab(
-            [results_card],
-            id="tab-2",
-            label="Results",
+    @property
+    def datasets(self):
+        # the areas other than New York, see data.DatasetCache
+        if self._datasets is None:
+            with self._lock:
+                if self._datasets is None:
+                    import areas
+                    import data
+                    self._datasets = data.DatasetCache(
+                        self.config["area_cache_size"],
+                        lambda key: self.load_dataset(areas.find(key, self.config["areas_dir"])),
+                        self.forget_area,
+                    )
+        return self._datasets
+
+    def forget_area(self, area):
+        # drop the cached figures of an area that is no longer loaded. they
+        # are keyed by the dataset version, so a reload with changed files
+        # wouldn't use them anyway
+        if self._figure_cache is not None:
+            self._figure_cache.rekey(lambda key: None if key[1] == area else key)
+
+    @property
+    def area_names(self):
+        # {area key: name} for the area dropdown, read once
+        if self._area_names is None:
+            import areas
+            if self.config["clientside_mode"]:
+                self._area_names = {areas.DEFAULT_AREA: areas.DEFAULT_NAME}
+            else:
+                self._area_names = areas.catalog(self.config["areas_dir"])
+        return self._area_names
+
+    def area_dataset(self, area):
+        # New York is always loaded, the layout and refresh() use it.
+        # KeyError for an area that doesn't exist
+        import areas
+        if area in (None, areas.DEFAULT_AREA):
+            return self.dataset
+        return self.datasets.get(area)
+
+    def use_dataset(self, dataset):
+        # swap in a different dataset, dropping everything built from the old one
+        with self._lock:
+            self._dataset = dataset
+            self._layout = None
+            if self._figure_cache is not None:
+                self._figure_cache.clear()
+
+    def refresh(self):
+        # merge rows added to the asset files since the last call into a new
+        # dataset and swap it in. requests already running finish on the old
+        # one. cached figures are keyed by the dataset version, the ones of
+        # unaffected years are moved to the new version and the rest dropped.
+        # returns the affected years
+        import data
+        with self._lock:
+            dataset = self.dataset
+            try:
+                new_rows = self._watcher.poll()
+                if not new_rows:
+                    return set()
+                updated, years = dataset.updated(new_rows)
+            except ValueError:
+                # more than new rows changed, load everything again
+                self._watcher = data.AssetWatcher()
+                dataset = self.load_dataset()
+                self.use_dataset(dataset)
+                return set(range(dataset.gas_min_year, dataset.gas_max_year + 1))
+
+            if self._figure_cache is not None:
+                gas_changed = "gas_price" in new_rows
+                self._figure_cache.rekey(
+                    lambda key: refreshed_cache_key(key, dataset.version, updated.version, years, gas_changed)
+                )
+            self._dataset = updated
+            self._layout = None
+            return years
+
+    @property
+    def figures(self):
+        if self._figures is None:
+            with self._lock:
+                if self._figures is None:
+                    with self.timer.stage("import figures"):
+                        import figures
+                    self._figure_cache = figures.FigureCache(self.config["figure_cache_size"])
+                    self._figures = figures
+        return self._figures
+
+    @property
+    def history(self):
+        if self._history is None:
+            with self._lock:
+                if self._history is None:
+                    import results
+                    if self.config["history_mode"] == "shared":
+                        try:
+                            import diskcache
+                        except ImportError as error:
+                            # rather than quietly losing the history between workers
+                            raise ImportError(
+                                'history_mode "shared" (the default with several workers) needs diskcache, '
+                                'install it or set APP_HISTORY_MODE=client'
+                            ) from error
+                        self._history = results.SharedHistoryStore(
+                            diskcache.Cache(self.config["history_cache_dir"]),
+                            self.config["history_max_rows"],
+                            self.config["history_expire"],
+                        )
+                    else:
+                        self._history = results.HistoryStore(
+                            self.config["history_max_rows"], self.config["history_max_sessions"]
+                        )
+        return self._history
+
+    @property
+    def background_cache(self):
+        # the diskcache.Cache of background jobs and regional results, None
+        # when background callbacks are off or the packages aren't installed
+        if self._background_cache is None:
+            with self._lock:
+                if self._background_cache is None:
+                    # in a list, an empty Cache is falsy and None means not opened yet
+                    self._background_cache = [open_background_cache(self.config)]
+        return self._background_cache[0]
+
+    @property
+    def figure_cache(self):
+        self.figures  # creates the cache on first use
+        return self._figure_cache
+
+    def layout(self):
+        if self._layout is None:
+            with self._lock:
+                if self._layout is None:
+                    clientside_data = None
+                    if self.config["clientside_mode"]:
+                        with self.timer.stage("clientside dataset"):
+                            clientside_data = self.figures.clientside_dataset(
+                                self.dataset, self.config["history_max_rows"]
+                            )
+                    dataset = self.dataset
+                    with self.timer.stage("build layout"):
+                        import layout
+                        self._layout = layout.make_layout(dataset, clientside_data, self.area_names)
+        return self._layout
+
+    def cached(self, key, build):
+        value = self.figure_cache.get(key)
+        metrics.count_cache(value is not None)
+        if value is None:
+            value = build()
+            self.figure_cache.put(key, value)
+        return value
+
+    def cached_dashboard(self, selected_indicator, year_range, area=None):
+        import areas
+        area = area or areas.DEFAULT_AREA
+        dataset = self.area_dataset(area)
+        year_range = dataset.clamp_years(selected_indicator, year_range)
+        key = ("dashboard", area, dataset.version, selected_indicator, year_range[0], year_range[1])
+        return self.cached(
+            key,
+            lambda: self.figures.build_dashboard(dataset.repository, dataset.stats, selected_indicator, year_range),
         )
-    ],
-    id="tabs",
-    active_tab="tab-0",
-    className="mt-2",
-)
 
-"""
-===========================================================================
-Main Layout
-"""
+    def gas_weekly_graph(self, x_range=None, area=None):
+        import areas
+        area = area or areas.DEFAULT_AREA
+        dataset = self.area_dataset(area)
 
-app.layout = (
-    dcc.Store("stored_data"),
-    dbc.Container(
-    [
-        dbc.Row(
-            dbc.Col(
-                html.Div(
-                    [
-                        html.H2(
-                            "Cost of Living in New York Analysis",
-                            className="text-center text-white p-2",
-                        ),
-                        html.H6(
-                            "Malia de Jesus, CS-150: Community Action Computing",
-                            className="text-center text-white",
-                        ),
-                    ],
-                    className="bg-primary p-2",
+        def build():
+            with metrics.stage("figure"):
+                return self.figures.build_gas_weekly_graph(
+                    dataset.gas_weekly, dataset.gas_weekly_column, x_range, self.config["gas_max_points"]
                 )
+
+        if x_range is None:
+            return self.cached(("gas_weekly", area, dataset.version), build)
+        return build()
+
+    def regional_request(self, regions, frequency, year_range, area=None):
+        # (dataset, the regions it has, key of the result in background_cache)
+        import areas
+        area = area or areas.DEFAULT_AREA
+        dataset = self.area_dataset(area)
+        regions = [region for region in regions if region in dataset.regional_gas[frequency].blocks]
+        key = ("regional", area, dataset.version, tuple(regions), frequency, int(year_range[0]), int(year_range[1]))
+        return dataset, regions, key
+
+    def cached_regional_graphs(self, regions, frequency, year_range, area=None):
+        # the figures from background_cache, or None
+        cache = self.background_cache
+        if cache is None:
+            return None
+        _, _, key = self.regional_request(regions, frequency, year_range, area)
+        value = cache.get(key)
+        metrics.count_cache(value is not None)
+        return value
+
+    def regional_graphs(self, regions, frequency, year_range, area=None, progress=None):
+        import numpy as np
+        value = self.cached_regional_graphs(regions, frequency, year_range, area)
+        if value is not None:
+            return value
+
+        dataset, regions, key = self.regional_request(regions, frequency, year_range, area)
+        cache = self.background_cache
+        with metrics.stage("figure"):
+            value = self.figures.build_regional_graphs(
+                dataset.regional_gas[frequency],
+                regions,
+                dataset.gas_state_region,
+                np.datetime64(f"{int(year_range[0])}-01-01"),
+                np.datetime64(f"{int(year_range[1])}-12-31"),
+                progress,
             )
-        ),
-        dbc.Row(
-            [
-                dbc.Col(tabs, width=12, lg=5, className="mt-4 border"),
-                dbc.Col(
-                    [
-                        dcc.Graph(id="line_chart", className="mb-2"),
-                        dcc.Graph(
-                            id="bar_graph",
-                            className="mb-2",
-                            style={
-                                'display': 'flex',
-                                'justify-content': 'center',
-                                'align-items': 'center',
-                                'width': '80%',
-                                'margin': 'auto',
-                            }
-                        ),
-                        html.Hr(),
-                        dcc.Store(id="change_statement_store"),
-                        html.Div([
-                            html.B(id="change_statement"),
-                            html.P("Note: There may have been fluctuations between these years.")
-                        ], className="change-statement-container"),
-                        html.Hr(),
-                    ],
-                    width=12,
-                    lg=7,
-                    className="pt-4",
-                ),
-            ],
-            className="ms-1",
-        ),
-        dbc.Row(dbc.Col(footer)),
-    ],
-    fluid=True,
-))
+        if cache is not None:
+            cache.set(key, value, expire=self.config["background_cache_expire"])
+        return value
+
+    def collect_job_metrics(self):
+        # add the timings background jobs pushed to background_cache (see
+        # register_callbacks) to this process's metrics
+        cache = self.background_cache
+        if cache is None:
+            return
+        while True:
+            _, value = cache.pull(prefix=JOB_METRICS_PREFIX)
+            if value is None:
+                return
+            callback, stages = value
+            for stage, seconds in stages:
+                self.metrics.observe_duration(callback, stage, seconds)
+
+    def warm_figure_cache(self):
+        # every state the slider can produce. the cache grows to hold them all,
+        # and the default indicator goes last so it is the most recently used
+        import layout
+        names = sorted(self.figures.INDICATORS, key=lambda name: name == layout.DEFAULT_INDICATOR)
+        states = [
+            (selected_indicator, year_range)
+            for selected_indicator in names
+            for year_range in self.dataset.year_ranges(selected_indicator)
+        ]
+        cache = self.figure_cache
+        cache.max_size = max(cache.max_size, len(states) + self.config["figure_cache_size"])
+        for selected_indicator, year_range in states:
+            self.cached_dashboard(selected_indicator, year_range)
+
+
+
+# background jobs push the timings of their callback to background_cache
+# under this prefix, the metrics of their own process end with them
+JOB_METRICS_PREFIX = "job-metrics"
+
+
+def open_background_cache(config):
+    if not config["background_enabled"]:
+        return None
+    try:
+        import diskcache
+        # not used here, but DiskcacheManager needs them
+        import multiprocess
+        import psutil
+    except ImportError:
+        return None
+    return diskcache.Cache(config["background_cache_dir"])
+
+
+def refreshed_cache_key(key, old_version, new_version, years, gas_changed):
+    # the key of a figure cache entry once New York's data went from
+    # old_version to new_version, or None if the entry was built from rows
+    # that changed (or from an even older version). the version in the key
+    # already keeps old entries from being served, this only saves the
+    # unaffected ones from being built again
+    import areas
+    if key[1] != areas.DEFAULT_AREA:
+        return key
+    if key[2] != old_version:
+        return None
+    if key[0] == "dashboard":
+        _, area, _, selected_indicator, start, end = key
+        if any(start <= year <= end for year in years):
+            return None
+        return ("dashboard", area, new_version, selected_indicator, start, end)
+    if key[0] == "gas_weekly" and not gas_changed:
+        return ("gas_weekly", key[1], new_version)
+    return None
 
 
 
@@ -420,182 +516,573 @@ app.layout = (
 Callbacks
 """
 
+def register_callbacks(app, state):
+    from dash import Input, Output, State, ClientsideFunction, callback_context, no_update
+    from dash.exceptions import PreventUpdate
+
+    def instrumented(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            with state.metrics.callback(fn.__name__):
+                return fn(*args)
+        return wrapper
+
+    def check_area(area):
+        # an area that isn't in the dropdown (an old page, a made up request)
+        # would fail to load. None is New York
+        if area is not None and area not in state.area_names:
+            raise PreventUpdate
+
+    def table_page(history, page_current, page_size, sort_by, filter_query):
+        # (rows of the page the table shows, number of pages) of a
+        # results.ResultsHistory or of the rows of client history
+        import results
+        page_current = page_current or 0
+        page_size = page_size or 15
+        sort_by = [(column["column_id"], column["direction"]) for column in sort_by or []]
+
+        if isinstance(history, results.ResultsHistory):
+            return history.query(page_current, page_size, sort_by, filter_query)
+        return results.query_rows(history or [], page_current, page_size, sort_by, filter_query)
+
+    @instrumented
+    def update_dashboard(
+        selected_indicator, year_range, stored_data, range_only=False, area=None,
+        page_current=0, page_size=15, sort_by=None, filter_query="",
+    ):
+        # the new rows go into the history, and the page of it the table
+        # shows is sent in the same response
+        line_fig, bar_fig, change_statement, table = state.cached_dashboard(selected_indicator, year_range, area)
+
+        if range_only:
+            # same indicator, so the charts in the browser only need the
+            # parts that depend on the years
+            figures = state.figures
+            with metrics.stage("patch"):
+                line_fig = figures.figure_patch(line_fig, figures.LINE_RANGE_PATHS)
+                bar_fig = figures.figure_patch(bar_fig, figures.BAR_RANGE_PATHS)
+
+        if state.config["history_mode"] in ("server", "shared"):
+            token, history = state.history.add((stored_data or {}).get("session"), table)
+            # the version changes the store every time
+            stored_data = {"session": token, "version": history.version}
+        else:
+            import results
+            if not isinstance(stored_data, list):
+                stored_data = []
+            history = stored_data = (results.to_rows(table, hidden=True) + stored_data)[:state.config["history_max_rows"]]
+
+        with metrics.stage("table"):
+            rows, page_count = table_page(history, page_current, page_size, sort_by, filter_query)
+        return line_fig, bar_fig, change_statement, stored_data, rows, page_count
+
+    @instrumented
+    def update_results_table(stored_data, page_current, page_size, sort_by, filter_query):
+        # paging, sorting or filtering the rows already in the history
+        if isinstance(stored_data, dict):
+            stored_data = state.history.get(stored_data.get("session"))
+            if stored_data is None:
+                return [], 1
+        return table_page(stored_data, page_current, page_size, sort_by, filter_query)
+
+    @instrumented
+    def update_area(area):
+        # the slider bounds, gas regions and title of another area. its data
+        # is loaded here if it isn't already
+        import areas
+        import layout
+        area = area or areas.DEFAULT_AREA
+        if area not in state.area_names:
+            raise PreventUpdate
+        dataset = state.area_dataset(area)
+        options, value = layout.region_choices(dataset)
+        min_year, max_year = dataset.gas_min_year, dataset.gas_max_year
+        name = layout.area_title(state.area_names.get(area, area))
+        return (
+            layout.year_bounds(dataset),
+            options,
+            value,
+            min_year,
+            max_year,
+            layout.region_year_marks(min_year, max_year),
+            [min_year, max_year],
+            name,
+        )
 
-@app.callback(
-    Output("line_chart", "figure"),
-    [
+    dashboard_outputs = [
+        Output("line_chart", "figure"),
+        Output("bar_graph", "figure"),
+        Output("change_statement", "children"),
+        Output("stored_data", "data"),
+    ]
+    table_outputs = [
+        Output("results_table", "data"),
+        Output("results_table", "page_count"),
+    ]
+    table_state = [
+        State("results_table", "page_current"),
+        State("results_table", "page_size"),
+        State("results_table", "sort_by"),
+        State("results_table", "filter_query"),
+    ]
+    dashboard_inputs = [
         Input("indicator_dropdown", "value"),
-        Input("year_range_slider", "value")
+        Input("year_range_slider", "value"),
     ]
-)
-def update_line_graph(selected_indicator, year_range):
-    df_filtered = df[(df["Year"] >= year_range[0]) & (df["Year"] <= year_range[1])]
-
-    fig = go.Figure()
-
-    fig.add_trace(
-        go.Scatter(
-            x=df_filtered["Year"],
-            y=df_filtered["Median Household Income"],
-            name="Median Household Income",
-            marker_color=COLORS["Median Household Income"],
-            yaxis="y",
-        )
+
+    # the slider covers the years the chosen indicator has data for. this runs
+    # in the browser in both modes, dash waits for it before update_dashboard
+    app.clientside_callback(
+        ClientsideFunction(namespace="dashboard", function_name="year_bounds"),
+        Output("year_range_slider", "min"),
+        Output("year_range_slider", "max"),
+        Output("year_range_slider", "marks"),
+        Output("year_range_slider", "value"),
+        Input("indicator_dropdown", "value"),
+        Input("year_bounds", "data"),
+        State("year_range_slider", "value"),
     )
 
-    fig.add_trace(
-        go.Scatter(
-            x=df_filtered["Year"],
-            y=df_filtered[selected_indicator],
-            name=selected_indicator,
-            marker_color=COLORS.get(selected_indicator),
-            yaxis="y2",
-            hoverlabel=dict(
-                bgcolor="white",
-                font_size=12,
-                font_family="Arial",
-                align="left",
-                namelength=-1
-            )
+    if state.config["clientside_mode"]:
+        # every row is in the browser, the table pages, sorts and filters them
+        app.clientside_callback(
+            ClientsideFunction(namespace="dashboard", function_name="update_dashboard"),
+            dashboard_outputs[:3] + [Output("results_table", "data"), Output("stored_data", "data")],
+            dashboard_inputs,
+            [State("stored_data", "data"), State("dataset_store", "data")],
         )
+    else:
+        # the table's page comes with the dashboard, so a slider or dropdown
+        # change is one request
+        @app.callback(
+            dashboard_outputs + table_outputs,
+            dashboard_inputs + [Input("area_dropdown", "value")],
+            [State("stored_data", "data")] + table_state,
+        )
+        def update_dashboard_callback(selected_indicator, year_range, area, stored_data, *table):
+            # a new indicator or area (or the first call) needs whole figures,
+            # a slider drag on its own gets patches
+            range_only = set(callback_context.triggered_prop_ids) == {"year_range_slider.value"}
+            check_area(area)
+            return update_dashboard(selected_indicator, year_range, stored_data, range_only, area, *table)
+
+        # the year bounds (and through them the slider) of the chosen area
+        app.callback(
+            Output("year_bounds", "data"),
+            Output("region_dropdown", "options"),
+            Output("region_dropdown", "value"),
+            Output("region_year_slider", "min"),
+            Output("region_year_slider", "max"),
+            Output("region_year_slider", "marks"),
+            Output("region_year_slider", "value"),
+            Output("area_title", "children"),
+            Input("area_dropdown", "value"),
+            prevent_initial_call=True,
+        )(update_area)
+
+        # only paging, sorting and filtering, new rows come with update_dashboard
+        @app.callback(
+            Output("results_table", "data", allow_duplicate=True),
+            Output("results_table", "page_count", allow_duplicate=True),
+            Input("results_table", "page_current"),
+            Input("results_table", "page_size"),
+            Input("results_table", "sort_by"),
+            Input("results_table", "filter_query"),
+            State("stored_data", "data"),
+            prevent_initial_call=True,
+        )
+        def update_results_table_callback(page_current, page_size, sort_by, filter_query, stored_data):
+            return update_results_table(stored_data, page_current, page_size, sort_by, filter_query)
+
+    # download links for the selected indicator and the regional history
+    app.clientside_callback(
+        ClientsideFunction(namespace="dashboard", function_name="export_links"),
+        Output("export_indicator_csv", "href"),
+        Output("export_indicator_parquet", "href"),
+        Output("export_regions_csv", "href"),
+        Output("export_regions_parquet", "href"),
+        Input("indicator_dropdown", "value"),
+        Input("year_range_slider", "value"),
+        Input("region_frequency", "value"),
+        Input("area_dropdown", "value"),
     )
 
-    indicator_ranges = {
-        "Median Housing Price": {"yaxis2": {"range": [350000, 650000], "tickprefix": "$"}},
-        "Unemployment Rate": {"yaxis2": {"range": [3.0, 9.0], "ticksuffix": "%"}},
-        "Average Gas Price": {"yaxis2": {"range": [2.00, 4.50], "tickprefix": "$", "tickformat": ".2f"}},
-    }
-
-    indicator_range = indicator_ranges[selected_indicator]
-
-    print(f"selected_indicator: {selected_indicator}")
-    print(f"indicator_range: {indicator_range}")
-
-    fig.update_layout(
-        title=f"Median Household Income vs. {selected_indicator} Trends ({year_range[0]} - {year_range[1]})",
-        template="none",
-        showlegend=True,
-        legend=dict(
-            x=0.5,
-            y=1.1,
-            xanchor="right",
-            yanchor="top",
-            orientation="h",
-        ),
-        height=400,
-        margin=dict(l=80, r=90, t=80, b=55),
-        yaxis=dict(
-            title="Median Household Income ($)",
-            tickprefix="$",
-            range=[75000, 87000],
-            title_standoff=10,
-        ),
-        hoverlabel=dict(
-            bgcolor="white",
-            font_size=12,
-            font_family="Arial",
-            align="left",
-            namelength=-1
-        ),
-        yaxis2=dict(
-            title=f"{selected_indicator}",
-            overlaying="y",
-            side="right",
-            fixedrange=True,
-            title_standoff=15,
-            range=indicator_range['yaxis2']['range'],
-            tickprefix=indicator_range['yaxis2'].get('tickprefix', ''),
-            ticksuffix=indicator_range['yaxis2'].get('ticksuffix', ''),
-            tickformat=indicator_range['yaxis2'].get('tickformat', ''),
-        ),
-        xaxis=dict(title="Years", fixedrange=True, dtick=1),
-        plot_bgcolor=COLORS["background"]
+    @instrumented
+    def update_gas_weekly_graph(relayout_data, area=None, reset_zoom=False):
+        check_area(area)
+        if reset_zoom or not relayout_data:
+            return state.gas_weekly_graph(area=area)
+        if relayout_data.get("xaxis.autorange"):
+            return state.gas_weekly_graph(area=area)
+
+        x_range = relayout_data.get("xaxis.range")
+        if "xaxis.range[0]" in relayout_data:
+            x_range = [relayout_data["xaxis.range[0]"], relayout_data.get("xaxis.range[1]")]
+        if x_range and (not isinstance(x_range, list) or len(x_range) != 2):
+            raise PreventUpdate
+        if not x_range or None in x_range:
+            # hover, autosize or y-axis only changes, nothing to resample
+            return no_update
+        try:
+            x_range = tuple(parse_plotly_date(value) for value in x_range)
+        except ValueError:
+            # nothing plotly sends, leave the chart as it is
+            raise PreventUpdate
+
+        return state.gas_weekly_graph(x_range, area)
+
+    @app.callback(
+        Output("gas_weekly_chart", "figure"),
+        Input("gas_weekly_chart", "relayoutData"),
+        Input("area_dropdown", "value"),
     )
+    def update_gas_weekly_graph_callback(relayout_data, area):
+        # a new area starts zoomed out
+        reset_zoom = "area_dropdown.value" in callback_context.triggered_prop_ids
+        return update_gas_weekly_graph(relayout_data, area, reset_zoom)
+
+    @instrumented
+    def update_regional_graphs(regions, frequency, year_range, area=None, progress=None):
+        check_area(area)
+        return state.regional_graphs(regions or [], frequency, year_range, area, progress)
+
+    regional_outputs = [
+        Output("regional_trend_chart", "figure"),
+        Output("regional_spread_chart", "figure"),
+    ]
+    regional_inputs = [
+        Input("region_dropdown", "value"),
+        Input("region_frequency", "value"),
+        Input("region_year_slider", "value"),
+        Input("area_dropdown", "value"),
+    ]
 
-    return fig
+    if state.background_cache is None:
+        app.callback(*regional_outputs, *regional_inputs)(update_regional_graphs)
+    else:
+        # cached figures are sent right away from the request. only a miss
+        # goes to regional_job and from there to a background job, since
+        # starting one forks a process and has the browser poll for it
+        from dash import DiskcacheManager
+        import layout
+
+        @app.callback(
+            *regional_outputs,
+            Output("regional_job", "data"),
+            Output("regional_served", "data"),
+            *regional_inputs,
+        )
+        @instrumented
+        def serve_regional_graphs(regions, frequency, year_range, area=None):
+            check_area(area)
+            cached = state.cached_regional_graphs(regions or [], frequency, year_range, area)
+            if cached is None:
+                job = {"regions": regions or [], "frequency": frequency, "year_range": year_range, "area": area}
+                return no_update, no_update, job, no_update
+            # regional_served cancels a job still building older figures
+            return cached[0], cached[1], no_update, time.time()
+
+        dimmed = [
+            (Output(chart, "style"), {"opacity": 0.5}, {"opacity": 1})
+            for chart in ("regional_trend_chart", "regional_spread_chart")
+        ]
 
+        # dash-renderer also sends the job it is still waiting for with the
+        # next request of this callback and dash kills it, so dragging the
+        # slider only keeps the newest build running
+        @app.callback(
+            Output("regional_trend_chart", "figure", allow_duplicate=True),
+            Output("regional_spread_chart", "figure", allow_duplicate=True),
+            Input("regional_job", "data"),
+            background=True,
+            manager=DiskcacheManager(state.background_cache),
+            interval=state.config["background_interval"],
+            progress=Output("regions_title", "children"),
+            progress_default=layout.regions_title(),
+            running=dimmed,
+            cancel=[Input("regional_served", "data")],
+            prevent_initial_call=True,
+        )
+        def update_regional_graphs_background(set_progress, job):
+            # runs in the job process, on the state it was forked with
+            def progress(done, total):
+                set_progress(layout.regions_title(done, total))
+            try:
+                return update_regional_graphs(
+                    job["regions"], job["frequency"], job["year_range"], job["area"], progress
+                )
+            finally:
+                last = metrics.last_request()
+                if last is not None and state.config["metrics_enabled"]:
+                    # expires like the results, in case /metrics is never scraped
+                    state.background_cache.push(
+                        last[:2], prefix=JOB_METRICS_PREFIX, expire=state.config["background_cache_expire"]
+                    )
+
+    # the plain functions, for calling outside of a request (bench.py)
+    return {
+        "update_dashboard": update_dashboard,
+        "update_results_table": update_results_table,
+        "update_area": update_area,
+        "update_gas_weekly_graph": update_gas_weekly_graph,
+        "update_regional_graphs": update_regional_graphs,
+    }
 
-@app.callback(
-    [
-        Output("bar_graph", "figure"),
-        Output("change_statement", "children")
-    ],
-    [
-        Input("indicator_dropdown", "value"),
-        Input("year_range_slider", "value")
-    ]
-)
-def update_bar_graph(selected_indicator, year_range):
-    df_filtered = df[(df["Year"] >= year_range[0]) & (df["Year"] <= year_range[1])]
-
-    start_value = df_filtered[df_filtered["Year"] == year_range[0]][selected_indicator].iloc[0]
-    end_value = df_filtered[df_filtered["Year"] == year_range[1]][selected_indicator].iloc[0]
-
-    fig = make_bar_graph(df, selected_indicator, year_range)
-
-    change = end_value - start_value
-    change_direction = "increased" if change > 0 else "decreased"
-    change_value = abs(change)
-
-    change_statement = (
-        f"From {year_range[0]} to {year_range[1]}, {selected_indicator.lower()} {change_direction} by ${change_value:,.0f}."
-        if selected_indicator == "Median Housing Price"
-        else f"From {year_range[0]} to {year_range[1]}, {selected_indicator.lower()} {change_direction} by {change_value:.1f}%."
-        if selected_indicator == "Unemployment Rate"
-        else f"From {year_range[0]} to {year_range[1]}, {selected_indicator.lower()} {change_direction} by ${change_value:,.2f}."
-        if selected_indicator == "Average Gas Price"
-        else f"From {year_range[0]} to {year_range[1]}, {selected_indicator.lower()} {change_direction} by ${change_value:,.2f}."
-    )
 
-    return fig, change_statement
+def register_metrics(app, state):
+    import flask
+
+    server = app.server
+
+    @server.route(state.config["metrics_path"])
+    def serve_metrics():
+        state.collect_job_metrics()
+        return flask.Response(state.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @server.before_request
+    def start_request_timer():
+        flask.g.request_start = time.perf_counter()
+
+    @server.after_request
+    def record_callback_response(response):
+        if not flask.request.path.endswith("_dash-update-component"):
+            return response
+        last = metrics.last_request()
+        if last is None:
+            return response
+
+        callback, stages, finished = last
+        now = time.perf_counter()
+        # after the callback returned dash checks and encodes its outputs to
+        # json, then register_compression() compresses them
+        compress = flask.g.pop("compress_seconds", 0.0)
+        timings = [("serialize", now - finished - compress)]
+        if compress:
+            timings.append(("compress", compress))
+        timings.append(("request", now - flask.g.request_start))
+        for stage, seconds in timings:
+            stages.append((stage, seconds))
+            state.metrics.observe_duration(callback, stage, seconds)
+        if not response.direct_passthrough:
+            state.metrics.observe_payload(callback, response.calculate_content_length() or 0)
+
+        if state.config["metrics_debug_header"]:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages
+            )
+            response.headers["X-Dash-Callback"] = callback
+        return response
+
+
+def register_export(app, state):
+    # /export/indicator.<format>?indicator=...&start=...&end=...
+    # /export/gas_regions.<format>?frequency=...
+    # both take an area=... too, New York by default
+    import flask
+    import export
+
+    @app.server.route(f"{export.EXPORT_PATH}/<name>.<file_format>")
+    def serve_export(name, file_format):
+        if file_format not in export.formats():
+            flask.abort(404)
+        args = flask.request.args
+        # the dataset of this moment, a refresh while streaming doesn't change it
+        area = args.get("area") or None
+        try:
+            dataset = state.area_dataset(area)
+        except KeyError:
+            flask.abort(404)
+
+        if name == "indicator":
+            selected_indicator = args.get("indicator", "")
+            if selected_indicator not in dataset.indicator_years:
+                flask.abort(404)
+            first, last = dataset.indicator_years[selected_indicator]
+            try:
+                year_range = [int(args.get("start", first)), int(args.get("end", last))]
+            except ValueError:
+                flask.abort(400)
+            columns, filename = export.indicator_columns(dataset, selected_indicator, year_range)
+        elif name == "gas_regions":
+            frequency = args.get("frequency", "weekly")
+            if frequency not in dataset.regional_gas:
+                flask.abort(404)
+            columns, filename = export.regional_columns(dataset, frequency)
+        else:
+            flask.abort(404)
+
+        if area is not None:
+            filename = f"{area}_{filename}"
+        chunks = export.encode(columns, file_format, state.config["export_chunk_rows"])
+        return flask.Response(
+            flask.stream_with_context(chunks),
+            mimetype=export.MIMETYPES[file_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}.{file_format}"'},
+        )
 
 
-@app.callback(
-    Output("results_table", "data"),
-    Output("stored_data", "data"),
-    [Input("year_range_slider", "value"),
-     Input("indicator_dropdown", "value")],
-    [State("stored_data", "data")]
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/html",
+    "text/css",
+    "text/plain",
 )
-def update_results_table(selected_range, selected_indicator, stored_data):
-    min_year, max_year = selected_range
-    df_filtered = df[(df["Year"] >= min_year) & (df["Year"] <= max_year)]
-
-    start_value = df_filtered[df_filtered["Year"] == min_year][selected_indicator].values[0]
-    end_value = df_filtered[df_filtered["Year"] == max_year][selected_indicator].values[0]
-
-    change_value = end_value - start_value
-
-    new_data = df_filtered.to_dict("records")
-
-    for row in new_data:
-        # format Change column based on selected indicator
-        if selected_indicator == "Median Housing Price":
-            row["Change"] = f"${change_value:,.0f}"
-        elif selected_indicator == "Average Gas Price":
-            row["Change"] = f"${change_value:,.2f}"
-        elif selected_indicator == "Unemployment Rate":
-            row["Change"] = f"{change_value:.1f}%"
-            row["Unemployment Rate"] = f"{row['Unemployment Rate']:.1f}%"
-        else:
-            row["Change"] = f"{change_value:,.2f}"
 
-        # always format Unemployment Rate as percentage, even if not the current indicator
-        if row["Unemployment Rate"] and selected_indicator != "Unemployment Rate":
-            row["Unemployment Rate"] = f"{row['Unemployment Rate']:.1f}%"
 
-    if stored_data is None:
-        stored_data = []
-
-    combined_data = new_data + stored_data
+def register_compression(app, min_size):
+    # gzip, or brotli when the brotli package is installed and the browser
+    # accepts it. the big dash/plotly javascript bundles are compressed once
+    # and kept, everything else (mostly callback json) per response
+    import gzip
+    import flask
+
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    bundles = {}
+
+    @app.server.after_request
+    def compress_response(response):
+        if (
+            response.direct_passthrough
+            or response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+        ):
+            return response
+
+        accept = flask.request.headers.get("Accept-Encoding", "")
+        if brotli is not None and "br" in accept:
+            encoding = "br"
+        elif "gzip" in accept:
+            encoding = "gzip"
+        else:
+            return response
 
-    return combined_data, combined_data
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
 
-if __name__ == '__main__':
-    app.run(debug=True)
+        start = time.perf_counter()
+        bundle = "_dash-component-suites" in flask.request.path
+        key = (flask.request.full_path, encoding)
+        if bundle and key in bundles:
+            data = bundles[key]
+        else:
+            if encoding == "br":
+                data = brotli.compress(data, quality=5)
+            else:
+                data = gzip.compress(data, compresslevel=6)
+            if bundle:
+                bundles[key] = data
+
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        # a stage of the callback's metrics, see register_metrics()
+        flask.g.compress_seconds = time.perf_counter() - start
+        return response
+
+
+def register_refresh(app, state, interval):
+    # every worker process polls on its own thread. it is started by the first
+    # request rather than here, because threads don't survive the fork of a
+    # preloading server like gunicorn
+    threads = {}
+    lock = threading.Lock()
+
+    def poll():
+        while True:
+            time.sleep(interval)
+            try:
+                state.refresh()
+            except Exception:
+                app.logger.exception("refreshing the data failed")
+
+    @app.server.before_request
+    def start_refresh_thread():
+        pid = os.getpid()
+        if pid in threads:
+            return
+        with lock:
+            if pid not in threads:
+                threads[pid] = threading.Thread(target=poll, name="refresh", daemon=True)
+                threads[pid].start()
+
+
+def parse_plotly_date(value):
+    # plotly sends axis ranges as "2019-03-01 12:34:56.789", ValueError for
+    # anything else
+    import numpy as np
+    date = np.datetime64(str(value).strip().replace(" ", "T"))
+    if np.isnat(date):
+        raise ValueError(f"not a date: {value!r}")
+    return date
 
 
 
+"""
+==========================================================================
+App Factory
+"""
 
+def create_app(config=None):
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    timer = StartupTimer()
+
+    with timer.stage("import dash"):
+        from dash import Dash
+        import dash_bootstrap_components as dbc
+
+    with timer.stage("create app"):
+        app = Dash(
+            __name__,
+            external_stylesheets=[dbc.themes.MINTY, dbc.icons.FONT_AWESOME],
+            # the layout is a function that loads the data on first call, and
+            # dash would otherwise call it right away to validate callback ids
+            suppress_callback_exceptions=True,
+        )
+        state = DashboardState(config, timer)
+        app.dashboard = state
+        app.layout = state.layout
+        state.callbacks = register_callbacks(app, state)
+        if config["metrics_enabled"]:
+            register_metrics(app, state)
+        if config["export_enabled"]:
+            register_export(app, state)
+        if config["compress"]:
+            # after_request hooks run last registered first, so metrics sees
+            # the compressed size
+            register_compression(app, config["compress_min_size"])
+        app.server.config["SEND_FILE_MAX_AGE_DEFAULT"] = config["static_max_age"]
+        if config["refresh_interval"]:
+            register_refresh(app, state, config["refresh_interval"])
+
+    if config["warm_up"]:
+        warm_up(app)
+
+    return app
+
+
+def warm_up(app):
+    # do the lazy work now instead of on the first request
+    state = app.dashboard
+    state.layout()
+    # opens the shared history, so a missing diskcache stops the server here
+    state.history
+    if state.config["figure_cache_warm"]:
+        with state.timer.stage("warm figure cache"):
+            state.warm_figure_cache()
+    return state.timer.report()
 
 
+if __name__ == '__main__':
+    # development server. for production run gunicorn, see gunicorn.conf.py
+    app = create_app(dict(config_from_env(), warm_up=True))
+    config = app.dashboard.config
+    print(app.dashboard.timer.report())
+    app.run(debug=config["debug"], host=config["host"], port=config["port"])
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+The states and metro areas the dashboard can show. New York is built from the
+files in REGISTRY. Every other area is a folder under AREAS_DIR holding its own
+csv files and an area.json naming the file and FRED series of each indicator:
+
+    areas/CA/area.json
+    {"name": "California", "sources": {
+        "income": {"file": "income.csv", "series_id": "MEHOINUSCAA672N"},
+        "housing": {"file": "housing.csv", "series_id": "MEDLISPRICA"},
+        "unemployment": {"file": "unemployment.csv", "series_id": "CAUR"},
+        "gas_price": {"file": "gas.csv", "series_id": "California State Average ($/gal)"}}}
+
+A source can also have a "download": [base url name, path] telling fetch.py
+where to get it (see indicators.FRED_DOWNLOAD). FRED series don't need one.
+
+Only the area.json files are read to list the areas, an area's data is loaded
+when it is first selected (see data.DatasetCache). Standard library only.
+"""
+import json
+import os
+import re
+
+import indicators
+
+
+AREAS_DIR = "areas"
+AREA_FILE = "area.json"
+DEFAULT_AREA = "NY"
+DEFAULT_NAME = "New York"
+# area keys are folder names, nothing else is looked up
+AREA_KEY = re.compile(r"[A-Za-z0-9_-]+")
+
+
+class Area:
+    # one state or metro area. sources are the REGISTRY indicators with file
+    # and series_id pointing at the area's own files
+    def __init__(self, key, name, sources):
+        self.key = key
+        self.name = name
+        self.sources = sources
+
+    def files(self):
+        return {source.key: source.file for source in self.sources}
+
+    def source(self, key):
+        for source in self.sources:
+            if source.key == key:
+                return source
+        raise KeyError(key)
+
+
+def default_area():
+    return Area(DEFAULT_AREA, DEFAULT_NAME, list(indicators.REGISTRY))
+
+
+def read_spec(key, directory=AREAS_DIR):
+    with open(os.path.join(directory, key, AREA_FILE)) as f:
+        return json.load(f)
+
+
+def find(key, directory=AREAS_DIR):
+    # the Area for key, KeyError if there is no such area
+    if key == DEFAULT_AREA:
+        return default_area()
+    if not AREA_KEY.fullmatch(key or ""):
+        raise KeyError(key)
+    try:
+        spec = read_spec(key, directory)
+    except (OSError, ValueError):
+        raise KeyError(key)
+
+    folder = os.path.join(directory, key)
+    sources = []
+    for indicator in indicators.REGISTRY:
+        source = spec.get("sources", {}).get(indicator.key)
+        if source is None:
+            raise ValueError(f"{key}: no source for {indicator.key}")
+        download = source.get("download")
+        if download is None and indicator.download == indicators.FRED_DOWNLOAD:
+            download = indicators.FRED_DOWNLOAD
+        sources.append(indicator.with_source(
+            os.path.join(folder, source["file"]), source["series_id"], download and tuple(download)
+        ))
+    return Area(key, spec.get("name", key), sources)
+
+
+def catalog(directory=AREAS_DIR):
+    # {area key: name}, New York first and the others by name
+    names = {}
+    try:
+        keys = sorted(os.listdir(directory))
+    except OSError:
+        keys = []
+    for key in keys:
+        if key == DEFAULT_AREA or not AREA_KEY.fullmatch(key):
+            continue
+        try:
+            names[key] = read_spec(key, directory).get("name", key)
+        except (OSError, ValueError):
+            continue
+    ordered = {DEFAULT_AREA: DEFAULT_NAME}
+    ordered.update(sorted(names.items(), key=lambda item: item[1]))
+    return ordered
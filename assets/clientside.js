@@ -0,0 +1,317 @@
+// Browser-side version of update_dashboard, used when CLIENTSIDE_MODE is on.
+// The dataset_store holds the yearly dataframe as columns, the indicator
+// formats and figure templates built by the Python figure functions, so the
+// output here matches the server callback. year_bounds (used in both modes)
+// fits the year slider to the selected indicator.
+
+(function () {
+    function toFixed(value, decimals) {
+        // python's format(value, ".Nf"): toFixed rounds exact halves up, python
+        // rounds them to even
+        var sign = value < 0 || Object.is(value, -0) ? "-" : "";
+        var magnitude = Math.abs(value);
+        var text = magnitude.toFixed(decimals);
+        var longer = magnitude.toFixed(decimals + 1);
+        var half = longer.slice(-1) === "5" && magnitude.toFixed(decimals + 30) === longer + "0".repeat(29);
+        if (half) {
+            var truncated = longer.slice(0, decimals ? -1 : -2);
+            if (Number(truncated.slice(-1)) % 2 === 0) {
+                text = truncated;
+            }
+        }
+        return sign + text;
+    }
+
+    function formatNumber(value, decimals) {
+        // python's format(value, ",.Nf")
+        var parts = toFixed(value, decimals).split(".");
+        parts[0] = parts[0].replace(/\B(?=(\d{3})+(?!\d))/g, ",");
+        return parts.join(".");
+    }
+
+    function formatValue(indicator, value) {
+        // same as indicators.Indicator.format()
+        return indicator.prefix + formatNumber(value, indicator.decimals) + indicator.suffix;
+    }
+
+    function fitRange(range, values) {
+        // same as figures.fit_range()
+        if (range === null) {
+            return null;
+        }
+        var lo = range[0];
+        var hi = range[1];
+        values.forEach(function (value) {
+            if (value !== null) {
+                lo = Math.min(lo, value);
+                hi = Math.max(hi, value);
+            }
+        });
+        return [lo, hi];
+    }
+
+    function prefixSum(values) {
+        var sums = [0];
+        var total = 0;
+        values.forEach(function (value) {
+            total += value;
+            sums.push(total);
+        });
+        return sums;
+    }
+
+    function firstValue(values) {
+        var valid = values.filter(function (value) { return value !== null; });
+        return valid.length ? valid[0] : 0;
+    }
+
+    function centered(squares, total, count) {
+        var value = squares - total * total / count;
+        return value > squares * 1e-12 ? value : 0;
+    }
+
+    function sparseTable(values, combine) {
+        // levels[k][i] = combine over values[i:i + 2**k], null ignored
+        var levels = [values];
+        var width = 1;
+        while (2 * width <= values.length) {
+            var previous = levels[levels.length - 1];
+            levels.push(previous.slice(width).map(function (value, i) { return combine(previous[i], value); }));
+            width *= 2;
+        }
+        return levels;
+    }
+
+    function sparseQuery(levels, lo, hi, combine) {
+        // combine over values[lo:hi] from two overlapping power of two blocks
+        var k = Math.floor(Math.log2(hi - lo));
+        var level = levels[k];
+        return combine(level[lo], level[hi - Math.pow(2, k)]);
+    }
+
+    function skipNull(combine) {
+        return function (a, b) { return a === null ? b : b === null ? a : combine(a, b); };
+    }
+
+    var lower = skipNull(Math.min);
+    var upper = skipNull(Math.max);
+
+    var rangeStatsCache = {dataset: null, stats: null};
+
+    function rangeStats(dataset) {
+        // same prefix sums and sparse tables as data.RangeStats, built once per dataset
+        if (rangeStatsCache.dataset === dataset) {
+            return rangeStatsCache.stats;
+        }
+        var columns = dataset.columns;
+        var x = columns[dataset.base];
+        var xShift = firstValue(x);
+        var stats = {};
+        Object.keys(dataset.indicators).forEach(function (name) {
+            var y = columns[name];
+            var shift = firstValue(y);
+            var valid = y.map(function (value) { return value !== null; });
+            var d = y.map(function (value, i) { return valid[i] ? value - shift : 0; });
+            var both = y.map(function (value, i) { return valid[i] && x[i] !== null; });
+            var dx = x.map(function (value, i) { return both[i] ? value - xShift : 0; });
+            var dy = d.map(function (value, i) { return both[i] ? value : 0; });
+            var product = function (a, b) { return a.map(function (value, i) { return value * b[i]; }); };
+            stats[name] = {
+                shift: shift,
+                sums: [prefixSum(valid.map(Number)), prefixSum(d), prefixSum(product(d, d))],
+                minimum: sparseTable(y, lower),
+                maximum: sparseTable(y, upper),
+                pairs: [
+                    prefixSum(both.map(Number)), prefixSum(dx), prefixSum(dy),
+                    prefixSum(product(dx, dx)), prefixSum(product(dy, dy)), prefixSum(product(dx, dy)),
+                ],
+            };
+        });
+        rangeStatsCache = {dataset: dataset, stats: stats};
+        return stats;
+    }
+
+    function queryStats(dataset, name, lo, hi) {
+        // same as data.RangeStats.query(), lo and hi are row positions
+        var column = dataset.columns[name];
+        var years = dataset.columns["Year"];
+        var engine = rangeStats(dataset)[name];
+        var diff = function (values) { return values[hi] - values[lo]; };
+        var stats = {
+            count: diff(engine.sums[0]), mean: NaN, variance: NaN, std: NaN, min: NaN, max: NaN,
+            cagr: NaN, covariance: NaN, correlation: NaN,
+        };
+        var total = diff(engine.sums[1]);
+        if (stats.count) {
+            stats.mean = engine.shift + total / stats.count;
+            stats.min = sparseQuery(engine.minimum, lo, hi, lower);
+            stats.max = sparseQuery(engine.maximum, lo, hi, upper);
+        }
+        if (stats.count > 1) {
+            stats.variance = centered(diff(engine.sums[2]), total, stats.count) / (stats.count - 1);
+            stats.std = Math.sqrt(stats.variance);
+        }
+        var first = column[lo];
+        var last = column[hi - 1];
+        var span = years[hi - 1] - years[lo];
+        if (span > 0 && first !== null && first > 0 && last !== null) {
+            stats.cagr = Math.pow(last / first, 1 / span) - 1;
+        }
+        var sums = engine.pairs.map(diff);
+        var n = sums[0];
+        if (n > 1) {
+            var products = sums[5] - sums[1] * sums[2] / n;
+            stats.covariance = products / (n - 1);
+            var spread = centered(sums[3], sums[1], n) * centered(sums[4], sums[2], n);
+            if (spread > 0) {
+                stats.correlation = Math.min(Math.max(products / Math.sqrt(spread), -1), 1);
+            }
+        }
+        return stats;
+    }
+
+    function changeStatement(selectedIndicator, yearRange, startValue, endValue, indicator, stats, base) {
+        // same as figures.make_change_statement()
+        var change = endValue - startValue;
+        var direction = change > 0 ? "increased" : "decreased";
+        var statement = "From " + yearRange[0] + " to " + yearRange[1] + ", " +
+            selectedIndicator.toLowerCase() + " " + direction + " by " +
+            formatValue(indicator, Math.abs(change)) + ".";
+        if (stats.count < 2) {
+            return statement;
+        }
+        statement += " Over these years it averaged " + formatValue(indicator, stats.mean) +
+            " (standard deviation " + formatValue(indicator, stats.std) + ")," +
+            " ranging from " + formatValue(indicator, stats.min) + " to " + formatValue(indicator, stats.max);
+        if (!isNaN(stats.cagr)) {
+            statement += ", a compound annual growth rate of " + toFixed(stats.cagr * 100, 1) + "%";
+        }
+        statement += ".";
+        if (!isNaN(stats.correlation)) {
+            statement += " Its correlation with " + base.toLowerCase() + " was " + toFixed(stats.correlation, 2) +
+                " (covariance " + formatNumber(stats.covariance, 2) + ").";
+        }
+        return statement;
+    }
+
+    function orNull(value) {
+        return isNaN(value) ? null : value;
+    }
+
+    function tableRows(columns, i0, i1, selectedIndicator, indicators, changeValue, stats) {
+        var names = Object.keys(columns);
+        var change = formatValue(indicators[selectedIndicator], changeValue);
+        var average = isNaN(stats.mean) ? null : formatValue(indicators[selectedIndicator], stats.mean);
+        var rows = [];
+        for (var i = i0; i <= i1; i++) {
+            var row = {};
+            names.forEach(function (name) {
+                row[name] = columns[name][i];
+            });
+            row["Change"] = change;
+            row["Average"] = average;
+            row["CAGR"] = orNull(stats.cagr);
+            row["Correlation"] = orNull(stats.correlation);
+            rows.push(row);
+        }
+        return rows;
+    }
+
+    function clampYears(bounds, yearRange) {
+        // same as data.Dataset.clamp_years()
+        if (yearRange[1] < bounds.min || yearRange[0] > bounds.max) {
+            return [bounds.min, bounds.max];
+        }
+        var start = Math.min(Math.max(yearRange[0], bounds.min), bounds.max);
+        var end = Math.max(Math.min(yearRange[1], bounds.max), start);
+        return [start, end];
+    }
+
+    function yearBounds(selectedIndicator, bounds, yearRange) {
+        var b = bounds[selectedIndicator];
+        return [b.min, b.max, b.marks, clampYears(b, yearRange || [b.min, b.max])];
+    }
+
+    function yearStep(first, last) {
+        // same as indicators.year_step()
+        var years = last - first;
+        return years < 16 ? 1 : years < 30 ? 2 : 5;
+    }
+
+    function copy(value) {
+        return JSON.parse(JSON.stringify(value));
+    }
+
+    function updateDashboard(selectedIndicator, yearRange, storedData, dataset) {
+        var columns = dataset.columns;
+        var years = columns["Year"];
+        var base = dataset.base;
+        var indicator = dataset.indicators[selectedIndicator];
+        var i0 = years.indexOf(yearRange[0]);
+        var i1 = years.indexOf(yearRange[1]);
+
+        var startValue = columns[selectedIndicator][i0];
+        var endValue = columns[selectedIndicator][i1];
+        var x = years.slice(i0, i1 + 1);
+        var baseValues = columns[base].slice(i0, i1 + 1);
+        var values = columns[selectedIndicator].slice(i0, i1 + 1);
+
+        var template = dataset.templates[selectedIndicator];
+
+        var lineFig = copy(template.line);
+        lineFig.data[0].x = x;
+        lineFig.data[0].y = baseValues;
+        lineFig.data[1].x = x;
+        lineFig.data[1].y = values;
+        lineFig.layout.title.text = base + " vs. " + selectedIndicator +
+            " Trends (" + yearRange[0] + " - " + yearRange[1] + ")";
+        lineFig.layout.xaxis.dtick = yearStep(yearRange[0], yearRange[1]);
+        lineFig.layout.yaxis.range = fitRange(dataset.indicators[base].line_range, baseValues);
+        lineFig.layout.yaxis2.range = fitRange(indicator.line_range, values);
+
+        var barFig = copy(template.bar);
+        barFig.data[0].x = [String(yearRange[0]), String(yearRange[1])];
+        barFig.data[0].y = [
+            i0 === -1 ? null : startValue,
+            i1 === -1 ? null : endValue,
+        ];
+        barFig.layout.title.text = selectedIndicator + " at " + yearRange[0] + " vs. " + yearRange[1];
+        barFig.layout.xaxis.tickvals = [yearRange[0], yearRange[1]];
+        barFig.layout.yaxis.range = fitRange(indicator.bar_range, barFig.data[0].y);
+
+        var stats = queryStats(dataset, selectedIndicator, i0, i1 + 1);
+        var newData = tableRows(columns, i0, i1, selectedIndicator, dataset.indicators, endValue - startValue, stats);
+        var combinedData = newData.concat(Array.isArray(storedData) ? storedData : []).slice(0, dataset.history_max_rows);
+
+        return [
+            lineFig,
+            barFig,
+            changeStatement(selectedIndicator, yearRange, startValue, endValue, indicator, stats, base),
+            combinedData,
+            combinedData,
+        ];
+    }
+
+    function exportLinks(selectedIndicator, yearRange, frequency, area) {
+        // urls of the export route (export.EXPORT_PATH), the server clamps
+        // the years like the dashboard does
+        var where = area ? "&area=" + encodeURIComponent(area) : "";
+        var indicator = "?indicator=" + encodeURIComponent(selectedIndicator) +
+            "&start=" + yearRange[0] + "&end=" + yearRange[1] + where;
+        var regions = "?frequency=" + encodeURIComponent(frequency) + where;
+        return [
+            "/export/indicator.csv" + indicator,
+            "/export/indicator.parquet" + indicator,
+            "/export/gas_regions.csv" + regions,
+            "/export/gas_regions.parquet" + regions,
+        ];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dashboard: {
+            update_dashboard: updateDashboard,
+            year_bounds: yearBounds,
+            export_links: exportLinks,
+        },
+    });
+})();
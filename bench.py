@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for startup, data loading and the dashboard callbacks.
+
+    python bench.py                               # run, write bench_results.json
+    python bench.py --scales 1,10,100,1000        # also on synthetic data this much larger
+    python bench.py --compare old.json            # exit 1 if anything got slower
+
+Timings are the median of several runs in milliseconds. Results are written as
+JSON so runs from different commits can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import app_test
+
+
+def timed(fn, repeat=5, setup=None):
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(runs),
+        "min_ms": min(runs),
+        "max_ms": max(runs),
+        "runs": repeat,
+    }
+
+
+def payload_bytes(value):
+    # size of the value as dash would send it
+    import plotly.io.json
+    return len(plotly.io.json.to_json_plotly(value))
+
+
+
+"""
+==========================================================================
+Startup
+"""
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app_test
+imported = time.perf_counter() - start
+app = app_test.create_app({"warm_up": True, "ingest_cache_enabled": %(cache)s})
+stages = dict(app.dashboard.timer.stages)
+stages["import app_test"] = imported
+print(json.dumps(stages))
+"""
+
+
+def bench_startup(repeat):
+    # every run is a fresh interpreter so imports are really cold
+    results = {}
+    for cache in (False, True):
+        runs = []
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT % {"cache": cache}],
+                cwd=HERE, capture_output=True, text=True, check=True,
+            )
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        label = "startup (ingest cache)" if cache else "startup (no cache)"
+        for stage in runs[0]:
+            values = [run[stage] * 1000 for run in runs]
+            results[f"{label}: {stage}"] = {
+                "median_ms": statistics.median(values),
+                "min_ms": min(values),
+                "max_ms": max(values),
+                "runs": repeat,
+            }
+    return results
+
+
+
+"""
+==========================================================================
+Data Load
+"""
+
+def export_bytes(dataset, frequency):
+    # size of a streamed regional export, read to the end like a download
+    import export
+    columns, _ = export.regional_columns(dataset, frequency)
+    return sum(len(chunk) for chunk in export.encode(columns, "csv"))
+
+
+def fetch_series(server, copies, output, cache):
+    # every download copies times over from the stand-in server, like a
+    # refresh of that many series
+    import fetch
+    todo = []
+    for i in range(copies):
+        for download in fetch.downloads(["NY"], dict.fromkeys(fetch.BASE_URLS, server.url), os.path.join(output, str(i))):
+            download.url += f"&copy={i}"
+            todo.append(download)
+    return fetch.Fetcher(cache, rate=0).fetch_all(todo)
+
+
+def bench_fetch(repeat, copies=50):
+    import shutil
+    import tempfile
+    import fetch
+
+    routes = fetch.downloads(["NY"], dict.fromkeys(fetch.BASE_URLS, ""))
+    server = fetch.MockServer({
+        f"{download.url}&copy={i}": download.path for i in range(copies) for download in routes
+    }).start()
+    output = tempfile.mkdtemp()
+    cache = fetch.HttpCache(os.path.join(output, "http"))
+    name = f"fetch {copies * len(routes)} series (stand-in server"
+    try:
+        return {
+            f"{name}, cold)": timed(
+                lambda: fetch_series(server, copies, output, cache), repeat,
+                setup=lambda: shutil.rmtree(output, ignore_errors=True)),
+            f"{name}, 304s)": timed(lambda: fetch_series(server, copies, output, cache), repeat),
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(output, ignore_errors=True)
+
+
+def bench_data(repeat):
+    import data
+
+    frames = data.load_frames()
+    data.load_dataset(cache_enabled=True)  # make sure the ingest cache exists
+
+    # a new week on top of the gas file, the incremental refresh path
+    import io
+    import pandas as pd
+    dataset = data.Dataset(frames)
+    with open(data.ASSET_FILES[data.GAS_KEY], "rb") as f:
+        week = pd.read_csv(io.BytesIO(f.readline() + f.readline()))
+    week["Date"] = (pd.to_datetime(week["Date"]) + pd.Timedelta(days=7)).dt.strftime("%m/%d/%Y")
+
+    # switching areas, loaded from the ingest cache or already in memory
+    import areas
+    area_cache = data.DatasetCache(1, lambda key: data.load_dataset(area=areas.find(key)))
+
+    return {
+        "load_frames (csv)": timed(data.load_frames, repeat),
+        "load_dataset (ingest cache)": timed(lambda: data.load_dataset(cache_enabled=True), repeat),
+        "align": timed(lambda: data.align(frames), repeat),
+        "Dataset()": timed(lambda: data.Dataset(frames), repeat),
+        "RangeStats()": timed(lambda: data.RangeStats(dataset.repository, data.indicators.base().name), repeat),
+        "export csv (regional weekly)": timed(lambda: export_bytes(dataset, "weekly"), repeat),
+        "Dataset.updated (one new week)": timed(lambda: dataset.updated({data.GAS_KEY: week}), repeat),
+        "DatasetCache.get (miss)": timed(lambda: area_cache.get(areas.DEFAULT_AREA), repeat, setup=area_cache.clear),
+        "DatasetCache.get (hit)": timed(lambda: area_cache.get(areas.DEFAULT_AREA), repeat),
+    }
+
+
+
+"""
+==========================================================================
+Callbacks
+"""
+
+def make_history(rows, new_data):
+    # a long-lived client side stored_data, repeating rows from a real response
+    return (new_data * (rows // len(new_data) + 1))[:rows]
+
+
+def table_page(callbacks, stored, sort_by=(), filter_query=""):
+    sort_by = [{"column_id": column, "direction": direction} for column, direction in sort_by]
+    return callbacks["update_results_table"](stored, 0, 15, sort_by, filter_query)
+
+
+def bench_callbacks(state, repeat, label=""):
+    dataset = state.dataset
+    figures = state.figures
+    repository = dataset.repository
+    callbacks = state.callbacks
+    indicator = figures.INDICATORS[0]
+    first, last = dataset.indicator_years[indicator]
+    full = [first, last]
+    short = [last - 1, last]
+
+    results = {}
+    sizes = {}
+
+    for name, year_range in (("full range", full), ("two years", short)):
+        view = repository.slice(*year_range)
+        results[f"{label}build_line_graph ({name})"] = timed(
+            lambda: figures.build_line_graph(view, indicator, year_range), repeat)
+        results[f"{label}make_bar_graph ({name})"] = timed(
+            lambda: figures.make_bar_graph(repository, indicator, year_range), repeat)
+        stats = dataset.stats.query(indicator, *year_range)
+        results[f"{label}RangeStats.query ({name})"] = timed(
+            lambda: dataset.stats.query(indicator, *year_range), repeat)
+        results[f"{label}make_table ({name})"] = timed(
+            lambda: figures.make_table(view, indicator, 1.0, stats), repeat)
+        results[f"{label}build_dashboard ({name})"] = timed(
+            lambda: figures.build_dashboard(repository, dataset.stats, indicator, year_range), repeat)
+
+        # cache miss then cache hit, through the real callback
+        results[f"{label}update_dashboard miss ({name})"] = timed(
+            lambda: callbacks["update_dashboard"](indicator, year_range, None),
+            repeat, setup=state.figure_cache.clear)
+        results[f"{label}update_dashboard hit ({name})"] = timed(
+            lambda: callbacks["update_dashboard"](indicator, year_range, None), repeat)
+        results[f"{label}update_dashboard slider patch ({name})"] = timed(
+            lambda: callbacks["update_dashboard"](indicator, year_range, None, True), repeat)
+
+        line_fig, bar_fig, change_statement, _ = state.cached_dashboard(indicator, year_range)
+        sizes[f"{label}line figure ({name})"] = payload_bytes(line_fig)
+        sizes[f"{label}bar figure ({name})"] = payload_bytes(bar_fig)
+        line_patch, bar_patch = callbacks["update_dashboard"](indicator, year_range, None, True)[:2]
+        sizes[f"{label}line patch ({name})"] = payload_bytes(line_patch)
+        sizes[f"{label}bar patch ({name})"] = payload_bytes(bar_patch)
+
+    # worst case history: client mode with a long stored_data coming back in
+    import results as results_module
+    table = state.cached_dashboard(indicator, full)[3]
+    history = make_history(10000, results_module.to_rows(table, hidden=True))
+    config = state.config
+    mode = config["history_mode"]
+    config["history_mode"] = "client"
+    try:
+        results[f"{label}update_dashboard (client history, 10000 rows in)"] = timed(
+            lambda: callbacks["update_dashboard"](indicator, full, history), repeat)
+        response = callbacks["update_dashboard"](indicator, full, history)
+        sizes[f"{label}store (client history)"] = payload_bytes(response[3])
+        results[f"{label}update_results_table (client history, 10000 rows)"] = timed(
+            lambda: table_page(callbacks, history), repeat)
+    finally:
+        config["history_mode"] = mode
+
+    # server history, filled up to its cap. the first page, a multi column
+    # sort and a filter, each over a fresh history so nothing is reused
+    token = state.history.new_session()
+    stored = {"session": token}
+    for _ in range(config["history_max_rows"] // len(table["Year"]) + 1):
+        stored = callbacks["update_dashboard"](indicator, full, stored)[3]
+    results[f"{label}update_dashboard (server history, full)"] = timed(
+        lambda: callbacks["update_dashboard"](indicator, full, stored), repeat)
+    sort_by = [("Change", "desc"), ("Year", "asc")]
+    filter_query = "{Year} >= 2010 && {Change} contains $"
+    for name, args in (("first page", ()), ("sorted", (sort_by,)), ("filtered", ((), filter_query))):
+        results[f"{label}update_results_table (server history, {name})"] = timed(
+            lambda: table_page(callbacks, stored, *args), repeat,
+            setup=lambda: callbacks["update_dashboard"](indicator, full, stored))
+    sizes[f"{label}table page (server history)"] = payload_bytes(table_page(callbacks, stored))
+
+    # weekly gas chart and regional explorer
+    results[f"{label}update_gas_weekly_graph (full)"] = timed(
+        lambda: state.gas_weekly_graph(), repeat, setup=state.figure_cache.clear)
+    gas_fig = state.gas_weekly_graph()
+    sizes[f"{label}gas weekly figure"] = payload_bytes(gas_fig)
+
+    regions = dataset.regional_gas["weekly"].regions()
+    gas_range = [dataset.gas_min_year, dataset.gas_max_year]
+    for frequency in ("weekly", "yearly"):
+        results[f"{label}update_regional_graphs (all regions, {frequency})"] = timed(
+            lambda: callbacks["update_regional_graphs"](regions, frequency, gas_range), repeat)
+        trend_fig, spread_fig = callbacks["update_regional_graphs"](regions, frequency, gas_range)
+        sizes[f"{label}regional figures ({frequency})"] = payload_bytes(trend_fig) + payload_bytes(spread_fig)
+
+    return results, sizes
+
+
+
+"""
+==========================================================================
+Synthetic Scaling
+"""
+
+def scaled_frames(frames, scale):
+    # the real frames repeated `scale` times along the time axis. years and
+    # dates are shifted so every row stays unique and sorted
+    import pandas as pd
+    import data
+
+    df = pd.concat([frames["df"]] * scale, ignore_index=True)
+    df["Year"] = int(df["Year"].min()) + pd.RangeIndex(len(df))
+
+    gas = frames[data.GAS_KEY].sort_values("Date")
+    span = gas["Date"].max() - gas["Date"].min() + pd.Timedelta(days=7)
+    copies = []
+    for i in range(scale):
+        copy = gas.copy()
+        copy["Date"] = copy["Date"] + span * i
+        copy["Year"] = copy["Date"].dt.year
+        copies.append(copy)
+    gas = pd.concat(copies, ignore_index=True)
+
+    return dict(frames, **{"df": df, data.GAS_KEY: gas})
+
+
+def bench_scaling(state, scales, repeat):
+    import data
+
+    frames = data.load_frames()
+    results = {}
+    sizes = {}
+    for scale in scales:
+        scaled = scaled_frames(frames, scale)
+        label = f"x{scale} "
+        results[f"{label}Dataset()"] = timed(lambda: data.Dataset(scaled), max(1, repeat // 2))
+        state.use_dataset(data.Dataset(scaled))
+        scale_results, scale_sizes = bench_callbacks(state, repeat, label)
+        results.update(scale_results)
+        sizes.update(scale_sizes)
+    state.use_dataset(data.load_dataset())
+    return results, sizes
+
+
+
+"""
+==========================================================================
+Compare
+"""
+
+def compare(results, baseline, threshold):
+    # names whose median got slower by more than threshold (0.2 = 20%)
+    regressions = []
+    for name, result in results["timings"].items():
+        old = baseline.get("timings", {}).get(name)
+        if old is None or old["median_ms"] <= 0:
+            continue
+        change = result["median_ms"] / old["median_ms"] - 1
+        if change > threshold:
+            regressions.append((name, old["median_ms"], result["median_ms"], change))
+    for name, size in results["sizes"].items():
+        old = baseline.get("sizes", {}).get(name)
+        if old and size / old - 1 > threshold:
+            regressions.append((name + " (bytes)", old, size, size / old - 1))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--scales", default="", help="comma separated row multipliers, e.g. 10,100,1000")
+    parser.add_argument("--skip-startup", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    os.chdir(HERE)
+    timings = {}
+    sizes = {}
+
+    if not args.skip_startup:
+        timings.update(bench_startup(max(1, args.repeat // 2)))
+    timings.update(bench_data(args.repeat))
+    timings.update(bench_fetch(args.repeat))
+
+    state = app_test.create_app({"warm_up": True}).dashboard
+    callback_timings, callback_sizes = bench_callbacks(state, args.repeat)
+    timings.update(callback_timings)
+    sizes.update(callback_sizes)
+
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    if scales:
+        scale_timings, scale_sizes = bench_scaling(state, scales, args.repeat)
+        timings.update(scale_timings)
+        sizes.update(scale_sizes)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "timings": timings,
+        "sizes": sizes,
+    }
+
+    width = max(len(name) for name in list(timings) + list(sizes))
+    for name, result in timings.items():
+        print(f"{name:<{width}}  {result['median_ms']:>10.2f} ms")
+    for name, size in sizes.items():
+        print(f"{name:<{width}}  {size:>10,} B")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nwrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {old:.2f} -> {new:.2f} (+{change:.0%})")
+        if regressions:
+            return 1
+        print(f"no regressions over {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
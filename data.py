@@ -0,0 +1,733 @@
+# -*- coding: utf-8 -*-
+"""
+Loading the asset CSVs into the yearly dataframe used by the dashboard.
+Nothing is read until load_dataset() is called.
+"""
+from collections import OrderedDict
+import copy
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+import areas
+import indicators
+
+
+ASSET_FILES = {indicator.key: indicator.file for indicator in indicators.REGISTRY}
+
+# parsed frames are cached as one .npy file per column so later starts (and every
+# worker process) memory-map them instead of re-parsing the CSVs. the cache is
+# rebuilt when a source file's mtime or size changes, or its hash if enabled.
+# each area has its own folder in it
+INGEST_CACHE_DIR = ".cache/ingest"
+INGEST_CACHE_ENABLED = True
+INGEST_CACHE_HASH = False
+# bump when the frames load_frames() returns change shape
+INGEST_CACHE_FORMAT = 2
+
+# the gas file also has a column per region, see build_regional_gas(). the
+# gas series itself is the state's region, see state_region()
+GAS_KEY = "gas_price"
+GAS_REGION_SUFFIX = " Average ($/gal)"
+GAS_STATE_REGION = "New York State"
+GAS_FREQUENCIES = ("weekly", "monthly", "yearly")
+# numpy unit a date is truncated to for each frequency
+GAS_PERIOD_UNITS = {"weekly": "datetime64[D]", "monthly": "datetime64[M]", "yearly": "datetime64[Y]"}
+
+FRAME_NAMES = ("df",) + tuple(ASSET_FILES)
+
+
+def clean_source(frame, indicator):
+    # parse the date column into 'Date' and add 'Year'
+    frame["Date"] = pd.to_datetime(frame[indicator.date_column])
+    if indicator.date_column != "Date":
+        frame = frame.drop(columns=[indicator.date_column])
+    frame["Year"] = frame["Date"].dt.year
+    return frame
+
+
+def annual_series(frame, indicator):
+    # the indicator as one value per year, indexed by year. finer series are
+    # averaged and rounded to the indicator's decimals
+    if indicator.frequency == indicators.ALIGN_FREQUENCY:
+        series = frame.set_index("Year")[indicator.series_id]
+    else:
+        series = frame.groupby("Year")[indicator.series_id].mean().round(indicator.decimals)
+    return series.rename(indicator.name)
+
+
+def state_region(gas_source):
+    # the gas region whose prices are the state average
+    return gas_source.series_id[:-len(GAS_REGION_SUFFIX)]
+
+
+def align(frames, sources=indicators.REGISTRY):
+    # every indicator resampled to a year and joined in one pass. nothing is
+    # dropped: a year one series doesn't cover is NaN in that column only, and
+    # each chart uses the years its own series have
+    series = [annual_series(frames[indicator.key], indicator) for indicator in sources]
+    df = pd.concat(series, axis=1, join="outer", sort=True).astype("float64")
+    df.index.name = "Year"
+    return df.reset_index()
+
+
+def load_frames(sources=indicators.REGISTRY):
+    # make dataframe from assets
+    frames = {
+        indicator.key: clean_source(pd.read_csv(indicator.file), indicator)
+        for indicator in sources
+    }
+    frames["df"] = align(frames, sources)
+    return frames
+
+
+class IngestCache:
+    # on-disk copy of the parsed frames: <dir>/<name>/<n>.npy per column plus a
+    # manifest.json with the column names and the source file signature
+    def __init__(self, directory=INGEST_CACHE_DIR, use_hash=INGEST_CACHE_HASH, sources=indicators.REGISTRY):
+        self.directory = directory
+        self.use_hash = use_hash
+        self.sources = sources
+
+    def signature(self, paths):
+        # the layout of the cached frames depends on this code and on how the
+        # registry reads each file, so both are part of the signature too
+        signature = [[
+            "format", INGEST_CACHE_FORMAT,
+            [[i.key, i.series_id, i.frequency, i.date_column, i.decimals] for i in self.sources],
+        ]]
+        for path in sorted(paths):
+            stat = os.stat(path)
+            entry = [path, stat.st_mtime_ns, stat.st_size]
+            if self.use_hash:
+                with open(path, "rb") as f:
+                    entry.append(hashlib.sha1(f.read()).hexdigest())
+            signature.append(entry)
+        return signature
+
+    def save_frame(self, name, frame, signature):
+        # write into a temporary directory and rename it into place, so a reader
+        # in another process never sees a half-written frame
+        target = os.path.join(self.directory, name)
+        tmp = tempfile.mkdtemp(prefix=f".{name}-", dir=self.directory)
+        columns = []
+        for i, col in enumerate(frame.columns):
+            values = frame[col].to_numpy()
+            if values.dtype == object:
+                # object arrays would need pickle, which can't be memory-mapped
+                values = values.astype(str)
+            np.save(os.path.join(tmp, f"{i}.npy"), values)
+            columns.append(col)
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"signature": signature, "columns": columns}, f)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(tmp, target)
+
+    def load_frame(self, name, signature):
+        folder = os.path.join(self.directory, name)
+        try:
+            with open(os.path.join(folder, "manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest["signature"] != signature:
+            return None
+        data = {
+            col: np.load(os.path.join(folder, f"{i}.npy"), mmap_mode="r")
+            for i, col in enumerate(manifest["columns"])
+        }
+        return pd.DataFrame(data, copy=False)
+
+    def load_or_build(self, paths, build):
+        signature = self.signature(paths)
+        frames = {}
+        for name in FRAME_NAMES:
+            frame = self.load_frame(name, signature)
+            if frame is None:
+                break
+            frames[name] = frame
+        else:
+            return frames
+
+        frames = build()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for name, frame in frames.items():
+                self.save_frame(name, frame.reset_index(drop=True), signature)
+        except OSError:
+            # read-only filesystem etc., just run without the cache
+            pass
+        return frames
+
+
+class DataRepository:
+    # the merged frame as contiguous numpy columns sorted by the key column.
+    # range lookups use binary search and return views instead of copies, so
+    # a request doesn't allocate temporary DataFrames
+    def __init__(self, frame, key="Year"):
+        frame = frame.sort_values(key)
+        self.key = key
+        self.columns = {col: np.ascontiguousarray(frame[col].to_numpy()) for col in frame.columns}
+        self.keys = self.columns[key]
+
+    @classmethod
+    def from_columns(cls, columns, key="Year"):
+        # columns already sorted by key
+        repository = cls.__new__(cls)
+        repository.key = key
+        repository.columns = columns
+        repository.keys = columns[key]
+        return repository
+
+    def with_rows(self, frame):
+        # a new repository with the rows of frame added. new rows that come after
+        # every existing key (the usual case) are appended as they are, anything
+        # else is re-sorted
+        frame = frame.sort_values(self.key)
+        columns = {col: np.concatenate([values, frame[col].to_numpy()]) for col, values in self.columns.items()}
+        keys = columns[self.key]
+        if len(self.keys) and len(frame) and keys[len(self.keys)] < self.keys[-1]:
+            order = np.argsort(keys, kind="stable")
+            columns = {col: values[order] for col, values in columns.items()}
+        return DataRepository.from_columns(columns, self.key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bounds(self, start, end):
+        # [lo, hi) positions of the rows with start <= key <= end
+        lo = int(np.searchsorted(self.keys, start, side="left"))
+        hi = int(np.searchsorted(self.keys, end, side="right"))
+        return lo, hi
+
+    def slice(self, start, end):
+        lo, hi = self.bounds(start, end)
+        return {col: values[lo:hi] for col, values in self.columns.items()}
+
+    def value_at(self, column, key):
+        i = int(np.searchsorted(self.keys, key, side="left"))
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.columns[column][i]
+        return None
+
+
+class RangeStats:
+    # statistics of any [start, end] window of a repository's columns: mean,
+    # variance, min/max and CAGR of each column, and covariance and
+    # correlation with the base series. prefix sums (and sparse tables for
+    # min/max) are built once, so every query costs the same however long the
+    # window is. values are shifted by the column's first value before summing
+    # so x² sums of large numbers (house prices) don't lose precision
+    def __init__(self, repository, base):
+        self.repository = repository
+        self.base = base
+        self.shifts = {}
+        self.sums = {}
+        self.pairs = {}
+        self.minimum = {}
+        self.maximum = {}
+
+        x = repository.columns[base].astype(np.float64)
+        x_shift = first_value(x)
+        for name in (indicator.name for indicator in indicators.REGISTRY):
+            y = repository.columns[name].astype(np.float64)
+            valid = ~np.isnan(y)
+            shift = self.shifts[name] = first_value(y)
+            d = np.where(valid, y - shift, 0.0)
+            # count, sum, sum of squares
+            self.sums[name] = [prefix_sum(valid), prefix_sum(d), prefix_sum(d * d)]
+
+            # the same over the rows both this column and the base have
+            both = valid & ~np.isnan(x)
+            dx = np.where(both, x - x_shift, 0.0)
+            dy = np.where(both, d, 0.0)
+            self.pairs[name] = [
+                prefix_sum(both), prefix_sum(dx), prefix_sum(dy),
+                prefix_sum(dx * dx), prefix_sum(dy * dy), prefix_sum(dx * dy),
+            ]
+
+            self.minimum[name] = sparse_table(y, np.fmin)
+            self.maximum[name] = sparse_table(y, np.fmax)
+
+    def query(self, name, start, end):
+        # dict of the window's statistics, NaN where there are too few values
+        lo, hi = self.repository.bounds(start, end)
+        stats = dict.fromkeys(
+            ("mean", "variance", "std", "min", "max", "cagr", "covariance", "correlation"), np.nan
+        )
+        stats["count"] = 0
+        if hi <= lo:
+            return stats
+
+        count, total, squares = (float(values[hi] - values[lo]) for values in self.sums[name])
+        stats["count"] = int(count)
+        if count:
+            stats["mean"] = float(self.shifts[name] + total / count)
+            stats["min"] = sparse_query(self.minimum[name], lo, hi, np.fmin)
+            stats["max"] = sparse_query(self.maximum[name], lo, hi, np.fmax)
+        if count > 1:
+            stats["variance"] = centered(squares, total, count) / (count - 1)
+            stats["std"] = float(np.sqrt(stats["variance"]))
+
+        # compound annual growth between the first and last year of the window
+        column = self.repository.columns[name]
+        first, last = float(column[lo]), float(column[hi - 1])
+        years = int(self.repository.keys[hi - 1] - self.repository.keys[lo])
+        if years > 0 and first > 0 and last == last:
+            stats["cagr"] = (last / first) ** (1 / years) - 1
+
+        n, sx, sy, sxx, syy, sxy = (float(values[hi] - values[lo]) for values in self.pairs[name])
+        if n > 1:
+            products = sxy - sx * sy / n
+            stats["covariance"] = products / (n - 1)
+            spread = centered(sxx, sx, n) * centered(syy, sy, n)
+            if spread > 0:
+                stats["correlation"] = min(max(products / float(np.sqrt(spread)), -1.0), 1.0)
+        return stats
+
+
+def first_value(values):
+    valid = values[~np.isnan(values)]
+    return float(valid[0]) if len(valid) else 0.0
+
+
+def centered(squares, total, count):
+    # sum of squared differences from the mean. anything within rounding of
+    # zero is zero, so a flat window has no variance rather than a tiny one
+    value = squares - total * total / count
+    return value if value > squares * 1e-12 else 0.0
+
+
+def prefix_sum(values):
+    # sums[hi] - sums[lo] is the sum of values[lo:hi]
+    return np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+
+
+def sparse_table(values, combine):
+    # levels[k][i] = combine over values[i:i + 2**k], NaN ignored
+    levels = [values]
+    width = 1
+    while 2 * width <= len(values):
+        previous = levels[-1]
+        levels.append(combine(previous[:-width], previous[width:]))
+        width *= 2
+    return levels
+
+
+def sparse_query(levels, lo, hi, combine):
+    # combine over values[lo:hi] from two overlapping power of two blocks
+    k = (hi - lo).bit_length() - 1
+    level = levels[k]
+    return float(combine(level[lo], level[hi - (1 << k)]))
+
+
+class RegionalGasPrices:
+    # long format (Region, Period, Price, Spread) table of every gas region at
+    # one frequency, sorted by region then period. Spread is the difference to
+    # the state average for the same period. each region is one contiguous
+    # block, so a query is a binary search inside the block and a slice.
+    # the weekly sum and count behind each Price are kept too, so new weeks can
+    # be added without regrouping the history (see with_observations())
+    def __init__(self, regions, periods, sums, counts, state_region=GAS_STATE_REGION):
+        self.region_names = regions
+        self.periods = periods
+        self.sums = sums
+        self.counts = counts
+        self.prices = sums / counts
+
+        starts = np.flatnonzero(np.r_[True, regions[1:] != regions[:-1]])
+        stops = np.r_[starts[1:], len(regions)]
+        self.blocks = {regions[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+
+        # state average of the same period, NaN where there is none
+        self.state_region = state_region
+        self.spreads = np.full(len(self.prices), np.nan)
+        if state_region in self.blocks:
+            first, last = self.blocks[state_region]
+            state_periods = self.periods[first:last]
+            i = np.minimum(np.searchsorted(state_periods, self.periods), len(state_periods) - 1)
+            matched = state_periods[i] == self.periods
+            self.spreads[matched] = self.prices[matched] - self.prices[first:last][i[matched]]
+
+    @classmethod
+    def from_frame(cls, frame, state_region=GAS_STATE_REGION):
+        # frame has Region, Period, Sum and Count columns, in any order
+        frame = frame.sort_values(["Region", "Period"], kind="stable")
+        columns = (np.ascontiguousarray(frame[col].to_numpy()) for col in ("Region", "Period", "Sum", "Count"))
+        return cls(*columns, state_region=state_region)
+
+    def regions(self):
+        return list(self.blocks)
+
+    def query(self, region, start, end):
+        # views of the periods, prices and spreads with start <= period <= end
+        first, last = self.blocks[region]
+        periods = self.periods[first:last]
+        lo = first + int(np.searchsorted(periods, start, side="left"))
+        hi = first + int(np.searchsorted(periods, end, side="right"))
+        return self.periods[lo:hi], self.prices[lo:hi], self.spreads[lo:hi]
+
+    def with_observations(self, observations):
+        # a new table with the weekly prices in observations ((region, period,
+        # price) tuples) added to the sums of their periods. periods that don't
+        # exist yet are inserted in place, nothing is re-sorted
+        added = {}
+        for region, period, price in observations:
+            total, count = added.get((region, period), (0.0, 0))
+            added[(region, period)] = (total + price, count + 1)
+
+        sums = self.sums.copy()
+        counts = self.counts.copy()
+        positions, regions, periods, new_sums, new_counts = [], [], [], [], []
+        for (region, period), (total, count) in sorted(added.items()):
+            if region not in self.blocks:
+                raise ValueError(f"unknown gas region {region!r}")
+            first, last = self.blocks[region]
+            i = first + int(np.searchsorted(self.periods[first:last], period))
+            if i < last and self.periods[i] == period:
+                sums[i] += total
+                counts[i] += count
+            else:
+                positions.append(i)
+                regions.append(region)
+                periods.append(period)
+                new_sums.append(total)
+                new_counts.append(count)
+        return RegionalGasPrices(
+            np.insert(self.region_names, positions, regions),
+            np.insert(self.periods, positions, np.array(periods, dtype=self.periods.dtype)),
+            np.insert(sums, positions, new_sums),
+            np.insert(counts, positions, new_counts),
+            self.state_region,
+        )
+
+
+def frames_version(frames):
+    # digest of the frames' contents. the same data gives the same version in
+    # every worker, so it can key results shared between them
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(frames):
+        digest.update(name.encode())
+        digest.update(pd.util.hash_pandas_object(frames[name], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def build_regional_gas(df_gas_price, state_region=GAS_STATE_REGION):
+    # every region and frequency is aggregated here in one vectorized pass, so
+    # callbacks only ever slice the result
+    region_columns = [col for col in df_gas_price.columns if col.endswith(GAS_REGION_SUFFIX)]
+    long = df_gas_price.melt(id_vars=["Date"], value_vars=region_columns, var_name="Region", value_name="Price")
+    long = long.dropna(subset=["Price"])
+    long["Region"] = long["Region"].str.slice(0, -len(GAS_REGION_SUFFIX))
+
+    periods = {
+        "weekly": long["Date"],
+        "monthly": long["Date"].dt.to_period("M").dt.start_time,
+        "yearly": long["Date"].dt.to_period("Y").dt.start_time,
+    }
+
+    aggregates = {}
+    for frequency in GAS_FREQUENCIES:
+        grouped = long.groupby(["Region", periods[frequency].rename("Period")])["Price"].agg(["sum", "count"]).reset_index()
+        grouped = grouped.rename(columns={"sum": "Sum", "count": "Count"})
+        aggregates[frequency] = RegionalGasPrices.from_frame(grouped, state_region)
+    return aggregates
+
+
+class Dataset:
+    # everything the callbacks need from one load of the assets. sources are
+    # the indicators as the frames were read, see areas.Area
+    def __init__(self, frames, sources=indicators.REGISTRY):
+        self.frames = frames
+        self.sources = sources
+        self.df = frames["df"]
+        self.repository = DataRepository(self.df)
+        self.stats = RangeStats(self.repository, indicators.base().name)
+        # full resolution weekly state average, sorted by date
+        gas = next(source for source in sources if source.key == GAS_KEY)
+        self.gas_weekly_column = gas.series_id
+        self.gas_weekly = DataRepository(
+            frames[GAS_KEY][["Date", gas.series_id]].dropna(), key="Date"
+        )
+        self.gas_state_region = state_region(gas)
+        self.regional_gas = build_regional_gas(frames[GAS_KEY], self.gas_state_region)
+        # sum and count per year of the series averaged to yearly values, the
+        # running totals behind those means
+        self.year_totals = {}
+        for indicator in sources:
+            if indicator.frequency != indicators.ALIGN_FREQUENCY:
+                totals = frames[indicator.key].groupby("Year")[indicator.series_id].agg(["sum", "count"])
+                self.year_totals[indicator.key] = {
+                    int(year): (total, count) for year, total, count in totals.itertuples()
+                }
+        self.version = frames_version(frames)
+        self.set_year_bounds()
+
+    def set_year_bounds(self):
+        self.gas_min_year = int(self.frames[GAS_KEY]["Year"].min())
+        self.gas_max_year = int(self.frames[GAS_KEY]["Year"].max())
+        # first and last year each indicator can be shown for, where both it
+        # and the base series have values
+        years = self.repository.keys
+        base = self.repository.columns[indicators.base().name]
+        self.indicator_years = {}
+        for indicator in indicators.selectable():
+            shown = years[~np.isnan(base) & ~np.isnan(self.repository.columns[indicator.name])]
+            self.indicator_years[indicator.name] = (int(shown.min()), int(shown.max()))
+        self.min_year = min(start for start, _ in self.indicator_years.values())
+        self.max_year = max(end for _, end in self.indicator_years.values())
+
+    def clamp_years(self, selected_indicator, year_range):
+        # year_range limited to the years selected_indicator can be shown for,
+        # or all of them if the two don't overlap
+        first, last = self.indicator_years[selected_indicator]
+        if int(year_range[1]) < first or int(year_range[0]) > last:
+            return [first, last]
+        start = min(max(int(year_range[0]), first), last)
+        end = max(min(int(year_range[1]), last), start)
+        return [start, end]
+
+    def year_ranges(self, selected_indicator):
+        # every [start, end] pair the year slider can produce for the indicator
+        first, last = self.indicator_years[selected_indicator]
+        years = range(first, last + 1)
+        return [(start, end) for start in years for end in years if start <= end]
+
+    def updated(self, new_rows):
+        # a new Dataset with new_rows ({asset name: raw csv rows}, see
+        # AssetWatcher) added. only the years those rows fall in are
+        # recomputed and self is left as it was, so requests still using it
+        # aren't affected. returns (dataset, set of affected years).
+        # rows of a year already in a yearly series replace it, rows of finer
+        # series must be for new dates (ValueError otherwise, reload everything
+        # then)
+        dataset = copy.copy(self)
+        frames = dict(self.frames)
+        year_totals = dict(self.year_totals)
+        # {indicator name: {year: new yearly value}}
+        changed = {}
+
+        for indicator in self.sources:
+            if indicator.key not in new_rows:
+                continue
+            rows = clean_source(new_rows[indicator.key].copy(), indicator)
+            old = frames[indicator.key]
+
+            if indicator.frequency == indicators.ALIGN_FREQUENCY:
+                frame = pd.concat([old[~old["Year"].isin(rows["Year"])], rows], ignore_index=True)
+                frames[indicator.key] = frame.sort_values("Year", kind="stable").reset_index(drop=True)
+                changed[indicator.name] = dict(zip(rows["Year"].astype(int), rows[indicator.series_id]))
+                continue
+
+            if np.isin(rows["Date"].to_numpy(), old["Date"].to_numpy()).any():
+                raise ValueError(f"{indicator.key}: rows for dates that are already loaded")
+            frames[indicator.key] = pd.concat([rows, old], ignore_index=True)
+
+            # running yearly means, only the years with new rows change
+            totals = dict(self.year_totals[indicator.key])
+            added = rows.groupby("Year")[indicator.series_id].agg(["sum", "count"])
+            for year, total, count in added.itertuples():
+                old_total, old_count = totals.get(int(year), (0.0, 0))
+                totals[int(year)] = (old_total + total, old_count + count)
+            year_totals[indicator.key] = totals
+            changed[indicator.name] = {
+                int(year): np.round(totals[int(year)][0] / totals[int(year)][1], indicator.decimals)
+                if totals[int(year)][1] else np.nan
+                for year in added.index
+            }
+
+            if indicator.key == GAS_KEY:
+                dataset.gas_weekly = self.gas_weekly.with_rows(rows[["Date", self.gas_weekly_column]].dropna())
+                dates = rows["Date"].to_numpy()
+                region_columns = [col for col in rows.columns if col.endswith(GAS_REGION_SUFFIX)]
+                dataset.regional_gas = {}
+                for frequency in GAS_FREQUENCIES:
+                    table = self.regional_gas[frequency]
+                    periods = dates.astype(GAS_PERIOD_UNITS[frequency]).astype(table.periods.dtype)
+                    observations = [
+                        (col[:-len(GAS_REGION_SUFFIX)], period, price)
+                        for col in region_columns
+                        for period, price in zip(periods, rows[col].to_numpy())
+                        if not np.isnan(price)
+                    ]
+                    dataset.regional_gas[frequency] = table.with_observations(observations)
+
+        affected = set()
+        if changed:
+            # only the cells of the affected years are written, new years are
+            # added as rows with NaN in the other columns
+            df = self.df.set_index("Year")
+            for name, values in changed.items():
+                for year, value in values.items():
+                    df.loc[year, name] = value
+                    affected.add(year)
+            frames["df"] = df.sort_index().reset_index()
+            dataset.df = frames["df"]
+            dataset.repository = DataRepository(dataset.df)
+            dataset.stats = RangeStats(dataset.repository, indicators.base().name)
+
+        dataset.frames = frames
+        dataset.year_totals = year_totals
+        dataset.version = frames_version(frames)
+        dataset.set_year_bounds()
+        return dataset, affected
+
+
+class CsvTail:
+    # remembers the header, first and last line of an asset csv, so rows added
+    # at the top (the gas file, newest first) or the bottom (the FRED files)
+    # can be read without reading the rest of the file
+    TAIL_BYTES = 4096
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mark(f)
+
+    def mark(self, f):
+        stat = os.fstat(f.fileno())
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        f.seek(0)
+        self.header = f.readline()
+        self.first = f.readline()
+        f.seek(max(len(self.header), self.size - self.TAIL_BYTES))
+        lines = f.read().splitlines(keepends=True)
+        self.last = lines[-1] if lines else b""
+
+    def read_new(self):
+        # the new lines, b"" if nothing changed. raises ValueError if the file
+        # changed in some other way and has to be read again completely.
+        # writers should replace the file (write elsewhere, then rename), so a
+        # half written row is never read
+        stat = os.stat(self.path)
+        if stat.st_size == self.size and stat.st_mtime_ns == self.mtime:
+            return b""
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.size or f.readline() != self.header:
+                raise ValueError(f"{self.path}: rows changed, not just added")
+            first = f.readline()
+            if first == self.first:
+                # appended. the old last line is read again, if it was changed
+                # (FRED files end in a row with the value still missing) it
+                # comes back as a new row
+                start = self.size - len(self.last)
+                f.seek(start - 1)
+                if f.read(1) != b"\n":
+                    raise ValueError(f"{self.path}: rows changed, not just added")
+                last = f.readline()
+                new = f.read()
+                if last.rstrip(b"\r\n") != self.last.rstrip(b"\r\n"):
+                    new = last + new
+                if not new:
+                    # touched or edited in place without growing
+                    raise ValueError(f"{self.path}: rows changed, not just added")
+            else:
+                # prepended. everything up to the old first line is new, and
+                # that has to account for the whole change in size
+                lines = []
+                line = first
+                added = 0
+                while line and line != self.first and added <= size - self.size:
+                    lines.append(line)
+                    added += len(line)
+                    line = f.readline()
+                new = b"".join(lines)
+                if line != self.first or size != self.size + len(new):
+                    raise ValueError(f"{self.path}: rows changed, not just added")
+            self.mark(f)
+        return new
+
+
+class AssetWatcher:
+    # finds rows added to the asset files since the last poll()
+    def __init__(self, files=ASSET_FILES):
+        self.tails = {name: CsvTail(path) for name, path in files.items()}
+
+    def poll(self):
+        # {asset name: frame of the new rows, as read_csv returns them}
+        new_rows = {}
+        for name, tail in self.tails.items():
+            lines = tail.read_new()
+            if lines.strip():
+                new_rows[name] = pd.read_csv(io.BytesIO(tail.header + lines))
+        return new_rows
+
+
+def load_dataset(cache_enabled=INGEST_CACHE_ENABLED, cache_dir=INGEST_CACHE_DIR, cache_hash=INGEST_CACHE_HASH, area=None):
+    # the dataset of one area, New York by default. with the cache each area
+    # is a folder of memory-mapped columns under cache_dir
+    area = area or areas.default_area()
+    if cache_enabled:
+        cache = IngestCache(os.path.join(cache_dir, area.key), cache_hash, area.sources)
+        frames = cache.load_or_build(area.files().values(), lambda: load_frames(area.sources))
+    else:
+        frames = load_frames(area.sources)
+    return Dataset(frames, area.sources)
+
+
+class DatasetCache:
+    # the datasets of the areas used recently, at most max_areas of them.
+    # an area is loaded on its first request and dropped again when it is the
+    # least recently used one, so memory follows the areas people look at and
+    # not the size of the catalog. two requests for an area that isn't loaded
+    # yet load it once, other areas aren't held up meanwhile. load(key)
+    # returns the dataset of an area, evicted(key) is called after an area
+    # was dropped
+    def __init__(self, max_areas, load, evicted=None):
+        self.max_areas = max_areas
+        self.load = load
+        self.evicted = evicted
+        self._datasets = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._datasets
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def get(self, key):
+        with self._lock:
+            dataset = self._datasets.get(key)
+            if dataset is not None:
+                self._datasets.move_to_end(key)
+                return dataset
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                dataset = self._datasets.get(key)
+            if dataset is None:
+                try:
+                    dataset = self.load(key)
+                    self.put(key, dataset)
+                finally:
+                    with self._lock:
+                        self._loading.pop(key, None)
+            return dataset
+
+    def put(self, key, dataset):
+        dropped = []
+        with self._lock:
+            self._datasets[key] = dataset
+            self._datasets.move_to_end(key)
+            while len(self._datasets) > self.max_areas:
+                dropped.append(self._datasets.popitem(last=False)[0])
+        if self.evicted is not None:
+            for key in dropped:
+                self.evicted(key)
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
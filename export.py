@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+CSV and Parquet downloads of the loaded data, served by the /export route
+(see app_test.register_export). Files are encoded a chunk of rows at a time
+straight from the numpy columns, so the whole file is never held in memory.
+Parquet needs pyarrow, which is optional.
+"""
+import importlib.util
+import io
+
+import pandas as pd
+
+import indicators
+
+
+EXPORT_PATH = "/export"
+CHUNK_ROWS = 10000
+MIMETYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+
+def formats():
+    # the formats this install can write
+    if importlib.util.find_spec("pyarrow") is None:
+        return ["csv"]
+    return list(MIMETYPES)
+
+
+
+"""
+==========================================================================
+Columns
+"""
+
+def indicator_columns(dataset, selected_indicator, year_range):
+    # Year, the base series and the selected indicator over the years the
+    # dashboard would show for year_range
+    start, end = dataset.clamp_years(selected_indicator, year_range)
+    view = dataset.repository.slice(start, end)
+    names = ["Year", indicators.base().name, selected_indicator]
+    return {name: view[name] for name in names}, f"{indicators.by_name(selected_indicator).key}_{start}-{end}"
+
+
+def regional_columns(dataset, frequency):
+    # every gas region's full history at one frequency
+    regional = dataset.regional_gas[frequency]
+    columns = {
+        "Region": regional.region_names,
+        "Period": regional.periods,
+        "Price": regional.prices,
+        "Spread": regional.spreads,
+    }
+    return columns, f"gas_regions_{frequency}"
+
+
+def chunks(columns, chunk_rows):
+    # views of chunk_rows rows at a time, at least one (maybe empty) chunk
+    rows = len(next(iter(columns.values())))
+    for lo in range(0, max(rows, 1), chunk_rows):
+        chunk = {}
+        for name, values in columns.items():
+            values = values[lo:lo + chunk_rows]
+            if values.dtype.kind == "M":
+                # monthly and yearly periods as plain dates
+                values = values.astype("datetime64[D]")
+            chunk[name] = values
+        yield chunk
+
+
+
+"""
+==========================================================================
+Encoders
+"""
+
+def csv_chunks(columns, chunk_rows=CHUNK_ROWS):
+    for i, chunk in enumerate(chunks(columns, chunk_rows)):
+        text = pd.DataFrame(chunk).to_csv(header=i == 0, index=False, lineterminator="\n")
+        yield text.encode("utf-8")
+
+
+class ChunkSink(io.RawIOBase):
+    # write-only file that hands out what was written since the last take(),
+    # so a ParquetWriter can be streamed one row group at a time
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(columns, chunk_rows=CHUNK_ROWS):
+    # one row group per chunk, the footer comes last
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    writer = None
+    for chunk in chunks(columns, chunk_rows):
+        table = pa.table({name: pa.array(values, from_pandas=True) for name, values in chunk.items()})
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+ENCODERS = {"csv": csv_chunks, "parquet": parquet_chunks}
+
+
+def encode(columns, file_format, chunk_rows=CHUNK_ROWS):
+    return ENCODERS[file_format](columns, chunk_rows)
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+Downloads the asset csv files again from FRED and data.ny.gov, for New York
+and every area under areas/ (see areas.py).
+
+    python fetch.py                                   # update the files in place
+    python fetch.py --area NY --output /tmp/assets    # one area, somewhere else
+    python fetch.py --serve --port 8765               # local stand-in server
+    python fetch.py --base-url http://127.0.0.1:8765  # fetch from it
+
+Series are fetched by a pool of threads sharing keep-alive connections, at
+most --rate requests per second to each host. Every response is kept under
+.cache/http with its ETag and Last-Modified, so a later run sends conditional
+requests and an unchanged series costs a 304. Failed requests are retried
+with backoff. A file is only written when its contents changed, and it is
+replaced in one rename, so the running app's refresh (and the ingest cache)
+never see a half-written file. The files keep the columns the app reads;
+a download without them is reported and not written.
+
+--serve answers the same paths from the files on disk, with ETags, so the
+fetcher can run without the network. --fail-rate makes it answer some
+requests with 503 to exercise the retries.
+"""
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from email.utils import formatdate
+import hashlib
+import http.client
+import http.server
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import areas
+
+
+BASE_URLS = {
+    "fred": "https://fred.stlouisfed.org",
+    "data.ny.gov": "https://data.ny.gov",
+}
+HTTP_CACHE_DIR = ".cache/http"
+WORKERS = 16
+# requests per second to one host
+RATE = 20.0
+RETRIES = 4
+TIMEOUT = 30.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+USER_AGENT = "cost-of-living-dashboard/fetch"
+
+
+
+"""
+==========================================================================
+Downloads
+"""
+
+class Download:
+    # one file to fetch: the url and where it goes, plus the columns the app
+    # reads from it
+    def __init__(self, area, source, url, path):
+        self.area = area
+        self.key = source.key
+        self.url = url
+        self.path = path
+        self.columns = (source.date_column, source.series_id)
+
+    def __repr__(self):
+        return f"{self.area}/{self.key}"
+
+
+def downloads(area_keys=None, base_urls=BASE_URLS, output=None, areas_dir=areas.AREAS_DIR):
+    # the Downloads of the given areas (all of them by default). with output
+    # the files go under it, at the same relative paths
+    if area_keys is None:
+        area_keys = list(areas.catalog(areas_dir))
+    found = []
+    for key in area_keys:
+        for source in areas.find(key, areas_dir).sources:
+            if source.download is None:
+                continue
+            base, path = source.download
+            url = base_urls[base].rstrip("/") + path.format(series_id=urllib.parse.quote(source.series_id))
+            target = source.file if output is None else os.path.join(output, os.path.relpath(source.file))
+            found.append(Download(key, source, url, target))
+    return found
+
+
+def check_columns(body, columns):
+    # the header of a downloaded csv has to have the columns the app reads
+    header = next(csv.reader(io.StringIO(body[:4096].decode("utf-8-sig", "replace"))), [])
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ValueError(f"missing columns {missing}, got {header[:5]}")
+
+
+def write_file(path, body):
+    # True if the file changed. written next to it and renamed into place
+    try:
+        with open(path, "rb") as f:
+            if f.read() == body:
+                return False
+    except OSError:
+        pass
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(prefix=".fetch-", dir=folder)
+    with os.fdopen(handle, "wb") as f:
+        f.write(body)
+    os.replace(temporary, path)
+    return True
+
+
+
+"""
+==========================================================================
+HTTP
+"""
+
+class RateLimiter:
+    # token bucket, shared by the threads fetching from one host
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # take the token now and sleep until it would have been there
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+class ConnectionPool:
+    # idle keep-alive connections per (scheme, host), handed to whichever
+    # thread sends the next request there
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def request(self, url, headers):
+        # (status, response headers, body)
+        parts = urllib.parse.urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        with self._lock:
+            connection = self._idle[host].pop() if self._idle[host] else None
+        if connection is None:
+            if parts.scheme == "https":
+                connection = http.client.HTTPSConnection(parts.netloc, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(parts.netloc, timeout=self.timeout)
+
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        try:
+            connection.request("GET", target, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                self._idle[host].append(connection)
+        return response.status, response.headers, body
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+class HttpCache:
+    # the last 200 response of each url: <dir>/<sha1 of url>.json with the
+    # validators, and the body next to it
+    def __init__(self, directory=HTTP_CACHE_DIR):
+        self.directory = directory
+
+    def paths(self, url):
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.json"), os.path.join(self.directory, f"{name}.body")
+
+    def load(self, url):
+        # (validators, body) or (None, None)
+        meta_path, body_path = self.paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if meta.get("url") != url:
+            return None, None
+        return meta, body
+
+    def save(self, url, headers, body):
+        meta_path, body_path = self.paths(url)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched": time.time(),
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # body first, a meta file always has its body
+            write_file(body_path, body)
+            write_file(meta_path, json.dumps(meta).encode())
+        except OSError:
+            # read-only filesystem etc., just run without the cache
+            pass
+
+
+class Fetcher:
+    def __init__(self, cache=None, workers=WORKERS, rate=RATE, retries=RETRIES, timeout=TIMEOUT):
+        self.cache = cache
+        self.workers = workers
+        self.retries = retries
+        self.pool = ConnectionPool(timeout)
+        self._limiters = defaultdict(lambda: RateLimiter(rate))
+        self._limiters_lock = threading.Lock()
+
+    def limiter(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._limiters_lock:
+            return self._limiters[host]
+
+    def get(self, url):
+        # (body, whether it came from the cache after a 304)
+        meta, cached = self.cache.load(url) if self.cache is not None else (None, None)
+        headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity"}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        for attempt in range(self.retries + 1):
+            self.limiter(url).wait()
+            retry_after = None
+            try:
+                status, response_headers, body = self.pool.request(url, headers)
+            except (http.client.HTTPException, OSError) as error:
+                failure = error
+            else:
+                if status == 304 and cached is not None:
+                    return cached, True
+                if status == 200:
+                    if self.cache is not None:
+                        self.cache.save(url, response_headers, body)
+                    return body, False
+                failure = RuntimeError(f"HTTP {status}")
+                if status not in RETRY_STATUSES:
+                    break
+                retry_after = response_headers.get("Retry-After")
+            if attempt < self.retries:
+                # exponential backoff with jitter, or what the server asked for
+                delay = 0.5 * 2 ** attempt * (0.5 + random.random())
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                time.sleep(delay)
+        raise failure
+
+    def fetch(self, download):
+        # "updated", "unchanged" or "not modified"
+        body, not_modified = self.get(download.url)
+        check_columns(body, download.columns)
+        if write_file(download.path, body):
+            return "updated"
+        return "not modified" if not_modified else "unchanged"
+
+    def fetch_all(self, downloads):
+        # [(download, status or None, error or None)] in the order given
+        def run(download):
+            try:
+                return download, self.fetch(download), None
+            except Exception as error:
+                return download, None, error
+
+        try:
+            with ThreadPoolExecutor(self.workers) as executor:
+                return list(executor.map(run, downloads))
+        finally:
+            self.pool.close()
+
+
+
+"""
+==========================================================================
+Stand-in Server
+"""
+
+class MockServer:
+    # answers the paths of the given Downloads (made with empty base urls)
+    # from the local files, with ETag and Last-Modified like the real
+    # sources. fail_rate is the share of requests answered with 503
+    def __init__(self, routes, host="127.0.0.1", port=0, fail_rate=0.0, delay=0.0, seed=None):
+        self.routes = routes
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def for_downloads(cls, downloads, **kwargs):
+        return cls({download.url: download.path for download in downloads}, **kwargs)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail(self):
+        with self._lock:
+            self.requests += 1
+            return self._random.random() < self.fail_rate
+
+    def handler(self):
+        mock = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            # keep-alive, like the real sources
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if mock.delay:
+                    time.sleep(mock.delay)
+                if mock.fail():
+                    return self.reply(503, {"Retry-After": "0"})
+                path = mock.routes.get(self.path)
+                if path is None:
+                    return self.reply(404)
+                with open(path, "rb") as f:
+                    body = f.read()
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                headers = {
+                    "ETag": etag,
+                    "Last-Modified": formatdate(os.stat(path).st_mtime, usegmt=True),
+                    "Content-Type": "text/csv",
+                }
+                if self.headers.get("If-None-Match") == etag:
+                    return self.reply(304, headers)
+                self.reply(200, headers, body)
+
+            def reply(self, status, headers=None, body=b""):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+
+"""
+==========================================================================
+Main
+"""
+
+def parse_base_urls(values):
+    # --base-url URL (every source) or --base-url name=URL
+    base_urls = dict(BASE_URLS)
+    for value in values or []:
+        name, named, url = value.partition("=")
+        if not named or "://" in name:
+            base_urls = dict.fromkeys(base_urls, value)
+        elif name not in base_urls:
+            raise SystemExit(f"unknown source {name!r}, one of {sorted(base_urls)}")
+        else:
+            base_urls[name] = url
+    return base_urls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--area", action="append", help="area key, repeat for more. default every area")
+    parser.add_argument("--output", help="directory to write into instead of the files in place")
+    parser.add_argument("--base-url", action="append", help="URL for every source, or name=URL for one")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="requests per second per host, 0 for no limit")
+    parser.add_argument("--retries", type=int, default=RETRIES)
+    parser.add_argument("--no-http-cache", action="store_true")
+    parser.add_argument("--serve", action="store_true", help="run the stand-in server instead")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests --serve answers with 503")
+    args = parser.parse_args(argv)
+
+    os.chdir(HERE)
+    if args.serve:
+        routes = downloads(args.area, dict.fromkeys(BASE_URLS, ""))
+        server = MockServer.for_downloads(routes, port=args.port, fail_rate=args.fail_rate)
+        print(f"serving {len(routes)} files on {server.url}")
+        try:
+            server.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    todo = downloads(args.area, parse_base_urls(args.base_url), args.output)
+    cache = None if args.no_http_cache else HttpCache()
+    fetcher = Fetcher(cache, args.workers, args.rate, args.retries)
+    start = time.perf_counter()
+    results = fetcher.fetch_all(todo)
+    failed = 0
+    for download, status, error in results:
+        if error is not None:
+            failed += 1
+            print(f"{download}: failed, {error}")
+        elif status == "updated":
+            print(f"{download}: updated {download.path}")
+    print(f"fetched {len(results)} files, {failed} failed, in {time.perf_counter() - start:.1f} s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
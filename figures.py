@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""
+Figure builders for the dashboard and the cache that holds their output.
+"""
+from collections import OrderedDict
+import base64
+import functools
+import threading
+
+from dash import Patch
+import numpy as np
+
+import indicators
+import metrics
+import results
+
+
+COLORS = {indicator.name: indicator.color for indicator in indicators.REGISTRY}
+COLORS["background"] = "whitesmoke"
+
+INDICATORS = [indicator.name for indicator in indicators.selectable()]
+
+# the parts of the line and bar figures that depend on the year range. when
+# only the slider moves, these are all that is sent (see figure_patch)
+LINE_RANGE_PATHS = (
+    ("data", 0, "x"),
+    ("data", 0, "y"),
+    ("data", 1, "x"),
+    ("data", 1, "y"),
+    ("layout", "title", "text"),
+    ("layout", "xaxis", "dtick"),
+    ("layout", "yaxis", "range"),
+    ("layout", "yaxis2", "range"),
+)
+BAR_RANGE_PATHS = (
+    ("data", 0, "x"),
+    ("data", 0, "y"),
+    ("layout", "title", "text"),
+    ("layout", "xaxis", "tickvals"),
+    ("layout", "yaxis", "range"),
+)
+
+
+
+"""
+==========================================================================
+Figures
+"""
+
+# every figure is assembled as the plain dict plotly.io would write for it,
+# without building plotly graph objects. the parts that don't depend on the
+# data are built once per indicator and shared by all figures, so they must
+# never be modified: each figure copies the dicts it changes
+
+# plotly's "none" template, as plotly.io writes it
+TEMPLATE = {"data": {"scatter": [{"type": "scatter"}]}}
+MARGIN = {"l": 80, "r": 90, "t": 80, "b": 55}
+HOVERLABEL = {"bgcolor": "white", "font": {"size": 12, "family": "Arial"}, "align": "left", "namelength": -1}
+
+# numpy dtypes plotly.js reads as base64 typed arrays
+TYPED_ARRAYS = {
+    "int8": "i1", "uint8": "u1", "int16": "i2", "uint16": "u2",
+    "int32": "i4", "uint32": "u4", "float32": "f4", "float64": "f8",
+}
+
+
+def typed_array(values):
+    # values the way plotly.io writes a numpy array: base64 in the smallest
+    # int type that holds them, or a list of ISO strings for dates
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values, unit="s").tolist()
+    if not values.size:
+        return []
+    if values.dtype == np.int64:
+        for dtype in (np.int8, np.int16, np.int32):
+            limits = np.iinfo(dtype)
+            if limits.min <= values.min() and values.max() <= limits.max:
+                values = values.astype(dtype)
+                break
+    name = TYPED_ARRAYS.get(values.dtype.name)
+    if name is None:
+        return [None if value != value else value for value in values.tolist()]
+    return {"dtype": name, "bdata": base64.b64encode(np.ascontiguousarray(values)).decode("ascii")}
+
+
+def plain(value):
+    # a float for json, NaN as null
+    return None if value != value else float(value)
+
+
+def axis(base, **changes):
+    # a copy of an axis with changes, None values left out
+    axis = dict(base)
+    axis.update((key, value) for key, value in changes.items() if value is not None)
+    return axis
+
+
+def fit_range(default, values):
+    # the indicator's default axis range, widened to fit values outside it
+    if default is None:
+        return None
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return list(default)
+    return [min(default[0], values.min().item()), max(default[1], values.max().item())]
+
+
+@functools.lru_cache(maxsize=None)
+def bar_base(selected_indicator):
+    # (trace, layout) of an indicator's bar figure without data, titles or ranges
+    indicator = indicators.by_name(selected_indicator)
+    trace = {"marker": {"color": COLORS.get(selected_indicator)}, "name": selected_indicator, "type": "bar"}
+    layout = {
+        "template": TEMPLATE,
+        "legend": {"x": 0.5, "y": 1.1, "xanchor": "center", "yanchor": "top", "orientation": "h"},
+        "margin": MARGIN,
+        "xaxis": {"title": {"text": "Year"}},
+        "yaxis": {
+            "title": {"text": selected_indicator},
+            "tickprefix": indicator.prefix,
+            "ticksuffix": indicator.suffix,
+            "tickformat": indicator.tickformat,
+        },
+        "showlegend": True,
+        "height": 400,
+        "bargap": 0.45,
+        "plot_bgcolor": COLORS["background"],
+    }
+    return trace, layout
+
+
+def make_bar_graph(repo, selected_indicator, year_range):
+    start_year = year_range[0]
+    end_year = year_range[1]
+    indicator = indicators.by_name(selected_indicator)
+
+    indicator_start = repo.value_at(selected_indicator, start_year)
+    indicator_end = repo.value_at(selected_indicator, end_year)
+
+    trace, layout = bar_base(selected_indicator)
+    trace = dict(trace, x=[f"{start_year}", f"{end_year}"], y=[plain(indicator_start), plain(indicator_end)])
+    layout = dict(
+        layout,
+        title={"text": f"{selected_indicator} at {start_year} vs. {end_year}"},
+        xaxis=axis(layout["xaxis"], tickvals=[start_year, end_year]),
+        yaxis=axis(layout["yaxis"], range=fit_range(indicator.bar_range, [indicator_start, indicator_end])),
+    )
+    return {"data": [trace], "layout": layout}
+
+
+@functools.lru_cache(maxsize=None)
+def line_base(selected_indicator):
+    # (traces, layout) of the base series against an indicator without data,
+    # titles or ranges
+    base = indicators.base()
+    indicator = indicators.by_name(selected_indicator)
+    traces = (
+        {"marker": {"color": COLORS[base.name]}, "name": base.name, "yaxis": "y", "type": "scatter"},
+        {
+            "hoverlabel": HOVERLABEL,
+            "marker": {"color": COLORS.get(selected_indicator)},
+            "name": selected_indicator,
+            "yaxis": "y2",
+            "type": "scatter",
+        },
+    )
+    layout = {
+        "template": TEMPLATE,
+        "legend": {"x": 0.5, "y": 1.1, "xanchor": "right", "yanchor": "top", "orientation": "h"},
+        "margin": MARGIN,
+        "yaxis": {"title": {"text": base.axis_title, "standoff": 10}, "tickprefix": base.prefix},
+        "hoverlabel": HOVERLABEL,
+        "yaxis2": {
+            "title": {"text": indicator.axis_title, "standoff": 15},
+            "overlaying": "y",
+            "side": "right",
+            "fixedrange": True,
+            "tickprefix": indicator.prefix,
+            "ticksuffix": indicator.suffix,
+            "tickformat": indicator.tickformat,
+        },
+        "xaxis": {"title": {"text": "Years"}, "fixedrange": True},
+        "showlegend": True,
+        "height": 400,
+        "plot_bgcolor": COLORS["background"],
+    }
+    return traces, layout
+
+
+def build_line_graph(view, selected_indicator, year_range):
+    base = indicators.base()
+    indicator = indicators.by_name(selected_indicator)
+    traces, layout = line_base(selected_indicator)
+
+    years = typed_array(view["Year"])
+    data = [
+        dict(traces[0], x=years, y=typed_array(view[base.name])),
+        dict(traces[1], x=years, y=typed_array(view[selected_indicator])),
+    ]
+    layout = dict(
+        layout,
+        title={"text": f"{base.name} vs. {selected_indicator} Trends ({year_range[0]} - {year_range[1]})"},
+        yaxis=axis(layout["yaxis"], range=fit_range(base.line_range, view[base.name])),
+        yaxis2=axis(layout["yaxis2"], range=fit_range(indicator.line_range, view[selected_indicator])),
+        xaxis=axis(layout["xaxis"], dtick=indicators.year_step(year_range[0], year_range[1])),
+    )
+    return {"data": data, "layout": layout}
+
+
+def make_change_statement(selected_indicator, year_range, start_value, end_value, stats):
+    indicator = indicators.by_name(selected_indicator)
+    change = end_value - start_value
+    change_direction = "increased" if change > 0 else "decreased"
+    change_value = indicator.format(abs(change))
+
+    statement = f"From {year_range[0]} to {year_range[1]}, {selected_indicator.lower()} {change_direction} by {change_value}."
+    if stats["count"] < 2:
+        return statement
+
+    # stats is data.RangeStats.query() for the same years
+    statement += (
+        f" Over these years it averaged {indicator.format(stats['mean'])}"
+        f" (standard deviation {indicator.format(stats['std'])}),"
+        f" ranging from {indicator.format(stats['min'])} to {indicator.format(stats['max'])}"
+    )
+    if stats["cagr"] == stats["cagr"]:
+        statement += f", a compound annual growth rate of {stats['cagr']:.1%}"
+    statement += "."
+    if stats["correlation"] == stats["correlation"]:
+        statement += (
+            f" Its correlation with {indicators.base().name.lower()} was {stats['correlation']:.2f}"
+            f" (covariance {stats['covariance']:,.2f})."
+        )
+    return statement
+
+
+def make_table(view, selected_indicator, change_value, stats):
+    # the new results table rows as columns (see results.py). numbers stay
+    # numbers, the table formats them. Change and Average are in the
+    # selected indicator's unit, so they are text
+    indicator = indicators.by_name(selected_indicator)
+    rows = len(view["Year"])
+    table = dict(view)
+    for name, value in (("Change", change_value), ("Average", stats["mean"])):
+        text = indicator.format(value) if value == value else None
+        table[name] = np.full(rows, text, dtype=object)
+        table[results.SORT_KEYS[name]] = np.full(rows, value, dtype=np.float64)
+    table["CAGR"] = np.full(rows, stats["cagr"], dtype=np.float64)
+    table["Correlation"] = np.full(rows, stats["correlation"], dtype=np.float64)
+    return table
+
+
+def build_dashboard(repository, range_stats, selected_indicator, year_range):
+    # slice once and derive every output from the same view. range_stats is
+    # the data.RangeStats of the repository
+    with metrics.stage("filter"):
+        view = repository.slice(year_range[0], year_range[1])
+
+        start_value = repository.value_at(selected_indicator, year_range[0])
+        end_value = repository.value_at(selected_indicator, year_range[1])
+        stats = range_stats.query(selected_indicator, year_range[0], year_range[1])
+
+    with metrics.stage("figure"):
+        line_fig = build_line_graph(view, selected_indicator, year_range)
+        bar_fig = make_bar_graph(repository, selected_indicator, year_range)
+        change_statement = make_change_statement(selected_indicator, year_range, start_value, end_value, stats)
+        table = make_table(view, selected_indicator, end_value - start_value, stats)
+    return line_fig, bar_fig, change_statement, table
+
+
+def clientside_dataset(dataset, history_max_rows):
+    # columnar copy of df plus figure templates and formats for each
+    # indicator. the browser only swaps in the data, titles, ticks and ranges,
+    # so the layouts stay identical to the ones built here
+    repository = dataset.repository
+    templates = {}
+    for selected_indicator in INDICATORS:
+        year_range = dataset.indicator_years[selected_indicator]
+        view = repository.slice(*year_range)
+        templates[selected_indicator] = {
+            "line": build_line_graph(view, selected_indicator, year_range),
+            "bar": make_bar_graph(repository, selected_indicator, year_range),
+        }
+
+    return {
+        "base": indicators.base().name,
+        "columns": {
+            col: [None if value != value else value for value in values.tolist()]
+            for col, values in repository.columns.items()
+        },
+        "indicators": {
+            indicator.name: {
+                "prefix": indicator.prefix,
+                "suffix": indicator.suffix,
+                "decimals": indicator.decimals,
+                "line_range": indicator.line_range,
+                "bar_range": indicator.bar_range,
+            }
+            for indicator in indicators.REGISTRY
+        },
+        "templates": templates,
+        "history_max_rows": history_max_rows,
+    }
+
+
+
+"""
+==========================================================================
+Weekly Gas Prices
+"""
+
+def lttb(x, y, threshold):
+    # largest triangle three buckets downsampling. returns the indices of the
+    # points to keep: the first and last point, plus one point per bucket
+    # forming the largest triangle with the previous kept point and the
+    # average of the next bucket, which preserves peaks and dips
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    edges = np.append((np.arange(threshold - 1) * every).astype(np.int64) + 1, n)
+
+    index = np.empty(threshold, dtype=np.int64)
+    index[0] = 0
+    index[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi, next_hi = edges[i], edges[i + 1], edges[i + 2]
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        index[i + 1] = a
+    return index
+
+
+GAS_WEEKLY_LAYOUT = {
+    "template": TEMPLATE,
+    "margin": MARGIN,
+    "yaxis": {"title": {"text": "Average Gas Price"}, "tickprefix": "$", "tickformat": ".2f"},
+    "hoverlabel": HOVERLABEL,
+    "height": 400,
+    # keeps the user's zoom when a resampled figure comes back
+    "uirevision": "gas_weekly",
+    "xaxis": {"title": {"text": "Date"}},
+    "plot_bgcolor": COLORS["background"],
+}
+
+
+def build_gas_weekly_graph(repo, column, x_range=None, max_points=1000):
+    # x_range is the visible (start, end) window, or None for everything.
+    # only up to max_points points are sent, resampled for the window
+    lo, hi = 0, len(repo)
+    if x_range is not None:
+        lo, hi = repo.bounds(x_range[0], x_range[1])
+        # one extra point on each side so the line reaches the plot edges
+        lo, hi = max(lo - 1, 0), min(hi + 1, len(repo))
+
+    dates = repo.keys[lo:hi]
+    prices = repo.columns[column][lo:hi]
+    with metrics.stage("downsample"):
+        index = lttb(dates.astype("int64").astype(float), prices, max_points)
+
+    trace = {
+        "line": {"color": COLORS["Average Gas Price"]},
+        "mode": "lines",
+        "name": "Average Gas Price",
+        "x": typed_array(dates[index]),
+        "y": typed_array(prices[index]),
+        "type": "scattergl",
+    }
+    layout = dict(
+        GAS_WEEKLY_LAYOUT,
+        title={"text": f"Weekly Average Gas Price ({len(index):,} of {hi - lo:,} weeks shown)"},
+    )
+    if x_range is not None:
+        x_range = [value.astype("datetime64[us]").item().isoformat() for value in np.asarray(x_range)]
+        layout["xaxis"] = axis(layout["xaxis"], range=x_range)
+    return {"data": [trace], "layout": layout}
+
+
+
+"""
+==========================================================================
+Regional Gas Prices
+"""
+
+REGIONAL_LAYOUT = {
+    "template": TEMPLATE,
+    "margin": MARGIN,
+    "hoverlabel": HOVERLABEL,
+    "showlegend": True,
+    "height": 400,
+    "xaxis": {"title": {"text": "Date"}},
+    "plot_bgcolor": COLORS["background"],
+}
+REGIONAL_TREND_LAYOUT = dict(
+    REGIONAL_LAYOUT,
+    title={"text": "Regional Gas Prices"},
+    yaxis={"title": {"text": "Average Gas Price"}, "tickprefix": "$", "tickformat": ".2f"},
+)
+REGIONAL_SPREAD_LAYOUT = dict(
+    REGIONAL_LAYOUT,
+    yaxis={"title": {"text": "Difference ($/gal)"}, "tickprefix": "$", "tickformat": "+.2f", "zeroline": True},
+)
+
+
+def build_regional_graphs(regional, regions, state_region, start, end, progress=None):
+    # regional is a data.RegionalGasPrices at the chosen frequency. returns the
+    # price trend figure and the spread against the state average figure.
+    # progress(done, total) is called after each region
+    trend_data = []
+    spread_data = []
+    for done, region in enumerate(regions, 1):
+        periods, prices, spreads = regional.query(region, start, end)
+        periods = typed_array(periods)
+        trace = {"mode": "lines", "name": region, "x": periods, "y": typed_array(prices), "type": "scatter"}
+        if region == state_region:
+            trace = dict(trace, line={"color": COLORS["Average Gas Price"], "width": 3})
+        trend_data.append(trace)
+        if region != state_region:
+            spread_data.append(dict(trace, y=typed_array(spreads)))
+        if progress is not None:
+            progress(done, len(regions))
+
+    trend_fig = {
+        "data": trend_data,
+        "layout": dict(REGIONAL_TREND_LAYOUT),
+    }
+    spread_fig = {
+        "data": spread_data,
+        "layout": dict(REGIONAL_SPREAD_LAYOUT, title={"text": f"Spread vs. {state_region} Average"}),
+    }
+    return trend_fig, spread_fig
+
+
+
+"""
+==========================================================================
+Figure Cache
+"""
+
+class FigureCache:
+    # LRU cache of callback results, keyed by ("dashboard", area, dataset
+    # version, indicator, start, end) or ("gas_weekly", area, dataset version).
+    # values are stored already converted to plain JSON data, so a hit skips
+    # pandas and plotly entirely
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def rekey(self, update):
+        # replace every key with update(key), entries it returns None for are
+        # dropped. the LRU order is kept
+        with self._lock:
+            entries = OrderedDict()
+            for key, value in self._entries.items():
+                key = update(key)
+                if key is not None:
+                    entries[key] = value
+            self._entries = entries
+
+
+def figure_patch(fig, paths):
+    # a dash Patch that sets only the given paths of a serialized figure,
+    # so the browser keeps the rest of the figure it already has
+    patch = Patch()
+    for path in paths:
+        value = fig
+        try:
+            for key in path:
+                value = value[key]
+        except (KeyError, IndexError):
+            # not set for this indicator, so not set in the browser either
+            continue
+        target = patch
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = value
+    return patch
+
+
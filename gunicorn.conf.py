@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# gunicorn -c gunicorn.conf.py
+#
+# the app is imported once in the master process (preload_app) and then forked,
+# so the loaded data, layout and figure module are shared copy-on-write between
+# workers instead of each worker loading its own
+import gc
+
+from app_test import production_config, worker_count
+
+config = production_config()
+
+wsgi_app = "wsgi:server"
+bind = f"{config['host']}:{config['port']}"
+workers = worker_count(config)
+threads = config["threads"]
+worker_class = "gthread" if threads > 1 else "sync"
+preload_app = True
+timeout = 60
+keepalive = 5
+
+
+def when_ready(server):
+    # move everything loaded so far out of the garbage collector's reach, so
+    # collections in the workers don't touch (and copy) the shared pages
+    gc.freeze()
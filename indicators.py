@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+The economic series shown on the dashboard. Loading, alignment, charts, the
+results table and the indicator dropdown are all driven by REGISTRY, so adding
+a FRED series is one more entry here plus its csv under assets/.
+Standard library only, like metrics.py.
+"""
+import copy
+
+
+# frequencies a source can have, finest first. every series is resampled to
+# ALIGN_FREQUENCY (a mean per year for the finer ones) before they are joined
+FREQUENCIES = ("weekly", "monthly", "annual")
+ALIGN_FREQUENCY = "annual"
+
+# where fetch.py downloads a series: (name of a base url in fetch.BASE_URLS,
+# path), {series_id} is filled in
+FRED_DOWNLOAD = ("fred", "/graph/fredgraph.csv?id={series_id}")
+
+
+class Indicator:
+    # one series. key names its asset file and frame, name is the column and
+    # label used everywhere on the page. values are shown as
+    # prefix + number with `decimals` places + suffix. line_range and
+    # bar_range are the default y axis ranges, widened when values fall
+    # outside them (None lets plotly pick). download is where fetch.py gets
+    # the file, None if it can't
+    def __init__(
+        self,
+        key,
+        name,
+        file,
+        series_id,
+        frequency="annual",
+        date_column="observation_date",
+        prefix="",
+        suffix="",
+        decimals=0,
+        color=None,
+        line_range=None,
+        bar_range=None,
+        tickformat="",
+        axis_title=None,
+        selectable=True,
+        download=FRED_DOWNLOAD,
+    ):
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"{key}: unknown frequency {frequency!r}")
+        self.key = key
+        self.name = name
+        self.file = file
+        self.series_id = series_id
+        self.frequency = frequency
+        self.date_column = date_column
+        self.prefix = prefix
+        self.suffix = suffix
+        self.decimals = decimals
+        self.color = color
+        self.line_range = line_range
+        self.bar_range = bar_range
+        self.tickformat = tickformat
+        self.axis_title = axis_title or name
+        # the base series is always drawn on the left axis, the others can be
+        # picked in the dropdown and are drawn against it
+        self.selectable = selectable
+        self.download = download
+
+    def with_source(self, file, series_id, download=None):
+        # the same series read from another area's file (see areas.py)
+        indicator = copy.copy(self)
+        indicator.file = file
+        indicator.series_id = series_id
+        indicator.download = download
+        return indicator
+
+    def format(self, value):
+        return f"{self.prefix}{value:,.{self.decimals}f}{self.suffix}"
+
+    def table_format(self):
+        # DataTable column format, the same text as format()
+        return {
+            "locale": {"symbol": [self.prefix, self.suffix]},
+            "specifier": f"$,.{self.decimals}f",
+        }
+
+
+REGISTRY = [
+    Indicator(
+        "income",
+        "Median Household Income",
+        file="assets/real-median-household-income-NY.csv",
+        series_id="MEHOINUSNYA672N",
+        prefix="$",
+        color="#3cb521",
+        line_range=[75000, 87000],
+        axis_title="Median Household Income ($)",
+        selectable=False,
+    ),
+    Indicator(
+        "housing",
+        "Median Housing Price",
+        file="assets/median-listing-price-NY.csv",
+        series_id="MEDLISPRINY",
+        prefix="$",
+        color="#fd7e14",
+        line_range=[350000, 650000],
+        bar_range=[0, 650000],
+    ),
+    Indicator(
+        "unemployment",
+        "Unemployment Rate",
+        file="assets/unemployment-rate-NY.csv",
+        series_id="NYUR",
+        suffix="%",
+        decimals=1,
+        color="#446e9b",
+        line_range=[3.0, 9.0],
+        bar_range=[0.0, 9.0],
+    ),
+    Indicator(
+        "gas_price",
+        "Average Gas Price",
+        file="assets/Gasoline_Retail_Prices_Weekly_Average_by_Region__Beginning_2007.csv",
+        series_id="New York State Average ($/gal)",
+        frequency="weekly",
+        date_column="Date",
+        prefix="$",
+        decimals=2,
+        color="#fcba03",
+        line_range=[2.00, 4.50],
+        bar_range=[0.00, 5.00],
+        tickformat=".2f",
+        # the data.ny.gov dataset the file was exported from
+        download=("data.ny.gov", "/api/views/nqur-w4p7/rows.csv?accessType=DOWNLOAD"),
+    ),
+]
+
+
+def by_key(key):
+    for indicator in REGISTRY:
+        if indicator.key == key:
+            return indicator
+    raise KeyError(key)
+
+
+def by_name(name):
+    for indicator in REGISTRY:
+        if indicator.name == name:
+            return indicator
+    raise KeyError(name)
+
+
+def base():
+    return next(indicator for indicator in REGISTRY if not indicator.selectable)
+
+
+def selectable():
+    return [indicator for indicator in REGISTRY if indicator.selectable]
+
+
+def year_step(first, last):
+    # distance between labelled years on axes and sliders, so long ranges
+    # don't crowd them
+    years = last - first
+    return 1 if years < 16 else 2 if years < 30 else 5
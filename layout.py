@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Dashboard layout. Only needs dash and the loaded dataset, not plotly figures.
+"""
+from dash import dcc, html, dash_table
+import dash_bootstrap_components as dbc
+
+import areas
+import export
+import indicators
+
+
+"""
+==========================================================================
+Markdown Text
+"""
+
+asset_allocation_text = dcc.Markdown(
+    """
+> Explore how changes in the cost of living and housing market dynamics affect household income over time. 
+
+> Adjust the year range and compare trends in median household income, unemployment rates, and housing prices.
+  Select an indicator to see how it evolves between the years.
+    """
+)
+
+footer = html.Div(
+    dcc.Markdown(
+        """
+         The data presented in this analysis is based on publicly available sources and is
+        intended for general informational purposes only. It is not meant to replace
+        professional financial, economic, or policy advice. The trends and visualizations
+        presented here should not be interpreted as financial recommendations and should be
+        considered alongside other resources and expert guidance when making financial or
+        investment decisions. 
+        """
+    ),
+    className="p-2 mt-5 bg-primary text-white small",
+)
+
+
+"""
+==========================================================================
+Tables
+"""
+def make_results_table(custom=True):
+    # custom: paging, sorting and filtering run on the server (see results.py)
+    # and only the visible page is sent. the clientside mode has every row in
+    # the browser already and lets the table do it
+    columns = [
+        {"name": "Year", "id": "Year", "type": "numeric"},
+        {"name": "Change", "id": "Change", "type": "text"},
+        # statistics of the whole year range, see data.RangeStats
+        {"name": "Average", "id": "Average", "type": "text"},
+        {"name": "CAGR", "id": "CAGR", "type": "numeric", "format": {"specifier": ".1%"}},
+        {"name": "Correlation", "id": "Correlation", "type": "numeric", "format": {"specifier": ".2f"}},
+    ]
+    for indicator in indicators.REGISTRY:
+        columns.append({
+            "name": indicator.name,
+            "id": indicator.name,
+            "type": "numeric",
+            "format": indicator.table_format(),
+        })
+
+    action = "custom" if custom else "native"
+    return dash_table.DataTable(
+        id="results_table",
+        columns=columns,
+        data=[],
+        page_action=action,
+        page_current=0,
+        page_size=15,
+        sort_action=action,
+        sort_mode="multi",
+        filter_action=action,
+        filter_query="",
+        style_table={"height": "300px", "overflowY": "auto"},
+        style_header={
+            'whiteSpace': 'normal',
+            'height': 'auto',
+            'lineHeight': '1.5',
+            'textAlign': 'center',
+        },
+    )
+
+
+
+
+def export_links(prefix):
+    # links to the export route, their href is set by the clientside
+    # dashboard.export_links callback. formats this install can't write are
+    # hidden
+    available = export.formats()
+    return html.Div(
+        [
+            html.A(
+                f"Download {file_format.upper()}",
+                id=f"{prefix}_{file_format}",
+                href="",
+                hidden=file_format not in available,
+                className="me-3",
+            )
+            for file_format in export.MIMETYPES
+        ],
+        className="mt-2 small",
+    )
+
+
+
+
+"""
+==========================================================================
+Make Tabs
+"""
+
+# =======Play tab components
+
+asset_allocation_card = dbc.Card(asset_allocation_text, className="mt-2")
+
+def year_marks(min_year, max_year):
+    step = indicators.year_step(min_year, max_year)
+    return {year: str(year) for year in range(min_year, max_year + 1, step)}
+
+
+def year_bounds(dataset):
+    # slider settings per indicator, the clientside callback
+    # dashboard.year_bounds switches between them
+    return {
+        name: {"min": first, "max": last, "marks": year_marks(first, last)}
+        for name, (first, last) in dataset.indicator_years.items()
+    }
+
+
+def make_slider_card(min_year, max_year):
+    return dbc.Card(
+        [
+            html.H4("Select Year Range...", className="card-title"),
+            dcc.RangeSlider(
+                id="year_range_slider",
+                marks=year_marks(min_year, max_year),
+                min=min_year,
+                max=max_year,
+                step=1,
+                value=[min_year, max_year],
+                included=True,
+            ),
+        ],
+        body=True,
+        className="mt-4",
+        style={"margin-bottom": "10px"},
+    )
+
+DEFAULT_INDICATOR = indicators.selectable()[0].name
+
+def make_area_card(area_names):
+    # states and metro areas, see areas.py. with only New York there is
+    # nothing to pick
+    return dbc.Card(
+        dbc.CardBody(
+            [
+                html.H4("Select State or Metro Area", className="card-title"),
+                dcc.Dropdown(
+                    id="area_dropdown",
+                    options=[{'label': name, 'value': key} for key, name in area_names.items()],
+                    value=areas.DEFAULT_AREA,
+                    clearable=False,
+                    disabled=len(area_names) < 2,
+                    style={"width": "100%"},
+                ),
+            ]
+        ),
+        className="mt-4",
+        style={"width": "100%", "margin": "0 auto"},
+    )
+
+
+def area_title(name):
+    return f"Cost of Living in {name} Analysis"
+
+
+indicator_dropdown_card = dbc.Card(
+    dbc.CardBody(
+        [
+            html.H4("Select Indicator", className="card-title"),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        dcc.Dropdown(
+                            id="indicator_dropdown",
+                            options=[
+                                {'label': indicator.name, 'value': indicator.name}
+                                for indicator in indicators.selectable()
+                            ],
+                            value=DEFAULT_INDICATOR,
+                            style={"width": "100%"},
+                        ),
+                    ),
+                ]
+            )
+        ]
+    ),
+    style={"width": "100%", "margin": "0 auto"}
+)
+
+# =======Regions tab components
+
+# shown next to the state average when an area has them
+DEFAULT_REGIONS = ["New York City", "Buffalo"]
+
+
+def region_choices(dataset):
+    # (dropdown options, selected regions) of an area's gas regions
+    regions = dataset.regional_gas["weekly"].regions()
+    others = [region for region in regions if region != dataset.gas_state_region]
+    chosen = [region for region in DEFAULT_REGIONS if region in others] or others[:2]
+    options = [{'label': region, 'value': region} for region in regions]
+    return options, [dataset.gas_state_region] + chosen
+
+
+def regions_title(done=None, total=None):
+    # the regions card title, with how far a background build of the regional
+    # charts has got while one runs
+    if total is None:
+        return "Compare Gas Prices by Region"
+    return f"Compare Gas Prices by Region ({done} of {total} regions...)"
+
+
+def region_year_marks(min_year, max_year):
+    return {year: str(year) for year in range(min_year, max_year + 1)}
+
+
+def make_regions_card(dataset):
+    min_year, max_year = dataset.gas_min_year, dataset.gas_max_year
+    options, value = region_choices(dataset)
+    return dbc.Card(
+        [
+            html.H4(regions_title(), id="regions_title", className="card-title"),
+            dcc.Dropdown(
+                id="region_dropdown",
+                options=options,
+                value=value,
+                multi=True,
+            ),
+            dbc.RadioItems(
+                id="region_frequency",
+                options=[
+                    {'label': 'Weekly', 'value': 'weekly'},
+                    {'label': 'Monthly', 'value': 'monthly'},
+                    {'label': 'Yearly', 'value': 'yearly'},
+                ],
+                value="monthly",
+                inline=True,
+                className="mt-3",
+            ),
+            dcc.RangeSlider(
+                id="region_year_slider",
+                marks=region_year_marks(min_year, max_year),
+                min=min_year,
+                max=max_year,
+                step=1,
+                value=[min_year, max_year],
+                included=True,
+                className="mt-3",
+            ),
+            export_links("export_regions"),
+            # a regional build handed to a background job, and the time
+            # cached figures were last sent instead (see app_test)
+            dcc.Store(id="regional_job"),
+            dcc.Store(id="regional_served"),
+        ],
+        body=True,
+        className="mt-4",
+    )
+
+"""
+===========================================================================
+Main Layout
+"""
+
+def make_layout(dataset, clientside_data=None, area_names=None):
+    area_names = area_names or {areas.DEFAULT_AREA: areas.DEFAULT_NAME}
+    results_card = dbc.Card(
+        [
+            dbc.CardHeader("Results"),
+            html.Div(make_results_table(custom=clientside_data is None)),
+            html.Div(export_links("export_indicator"), className="px-3 pb-2"),
+        ],
+        className="mt-4",
+    )
+
+    # ========= Build tabs
+    tabs = dbc.Tabs(
+        [
+            dbc.Tab(
+                [
+                    asset_allocation_card,
+                    make_area_card(area_names),
+                    make_slider_card(*dataset.indicator_years[DEFAULT_INDICATOR]),
+                    indicator_dropdown_card,
+                ],
+                id="tab-1",
+                label="Play",
+            ),
+            dbc.Tab(
+                [results_card],
+                id="tab-2",
+                label="Results",
+            ),
+            dbc.Tab(
+                [make_regions_card(dataset)],
+                id="tab-3",
+                label="Regions",
+            ),
+        ],
+        id="tabs",
+        active_tab="tab-0",
+        className="mt-2",
+    )
+
+    return (
+        dcc.Store("stored_data"),
+        dcc.Store("dataset_store", data=clientside_data),
+        dcc.Store("year_bounds", data=year_bounds(dataset)),
+        dbc.Container(
+        [
+            dbc.Row(
+                dbc.Col(
+                    html.Div(
+                        [
+                            html.H2(
+                                area_title(area_names[areas.DEFAULT_AREA]),
+                                id="area_title",
+                                className="text-center text-white p-2",
+                            ),
+                            html.H6(
+                                "Malia de Jesus, CS-150: Community Action Computing",
+                                className="text-center text-white",
+                            ),
+                        ],
+                        className="bg-primary p-2",
+                    )
+                )
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(tabs, width=12, lg=5, className="mt-4 border"),
+                    dbc.Col(
+                        [
+                            dcc.Graph(id="line_chart", className="mb-2"),
+                            dcc.Graph(
+                                id="bar_graph",
+                                className="mb-2",
+                                style={
+                                    'display': 'flex',
+                                    'justify-content': 'center',
+                                    'align-items': 'center',
+                                    'width': '80%',
+                                    'margin': 'auto',
+                                }
+                            ),
+                            html.Hr(),
+                            dcc.Store(id="change_statement_store"),
+                            html.Div([
+                                html.B(id="change_statement"),
+                                html.P("Note: There may have been fluctuations between these years.")
+                            ], className="change-statement-container"),
+                            html.Hr(),
+                            dcc.Graph(id="gas_weekly_chart", className="mb-2"),
+                            dcc.Graph(id="regional_trend_chart", className="mb-2"),
+                            dcc.Graph(id="regional_spread_chart", className="mb-2"),
+                        ],
+                        width=12,
+                        lg=7,
+                        className="pt-4",
+                    ),
+                ],
+                className="ms-1",
+            ),
+            dbc.Row(dbc.Col(footer)),
+        ],
+        fluid=True,
+    ))
+
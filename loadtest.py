@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of the running app through Dash's /_dash-update-component, the
+way browsers use it.
+
+    python loadtest.py                                  # 10 sessions for 20 s
+    python loadtest.py --sessions 50 --duration 60
+    python loadtest.py --configs 1x1,1x4,2x4,4x8        # workers x threads, one run each
+    python loadtest.py --url http://127.0.0.1:8050      # an app that is already running
+
+For each workers x threads configuration the app is started on a free port
+(gunicorn -c gunicorn.conf.py, or werkzeug's server when gunicorn isn't
+installed) and stopped again afterwards. Every session is a thread with its
+own keep-alive connection that behaves like one open page: it loads the
+layout, sends the first round of callbacks, then keeps dragging the year
+slider, switching indicators, paging and sorting the results table, zooming
+the weekly gas chart and changing the regional frequency. stored_data from
+each dashboard response goes into the session's next requests, like the
+dcc.Store does in the browser, and the clientside year_bounds callback is
+done here from the layout's year_bounds store.
+
+APP_* environment variables are passed on to the app. With
+APP_BACKGROUND_ENABLED=1 a regional request is timed until its job's result
+arrives, polled like the browser does. werkzeug forks a process per request
+when workers > 1, so only gunicorn numbers say anything about several workers.
+
+Reported per callback: requests, errors, requests per second, p50/p95/p99
+latency and the mean response size (gzip unless --no-compress). Results are
+written as JSON so runs can be compared.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+UPDATE_PATH = "/_dash-update-component"
+# first output of each server callback -> name in the report
+CALLBACKS = {
+    "line_chart.figure": "update_dashboard",
+    "results_table.data": "update_results_table",
+    "gas_weekly_chart.figure": "update_gas_weekly_graph",
+    "regional_trend_chart.figure": "update_regional_graphs",
+    "year_bounds.data": "update_area",
+}
+# relative weight of each thing a session does next
+ACTIONS = {
+    "drag": 6,
+    "indicator": 2,
+    "table": 2,
+    "gas_zoom": 1,
+    "regions": 1,
+}
+STARTUP_TIMEOUT = 120
+# seconds a session waits for a background job before counting it as failed
+JOB_TIMEOUT = 60
+
+# gunicorn isn't on every machine, werkzeug comes with dash. werkzeug runs
+# either processes or threads, not both
+WERKZEUG_SCRIPT = """
+import os, sys
+sys.path.insert(0, %(here)r)
+os.chdir(%(here)r)
+from werkzeug.serving import run_simple
+from wsgi import server
+workers, threads = %(workers)d, %(threads)d
+run_simple(%(host)r, %(port)d, server, threaded=threads > 1, processes=1 if threads > 1 else workers)
+"""
+
+
+
+"""
+==========================================================================
+Server
+"""
+
+def free_port(host):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def has_gunicorn():
+    import importlib.util
+    return importlib.util.find_spec("gunicorn") is not None
+
+
+def start_server(workers, threads, host="127.0.0.1", server="auto"):
+    # (process, url) of the app started with APP_* settings
+    port = free_port(host)
+    env = dict(
+        os.environ,
+        APP_HOST=host,
+        APP_PORT=str(port),
+        APP_WORKERS=str(workers),
+        APP_THREADS=str(threads),
+        APP_DEBUG="0",
+    )
+    if server == "gunicorn" or (server == "auto" and has_gunicorn()):
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+    else:
+        script = WERKZEUG_SCRIPT % {"here": HERE, "host": host, "port": port, "workers": workers, "threads": threads}
+        command = [sys.executable, "-c", script]
+    # the server's log goes to a file, a pipe nobody reads would fill up and
+    # stop the server
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    process.log = log
+
+    url = f"http://{host}:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"server exited: {log.read().decode(errors='replace')[-2000:]}")
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        try:
+            status, _, _ = request(connection, "GET", "/_dash-layout")
+            if status == 200:
+                return process, url
+        except (http.client.HTTPException, OSError):
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"server didn't answer within {STARTUP_TIMEOUT} s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    process.log.close()
+
+
+
+"""
+==========================================================================
+Sessions
+"""
+
+def request(connection, method, path, body=None, headers=None):
+    # (status, wire bytes, decoded body)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read()
+    size = len(data)
+    if response.getheader("Content-Encoding") == "gzip":
+        data = gzip.decompress(data)
+    return response.status, size, data
+
+
+def layout_values(layout):
+    # {"id.property": value} of every component in the layout
+    values = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            props = node.get("props")
+            if isinstance(props, dict) and "id" in props:
+                for name, value in props.items():
+                    values[f"{props['id']}.{name}"] = value
+            stack.extend(node.values())
+    return values
+
+
+def callback_body(dependency, values, changed):
+    # the request body dash-renderer sends for one callback
+    output = dependency["output"]
+    if output.startswith(".."):
+        outputs = [dict(zip(("id", "property"), part.rsplit(".", 1))) for part in output.strip(".").split("...")]
+    else:
+        outputs = dict(zip(("id", "property"), output.rsplit(".", 1)))
+    return {
+        "output": output,
+        "outputs": outputs,
+        "inputs": [dict(i, value=values.get(f"{i['id']}.{i['property']}")) for i in dependency["inputs"]],
+        "state": [dict(s, value=values.get(f"{s['id']}.{s['property']}")) for s in dependency["state"]],
+        "changedPropIds": changed,
+    }
+
+
+class Recorder:
+    # (callback, seconds, bytes, ok) of every request, from every session
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, size, ok):
+        with self._lock:
+            self.samples.append((name, seconds, size, ok))
+
+
+class Session:
+    # one open page
+    def __init__(self, url, dependencies, values, recorder, rng, compress=True, think=0.0, job_timeout=JOB_TIMEOUT):
+        parts = urllib.parse.urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        self.dependencies = dependencies
+        self.values = dict(values)
+        self.recorder = recorder
+        self.rng = rng
+        self.think = think
+        self.job_timeout = job_timeout
+        self.headers = {"Content-Type": "application/json"}
+        if compress:
+            self.headers["Accept-Encoding"] = "gzip"
+
+    def call(self, name, changed):
+        # send one callback and apply its outputs to the page. returns the ids
+        # of the components it updated
+        dependency = self.dependencies.get(name)
+        if dependency is None:
+            return set()
+        body = json.dumps(callback_body(dependency, self.values, changed))
+        start = time.perf_counter()
+        try:
+            status, size, data = request(self.connection, "POST", UPDATE_PATH, body, self.headers)
+            if status == 200 and dependency.get("background"):
+                status, size, data = self.wait(dependency, body, json.loads(data))
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.recorder.add(name, time.perf_counter() - start, 0, False)
+            return set()
+        self.recorder.add(name, time.perf_counter() - start, size, status in (200, 204))
+        response = json.loads(data).get("response", {}) if status == 200 else {}
+        for component, props in response.items():
+            for prop, value in props.items():
+                self.values[f"{component}.{prop}"] = value
+        if self.think:
+            time.sleep(self.rng.uniform(0, 2 * self.think))
+        return set(response)
+
+    def regional(self, changed):
+        # with background callbacks a cache miss comes back as regional_job,
+        # which the page then hands to the background job
+        if "regional_job" in self.call("update_regional_graphs", changed):
+            self.call("update_regional_graphs_job", ["regional_job.data"])
+
+    def wait(self, dependency, body, job):
+        # a background callback answers with its job, the browser then asks
+        # for the result every interval ms until it is there. a job that takes
+        # longer than job_timeout is given up on, status 0 marks it failed
+        path = f"{UPDATE_PATH}?" + urllib.parse.urlencode({"cacheKey": job["cacheKey"], "job": job["job"]})
+        interval = dependency["background"].get("interval", 1000) / 1000
+        deadline = time.monotonic() + self.job_timeout
+        while True:
+            if time.monotonic() >= deadline:
+                return 0, 0, b""
+            time.sleep(interval)
+            status, size, data = request(self.connection, "POST", path, body, self.headers)
+            if status != 200 or "response" in json.loads(data):
+                return status, size, data
+
+    def set_years(self, year_range):
+        self.values["year_range_slider.value"] = year_range
+        self.call("update_dashboard", ["year_range_slider.value"])
+
+    def bounds(self):
+        # what dashboard.year_bounds gives the slider for the current indicator
+        bounds = self.values["year_bounds.data"][self.values["indicator_dropdown.value"]]
+        return bounds["min"], bounds["max"]
+
+    def start(self):
+        # the callbacks a fresh page load sends
+        self.call("update_dashboard", [])
+        self.call("update_gas_weekly_graph", [])
+        self.regional([])
+
+    def drag(self):
+        # the slider moved a few times, each release is a request
+        first, last = self.bounds()
+        start, end = self.values.get("year_range_slider.value") or [first, last]
+        for _ in range(self.rng.randint(2, 6)):
+            if self.rng.random() < 0.5:
+                start = min(max(first, start + self.rng.choice((-1, 1))), end)
+            else:
+                end = max(min(last, end + self.rng.choice((-1, 1))), start)
+            self.set_years([start, end])
+
+    def indicator(self):
+        options = [option["value"] for option in self.values["indicator_dropdown.options"]]
+        self.values["indicator_dropdown.value"] = self.rng.choice(options)
+        first, last = self.bounds()
+        self.values["year_range_slider.value"] = [first, last]
+        self.call("update_dashboard", ["indicator_dropdown.value", "year_range_slider.value"])
+
+    def table(self):
+        # a few pages, sometimes sorted
+        if self.rng.random() < 0.5:
+            column = self.rng.choice(["Year", "Change", "Average"])
+            self.values["results_table.sort_by"] = [
+                {"column_id": column, "direction": self.rng.choice(["asc", "desc"])}
+            ]
+            self.values["results_table.page_current"] = 0
+            self.call("update_results_table", ["results_table.sort_by"])
+        for page in range(1, self.rng.randint(2, 4)):
+            self.values["results_table.page_current"] = page
+            self.call("update_results_table", ["results_table.page_current"])
+
+    def gas_zoom(self):
+        year = self.rng.randint(2017, 2023)
+        self.values["gas_weekly_chart.relayoutData"] = {
+            "xaxis.range[0]": f"{year}-01-01 00:00:00",
+            "xaxis.range[1]": f"{year + 1}-06-30 00:00:00",
+        }
+        self.call("update_gas_weekly_graph", ["gas_weekly_chart.relayoutData"])
+
+    def regions(self):
+        self.values["region_frequency.value"] = self.rng.choice(["weekly", "monthly", "yearly"])
+        self.regional(["region_frequency.value"])
+
+    def run(self, deadline):
+        self.start()
+        actions = list(ACTIONS)
+        weights = [ACTIONS[action] for action in actions]
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(actions, weights)[0])()
+        self.connection.close()
+
+
+
+"""
+==========================================================================
+Run
+"""
+
+def percentile(values, p):
+    # nearest rank, values sorted
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+
+def summarize(samples, seconds):
+    # {callback: stats}, plus "all"
+    groups = {}
+    for name, latency, size, ok in samples:
+        groups.setdefault(name, []).append((latency, size, ok))
+    groups["all"] = [(latency, size, ok) for _, latency, size, ok in samples]
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = sorted(latency * 1000 for latency, _, _ in group)
+        summary[name] = {
+            "requests": len(group),
+            "errors": sum(not ok for _, _, ok in group),
+            "rps": len(group) / seconds,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "mean_bytes": sum(size for _, size, _ in group) / len(group),
+        }
+    return summary
+
+
+def run_load(url, sessions, duration, seed=0, compress=True, think=0.0, job_timeout=JOB_TIMEOUT):
+    # the summary of sessions pages using the app at url for duration seconds
+    parts = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    _, _, layout = request(connection, "GET", "/_dash-layout")
+    _, _, dependencies = request(connection, "GET", "/_dash-dependencies")
+    connection.close()
+
+    values = layout_values(json.loads(layout))
+    by_name = {}
+    for dependency in json.loads(dependencies):
+        if dependency.get("clientside_function"):
+            continue
+        # outputs shared with another callback end in @<hash>
+        first = dependency["output"].strip(".").split("...")[0].split("@")[0]
+        if first in CALLBACKS:
+            suffix = "_job" if dependency.get("background") else ""
+            by_name[CALLBACKS[first] + suffix] = dependency
+
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(
+            target=Session(url, by_name, values, recorder, random.Random(seed + i), compress, think, job_timeout).run,
+            args=(deadline,),
+            name=f"session-{i}",
+        )
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(recorder.samples, time.perf_counter() - start)
+
+
+def print_summary(label, summary):
+    print(f"\n{label}")
+    print(f"{'callback':<26}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'bytes':>10}")
+    for name, stats in summary.items():
+        print(
+            f"{name:<26}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>9.1f}"
+            f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['mean_bytes']:>10,.0f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated pages")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per configuration")
+    parser.add_argument("--configs", default="1x4", help="comma separated workers x threads, e.g. 1x1,2x4")
+    parser.add_argument("--server", choices=("auto", "gunicorn", "werkzeug"), default="auto")
+    parser.add_argument("--url", help="load an app that is already running instead of starting one")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds a session waits between requests")
+    parser.add_argument("--job-timeout", type=float, default=JOB_TIMEOUT, help="seconds to wait for a background job")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-compress", action="store_true", help="don't ask for gzip responses")
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args(argv)
+
+    runs = {}
+    if args.url:
+        targets = [(args.url, None)]
+    else:
+        targets = []
+        for config in args.configs.split(","):
+            workers, threads = (int(part) for part in config.strip().lower().split("x"))
+            targets.append((None, (workers, threads)))
+
+    for url, config in targets:
+        process = None
+        label = url
+        if config is not None:
+            process, url = start_server(*config, server=args.server)
+            label = f"{config[0]} workers x {config[1]} threads"
+        try:
+            summary = run_load(
+                url, args.sessions, args.duration, args.seed, not args.no_compress, args.think, args.job_timeout
+            )
+        finally:
+            if process is not None:
+                stop_server(process)
+        print_summary(f"{label}, {args.sessions} sessions, {args.duration:g} s", summary)
+        runs[label] = summary
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sessions": args.sessions,
+            "duration": args.duration,
+            "think": args.think,
+            "runs": runs,
+        }, f, indent=2)
+    print(f"\nwrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Callback timings, payload sizes and cache counters, served in the Prometheus
+text format. Standard library only, so it is cheap to import everywhere.
+
+Each worker process counts its own requests and a scrape is answered by
+whichever worker gets it, so every series has a pid label. Sum over pid to
+get the totals of all workers.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)
+
+# the callback running on this thread, so stage() calls deep inside the figure
+# code are attributed to it without passing anything around
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.durations = {}
+        self.payloads = {}
+        self.cache = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe_duration(self, callback, stage, seconds):
+        with self._lock:
+            key = (callback, stage)
+            if key not in self.durations:
+                self.durations[key] = Histogram(DURATION_BUCKETS)
+            self.durations[key].observe(seconds)
+
+    def observe_payload(self, callback, size):
+        with self._lock:
+            if callback not in self.payloads:
+                self.payloads[callback] = Histogram(BYTES_BUCKETS)
+            self.payloads[callback].observe(size)
+
+    def count_cache(self, callback, hit):
+        with self._lock:
+            self.cache[(callback, "hit" if hit else "miss")] += 1
+
+    @contextmanager
+    def callback(self, name):
+        # time a whole callback. the stages it went through and when it
+        # returned are kept on the thread until last_request() collects them
+        # for the response
+        _local.current = (self, name, [])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _, _, stages = _local.current
+            stages.append(("total", elapsed))
+            self.observe_duration(name, "total", elapsed)
+            _local.current = None
+            _local.last = (name, stages, time.perf_counter())
+
+    def render(self):
+        lines = [
+            "# HELP dash_callback_duration_seconds Time spent in each callback and stage.",
+            "# TYPE dash_callback_duration_seconds histogram",
+        ]
+        # read here rather than in __init__, a preloading server forks the
+        # workers after the app was created
+        pid = f'pid="{os.getpid()}"'
+        with self._lock:
+            for (callback, stage), histogram in sorted(self.durations.items()):
+                labels = f'{pid},callback="{callback}",stage="{stage}"'
+                lines.extend(render_histogram("dash_callback_duration_seconds", labels, histogram))
+
+            lines.append("# HELP dash_callback_response_bytes Size of callback responses.")
+            lines.append("# TYPE dash_callback_response_bytes histogram")
+            for callback, histogram in sorted(self.payloads.items()):
+                labels = f'{pid},callback="{callback}"'
+                lines.extend(render_histogram("dash_callback_response_bytes", labels, histogram))
+
+            lines.append("# HELP dash_callback_cache_total Figure cache lookups by result.")
+            lines.append("# TYPE dash_callback_cache_total counter")
+            for (callback, result), count in sorted(self.cache.items()):
+                lines.append(f'dash_callback_cache_total{{{pid},callback="{callback}",result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def render_histogram(name, labels, histogram):
+    lines = []
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+@contextmanager
+def stage(name):
+    # time one stage of the current callback, a no-op outside of one
+    current = getattr(_local, "current", None)
+    if current is None:
+        yield
+        return
+    metrics, callback, stages = current
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stages.append((name, elapsed))
+        metrics.observe_duration(callback, name, elapsed)
+
+
+def count_cache(hit):
+    current = getattr(_local, "current", None)
+    if current is not None:
+        metrics, callback, _ = current
+        metrics.count_cache(callback, hit)
+
+
+def last_request():
+    # (callback name, [(stage, seconds), ...], perf_counter() when it returned)
+    # of the last callback this thread ran, cleared once read
+    last = getattr(_local, "last", None)
+    _local.last = None
+    return last
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-renders every dashboard state into a static site that any file server or
+CDN can serve without Python.
+
+    python prerender.py                           # build into build/site
+    python prerender.py --output public --workers 8
+    python prerender.py --force                   # render everything again
+
+Each (indicator, year range) the slider can produce is rendered once to
+states/<indicator>/<start>-<end>.json: the line and bar figures, the change
+statement and the results table split into pages. site/index.html and
+site/loader.js are copied next to them along with plotly.js. States are
+rendered in parallel by a process pool. manifest.json records a digest of
+the rows each state was built from, so a later run only renders the states
+whose years changed in the asset files.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import data
+import indicators
+
+
+SITE_DIR = os.path.join(HERE, "site")
+PAGE_SIZE = 15
+# the modules a state's output comes from. editing one of them (or this
+# file) renders every state again
+SOURCES = ("data.py", "figures.py", "indicators.py", "results.py", "prerender.py")
+
+
+
+"""
+==========================================================================
+States
+"""
+
+def code_signature():
+    digest = hashlib.blake2b(str(PAGE_SIZE).encode(), digest_size=16)
+    for name in SOURCES:
+        with open(os.path.join(HERE, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def state_id(selected_indicator, year_range):
+    return f"{indicators.by_name(selected_indicator).key}/{year_range[0]}-{year_range[1]}"
+
+
+def state_digests(dataset):
+    # {state id: digest of every row in its years}. a state's figures,
+    # statement and table only depend on those rows (see data.RangeStats),
+    # so the digest changes exactly when the state has to be rendered again
+    repository = dataset.repository
+    names = list(repository.columns)
+    rows = [
+        hashlib.blake2b(b"".join(repository.columns[name][i].tobytes() for name in names), digest_size=16).digest()
+        for i in range(len(repository))
+    ]
+
+    digests = {}
+    for selected_indicator in indicators.selectable():
+        for year_range in dataset.year_ranges(selected_indicator.name):
+            lo, hi = repository.bounds(*year_range)
+            digest = hashlib.blake2b(selected_indicator.name.encode(), digest_size=16)
+            for row in rows[lo:hi]:
+                digest.update(row)
+            digests[state_id(selected_indicator.name, year_range)] = digest.hexdigest()
+    return digests
+
+
+def state_path(output, state):
+    return os.path.join(output, "states", *f"{state}.json".split("/"))
+
+
+
+"""
+==========================================================================
+Rendering
+"""
+
+# set in each pool process by init_worker()
+_worker = {}
+
+
+def init_worker(cache_enabled):
+    import figures
+    _worker["figures"] = figures
+    _worker["dataset"] = data.load_dataset(cache_enabled)
+
+
+def render_state(selected_indicator, year_range):
+    import results
+    dataset = _worker["dataset"]
+    figures = _worker["figures"]
+    line_fig, bar_fig, change_statement, table = figures.build_dashboard(
+        dataset.repository, dataset.stats, selected_indicator, list(year_range)
+    )
+    rows = results.to_rows(table)
+    return {
+        "line": line_fig,
+        "bar": bar_fig,
+        "statement": change_statement,
+        "pages": [rows[i:i + PAGE_SIZE] for i in range(0, len(rows), PAGE_SIZE)],
+    }
+
+
+def render_batch(output, states):
+    # render and write a batch of (indicator, year range), in a pool process
+    for selected_indicator, year_range in states:
+        path = state_path(output, state_id(selected_indicator, year_range))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json(path, render_state(selected_indicator, year_range))
+    return len(states)
+
+
+def write_json(path, value):
+    # written next to the target and renamed, so a server never sends half a file
+    temporary = f"{path}.tmp{os.getpid()}"
+    if orjson is not None:
+        with open(temporary, "wb") as f:
+            f.write(orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(temporary, "w") as f:
+            json.dump(value, f, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+
+"""
+==========================================================================
+Build
+"""
+
+def make_manifest(dataset, signature, digests):
+    # everything loader.js needs besides the states
+    return {
+        "signature": signature,
+        "base": indicators.base().name,
+        "default_indicator": indicators.selectable()[0].name,
+        "page_size": PAGE_SIZE,
+        "indicators": {
+            indicator.name: {
+                "key": indicator.key,
+                "first": dataset.indicator_years[indicator.name][0],
+                "last": dataset.indicator_years[indicator.name][1],
+            }
+            for indicator in indicators.selectable()
+        },
+        # results table columns and how loader.js formats them
+        "columns": [
+            {"name": "Year"},
+            {"name": "Change"},
+            {"name": "Average"},
+            {"name": "CAGR", "percent": True, "decimals": 1},
+            {"name": "Correlation", "decimals": 2},
+        ] + [
+            {
+                "name": indicator.name,
+                "prefix": indicator.prefix,
+                "suffix": indicator.suffix,
+                "decimals": indicator.decimals,
+            }
+            for indicator in indicators.REGISTRY
+        ],
+        "states": digests,
+    }
+
+
+def read_manifest(output):
+    try:
+        with open(os.path.join(output, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def copy_site(output):
+    os.makedirs(output, exist_ok=True)
+    for name in os.listdir(SITE_DIR):
+        shutil.copyfile(os.path.join(SITE_DIR, name), os.path.join(output, name))
+    plotly_js = os.path.join(output, "plotly.min.js")
+    if not os.path.exists(plotly_js):
+        import plotly.offline
+        with open(plotly_js, "w", encoding="utf-8") as f:
+            f.write(plotly.offline.get_plotlyjs())
+
+
+def build(output, workers=None, force=False, cache_enabled=True, batch_size=50):
+    # returns (states rendered, states in the site)
+    dataset = data.load_dataset(cache_enabled)
+    signature = code_signature()
+    digests = state_digests(dataset)
+
+    old = read_manifest(output)
+    if force or old.get("signature") != signature:
+        old_digests = {}
+    else:
+        old_digests = old.get("states", {})
+
+    todo = [
+        (indicator.name, year_range)
+        for indicator in indicators.selectable()
+        for year_range in dataset.year_ranges(indicator.name)
+        if old_digests.get(state_id(indicator.name, year_range)) != digests[state_id(indicator.name, year_range)]
+        or not os.path.exists(state_path(output, state_id(indicator.name, year_range)))
+    ]
+
+    copy_site(output)
+    if todo:
+        batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cache_enabled,)) as pool:
+            for _ in pool.map(render_batch, [output] * len(batches), batches):
+                pass
+
+    # states that can't be reached any more, e.g. after a series was shortened
+    for state in set(old.get("states", {})) - set(digests):
+        try:
+            os.remove(state_path(output, state))
+        except OSError:
+            pass
+
+    # the manifest goes last, so an interrupted build is redone next time
+    write_json(os.path.join(output, "manifest.json"), make_manifest(dataset, signature, digests))
+    return len(todo), len(digests)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=os.path.join("build", "site"))
+    parser.add_argument("--workers", type=int, default=None, help="pool processes, default one per CPU")
+    parser.add_argument("--force", action="store_true", help="render every state, not only changed ones")
+    parser.add_argument("--no-ingest-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    os.chdir(HERE)
+    start = time.perf_counter()
+    rendered, total = build(args.output, args.workers, args.force, not args.no_ingest_cache)
+    print(f"rendered {rendered} of {total} states into {args.output} in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
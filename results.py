@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+The results table: each session's history of rows kept as numpy columns, and
+the paging, sorting and filtering behind the table's custom page/sort/filter
+actions. Only the rows of the visible page are ever turned into dicts.
+"""
+from collections import OrderedDict
+import math
+import re
+import threading
+import uuid
+
+import numpy as np
+
+import indicators
+
+
+# text columns (their unit depends on the row's indicator) and the numeric
+# column used to sort and compare them. columns starting with "_" are never
+# sent to the browser
+SORT_KEYS = {"Change": "_change", "Average": "_average"}
+
+
+def table_columns():
+    # column name -> dtype of a results table
+    columns = {"Year": np.int64}
+    for name, key in SORT_KEYS.items():
+        columns[name] = object
+        columns[key] = np.float64
+    columns["CAGR"] = np.float64
+    columns["Correlation"] = np.float64
+    for indicator in indicators.REGISTRY:
+        columns[indicator.name] = np.float64
+    return columns
+
+
+def from_rows(rows):
+    # columns from rows as the browser sends them back (client history mode)
+    columns = {}
+    for name, dtype in table_columns().items():
+        values = [row.get(name) for row in rows]
+        if dtype is not np.float64:
+            columns[name] = np.array(values, dtype=dtype)
+        else:
+            columns[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    for key in SORT_KEYS.values():
+        if rows and key not in rows[0]:
+            del columns[key]
+    return columns
+
+
+def to_rows(columns, positions=None, hidden=False):
+    # the rows at positions as dicts, NaN as None. hidden keeps the "_"
+    # columns, for rows that come back through from_rows()
+    names = [name for name in columns if hidden or not name.startswith("_")]
+    if positions is None:
+        values = [columns[name].tolist() for name in names]
+    else:
+        values = [columns[name][positions].tolist() for name in names]
+    values = [[None if value != value else value for value in column] for column in values]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+
+"""
+==========================================================================
+Filtering and Sorting
+"""
+
+# the filter_query syntax DataTable writes: {column} operator value, joined by
+# " && ". operators may have an i (case insensitive) or s (sensitive) prefix
+FILTER_PART = re.compile(
+    r"^\s*\{(?P<column>[^}]+)\}\s*"
+    r"(?P<operator>[is]?(?:>=|<=|!=|=|<|>|eq|ne|lt|le|gt|ge|contains|datestartswith))\s*"
+    r"(?P<value>.+?)\s*$"
+)
+
+OPERATORS = {
+    ">=": "ge", "<=": "le", "!=": "ne", "=": "eq", "<": "lt", ">": "gt",
+}
+
+
+def parse_filter(filter_query):
+    # [(column, operator, value, case_sensitive)]. parts that can't be parsed are skipped
+    parts = []
+    for part in (filter_query or "").split(" && "):
+        match = FILTER_PART.match(part)
+        if match is None:
+            continue
+        operator = match["operator"]
+        case_sensitive = not operator.startswith("i")
+        if operator[0] in "is":
+            operator = operator[1:]
+        operator = OPERATORS.get(operator, operator)
+
+        value = match["value"]
+        if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'`":
+            value = value[1:-1].replace("\\" + value[0], value[0])
+        parts.append((match["column"], operator, value, case_sensitive))
+    return parts
+
+
+def to_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def compare(values, operator, value):
+    if operator == "eq":
+        return values == value
+    if operator == "ne":
+        return values != value
+    if operator == "lt":
+        return values < value
+    if operator == "le":
+        return values <= value
+    if operator == "gt":
+        return values > value
+    if operator == "ge":
+        return values >= value
+    raise ValueError(operator)
+
+
+def matches(columns, order, column, operator, value, case_sensitive=True):
+    # mask over order of the rows that pass one filter part
+    if column not in columns:
+        return np.ones(len(order), dtype=bool)
+    values = columns[column][order]
+
+    number = to_number(value)
+    if operator in ("contains", "datestartswith") or values.dtype == object:
+        key = SORT_KEYS.get(column)
+        if key in columns and number is not None and operator not in ("eq", "ne", "contains"):
+            # "> 0" on Change compares the numbers, not the text
+            return compare(columns[key][order], operator, number)
+        text = values.astype(str)
+        if not case_sensitive:
+            text = np.char.lower(text)
+            value = value.lower()
+        if operator == "contains":
+            return np.char.find(text, value) >= 0
+        if operator == "datestartswith":
+            return np.char.startswith(text, value)
+        if operator in ("eq", "ne"):
+            return compare(text, operator, value)
+        return np.zeros(len(order), dtype=bool)
+
+    if number is None:
+        # a number column against text matches nothing
+        return np.full(len(order), operator == "ne")
+    return compare(values, operator, number)
+
+
+def select(columns, order, sort_by=(), filter_query=""):
+    # the positions in order that pass filter_query, sorted by sort_by
+    # ([(column, "asc" or "desc")]). the sort is stable, so equal rows keep
+    # their order (newest first)
+    for column, operator, value, case_sensitive in parse_filter(filter_query):
+        order = order[matches(columns, order, column, operator, value, case_sensitive)]
+
+    keys = []
+    # lexsort sorts by the last key first
+    for column, direction in reversed(sort_by):
+        if SORT_KEYS.get(column) in columns:
+            column = SORT_KEYS[column]
+        if column not in columns:
+            continue
+        values = columns[column][order]
+        if values.dtype == object:
+            # rank the text so it can be negated like numbers
+            values = np.unique(values.astype(str), return_inverse=True)[1]
+        keys.append(-values if direction == "desc" else values)
+    if keys:
+        order = order[np.lexsort(keys)]
+    return order
+
+
+def page_count(rows, page_size):
+    return max(1, math.ceil(rows / page_size))
+
+
+def query_rows(rows, page_current=0, page_size=15, sort_by=(), filter_query=""):
+    # ResultsHistory.query() over rows kept in the browser
+    columns = from_rows(rows)
+    order = select(columns, np.arange(len(rows)), sort_by, filter_query)
+    start = page_current * page_size
+    return to_rows(columns, order[start:start + page_size]), page_count(len(order), page_size)
+
+
+
+"""
+==========================================================================
+History
+"""
+
+class ResultsHistory:
+    # one session's rows, newest first, in numpy columns used as a ring buffer
+    # of at most max_rows rows. the columns grow as rows are added, so short
+    # sessions stay small. the last filtered and sorted order is kept, so
+    # moving between pages doesn't sort again
+    def __init__(self, max_rows, initial_size=64):
+        self.max_rows = max_rows
+        self.columns = {
+            name: np.empty(min(initial_size, max_rows), dtype=dtype)
+            for name, dtype in table_columns().items()
+        }
+        self.size = 0
+        self.next = 0
+        self.version = 0
+        self._query = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        # pickled by SharedHistoryStore, without the lock and the kept order
+        state = dict(self.__dict__)
+        del state["_lock"]
+        state["_query"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def allocated(self):
+        return len(self.columns["Year"])
+
+    def positions(self, start, stop):
+        # where rows start..stop (newest first) are stored. each batch is
+        # written in reverse, so it reads back in year order
+        return (self.next - 1 - np.arange(start, stop)) % self.allocated()
+
+    def _grow(self, rows):
+        needed = min(self.size + rows, self.max_rows)
+        allocated = self.allocated()
+        if needed <= allocated:
+            return
+        allocated = min(max(needed, 2 * allocated), self.max_rows)
+        stored = self.positions(0, self.size)[::-1]
+        for name, values in self.columns.items():
+            grown = np.empty(allocated, dtype=values.dtype)
+            grown[:self.size] = values[stored]
+            self.columns[name] = grown
+        self.next = self.size
+
+    def add(self, table):
+        # add a batch of rows (a dict of columns, see figures.make_table) in
+        # front of the others. returns the new version
+        with self._lock:
+            rows = min(len(table["Year"]), self.max_rows)
+            self._grow(rows)
+            allocated = self.allocated()
+            at = (self.next + np.arange(rows)) % allocated
+            for name, values in self.columns.items():
+                values[at] = table[name][:rows][::-1]
+            self.next = (self.next + rows) % allocated
+            self.size = min(self.size + rows, allocated)
+            self.version += 1
+            self._query = None
+            return self.version
+
+    def query(self, page_current=0, page_size=15, sort_by=(), filter_query=""):
+        # (rows of the page, number of pages)
+        with self._lock:
+            sort_by = tuple(sort_by)
+            start = page_current * page_size
+            if not sort_by and not filter_query:
+                # newest first, nothing to sort: only the page is looked at
+                stop = min(start + page_size, self.size)
+                positions = self.positions(start, max(start, stop))
+                return to_rows(self.columns, positions), page_count(self.size, page_size)
+
+            key = (sort_by, filter_query)
+            if self._query is None or self._query[0] != key:
+                order = select(self.columns, self.positions(0, self.size), sort_by, filter_query)
+                self._query = (key, order)
+            order = self._query[1]
+            return to_rows(self.columns, order[start:start + page_size]), page_count(len(order), page_size)
+
+
+class HistoryStore:
+    # per-session ResultsHistory, sessions are evicted least recently used
+    # once there are too many
+    def __init__(self, max_rows=300, max_sessions=1000):
+        self.max_rows = max_rows
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, token):
+        with self._lock:
+            return token in self._sessions
+
+    def new_session(self):
+        with self._lock:
+            return self._create()
+
+    def _create(self):
+        # with self._lock held
+        token = uuid.uuid4().hex
+        self._sessions[token] = ResultsHistory(self.max_rows)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token):
+        with self._lock:
+            history = self._sessions.get(token)
+            if history is not None:
+                self._sessions.move_to_end(token)
+            return history
+
+    def add(self, token, table):
+        # add the rows to the session's history, or to a new session if token
+        # is unknown (first visit, evicted, server restarted). one step under
+        # the lock, so another session can't evict it in between. returns
+        # (token, history)
+        with self._lock:
+            if token not in self._sessions:
+                token = self._create()
+            self._sessions.move_to_end(token)
+            history = self._sessions[token]
+            history.add(table)
+            return token, history
+
+
+class SharedHistoryStore:
+    # the same as HistoryStore, but every session's ResultsHistory is pickled
+    # into a diskcache.Cache, so all worker processes see it. sessions expire
+    # expire seconds after their last new rows, and the cache's size limit
+    # drops the least recently stored ones first
+    def __init__(self, cache, max_rows=300, expire=86400):
+        self.cache = cache
+        self.max_rows = max_rows
+        self.expire = expire
+
+    def __contains__(self, token):
+        return ("history", token) in self.cache
+
+    def new_session(self):
+        token = uuid.uuid4().hex
+        self.cache.set(("history", token), ResultsHistory(self.max_rows), expire=self.expire)
+        return token
+
+    def get(self, token):
+        # a copy of the session's history, None if there is none
+        return self.cache.get(("history", token))
+
+    def add(self, token, table):
+        # read, add and write back in one transaction, so two workers adding
+        # to the same session don't lose each other's rows
+        with self.cache.transact():
+            history = self.cache.get(("history", token)) if token else None
+            if history is None:
+                token = uuid.uuid4().hex
+                history = ResultsHistory(self.max_rows)
+            history.add(table)
+            self.cache.set(("history", token), history, expire=self.expire)
+        return token, history
@@ -0,0 +1,117 @@
+// Loader for the pre-rendered site (see prerender.py). Every dashboard state
+// is a JSON file under states/, so switching the indicator or the years is
+// one fetch of a static file, and nothing runs on a server.
+
+(function () {
+    var manifest = null;
+    var states = {};
+    var current = null;
+    var page = 0;
+
+    function $(id) {
+        return document.getElementById(id);
+    }
+
+    function formatNumber(value, decimals) {
+        return value.toLocaleString("en-US", {
+            minimumFractionDigits: decimals,
+            maximumFractionDigits: decimals,
+        });
+    }
+
+    function formatCell(column, value) {
+        // the same formats the results table uses
+        if (value === null || value === undefined) {
+            return "";
+        }
+        if (typeof value === "string" || column.decimals === undefined) {
+            return String(value);
+        }
+        if (column.percent) {
+            return formatNumber(value * 100, column.decimals) + "%";
+        }
+        return (column.prefix || "") + formatNumber(value, column.decimals) + (column.suffix || "");
+    }
+
+    function fillYears(select, first, last, value) {
+        select.innerHTML = "";
+        for (var year = first; year <= last; year++) {
+            select.add(new Option(String(year), String(year)));
+        }
+        select.value = String(value);
+    }
+
+    function load(key, start, end) {
+        var id = key + "/" + start + "-" + end;
+        if (!states[id]) {
+            states[id] = fetch("states/" + id + ".json").then(function (response) {
+                if (!response.ok) {
+                    throw new Error(id + ": " + response.status);
+                }
+                return response.json();
+            });
+        }
+        return states[id];
+    }
+
+    function renderTable() {
+        var pages = current.pages;
+        page = Math.min(Math.max(page, 0), Math.max(pages.length - 1, 0));
+        var rows = pages[page] || [];
+        $("results_table").tBodies[0].innerHTML = rows.map(function (row) {
+            return "<tr>" + manifest.columns.map(function (column) {
+                return "<td>" + formatCell(column, row[column.name]) + "</td>";
+            }).join("") + "</tr>";
+        }).join("");
+        $("page").textContent = (page + 1) + " / " + Math.max(pages.length, 1);
+    }
+
+    function update() {
+        var name = $("indicator").value;
+        var indicator = manifest.indicators[name];
+        var start = Number($("start").value);
+        var end = Number($("end").value);
+        if (start < indicator.first || start > indicator.last) {
+            start = indicator.first;
+        }
+        if (end > indicator.last || end < start) {
+            end = Math.max(start, Math.min(end, indicator.last));
+        }
+        fillYears($("start"), indicator.first, indicator.last, start);
+        fillYears($("end"), indicator.first, indicator.last, end);
+
+        load(indicator.key, start, end).then(function (state) {
+            current = state;
+            Plotly.react("line_chart", state.line.data, state.line.layout);
+            Plotly.react("bar_graph", state.bar.data, state.bar.layout);
+            $("statement").textContent = state.statement;
+            page = 0;
+            renderTable();
+        });
+    }
+
+    fetch("manifest.json").then(function (response) {
+        return response.json();
+    }).then(function (loaded) {
+        manifest = loaded;
+        var select = $("indicator");
+        Object.keys(manifest.indicators).forEach(function (name) {
+            select.add(new Option(name, name));
+        });
+        select.value = manifest.default_indicator;
+        var indicator = manifest.indicators[manifest.default_indicator];
+        fillYears($("start"), indicator.first, indicator.last, indicator.first);
+        fillYears($("end"), indicator.first, indicator.last, indicator.last);
+
+        $("results_table").tHead.innerHTML = "<tr>" + manifest.columns.map(function (column) {
+            return "<th>" + column.name + "</th>";
+        }).join("") + "</tr>";
+
+        ["indicator", "start", "end"].forEach(function (id) {
+            $(id).addEventListener("change", update);
+        });
+        $("previous").addEventListener("click", function () { page--; renderTable(); });
+        $("next").addEventListener("click", function () { page++; renderTable(); });
+        update();
+    });
+})();
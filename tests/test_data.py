@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data
+import indicators
+
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+
+"""
+==========================================================================
+RangeStats
+"""
+
+def make_repository(rows=40, seed=1):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({"Year": np.arange(1980, 1980 + rows)})
+    for indicator in indicators.REGISTRY:
+        values = rng.normal(1e5, 1e4, rows)
+        values[rng.random(rows) < 0.2] = np.nan
+        frame[indicator.name] = values
+    return data.DataRepository(frame)
+
+
+def test_range_stats_match_naive():
+    repository = make_repository()
+    stats = data.RangeStats(repository, indicators.base().name)
+    years = repository.keys
+    for indicator in indicators.REGISTRY:
+        column = repository.columns[indicator.name]
+        for lo in range(len(years)):
+            for hi in range(lo + 1, len(years) + 1):
+                result = stats.query(indicator.name, years[lo], years[hi - 1])
+                window = column[lo:hi][~np.isnan(column[lo:hi])]
+                assert result["count"] == len(window)
+                if not len(window):
+                    assert np.isnan(result["mean"]) and np.isnan(result["min"]) and np.isnan(result["max"])
+                    continue
+                assert result["mean"] * result["count"] == pytest.approx(window.sum())
+                assert result["min"] == window.min()
+                assert result["max"] == window.max()
+                if len(window) > 1:
+                    assert result["variance"] == pytest.approx(window.var(ddof=1))
+
+
+def test_range_stats_correlation():
+    repository = make_repository()
+    stats = data.RangeStats(repository, indicators.base().name)
+    x = repository.columns[indicators.base().name]
+    name = indicators.selectable()[0].name
+    y = repository.columns[name]
+    both = ~np.isnan(x) & ~np.isnan(y)
+    result = stats.query(name, 1980, 2019)
+    assert result["covariance"] == pytest.approx(np.cov(x[both], y[both])[0, 1])
+    assert result["correlation"] == pytest.approx(np.corrcoef(x[both], y[both])[0, 1])
+
+
+def test_range_stats_empty_window():
+    repository = make_repository()
+    stats = data.RangeStats(repository, indicators.base().name)
+    result = stats.query(indicators.base().name, 2100, 2200)
+    assert result["count"] == 0
+    assert np.isnan(result["mean"]) and np.isnan(result["min"])
+
+
+
+"""
+==========================================================================
+CsvTail
+"""
+
+def replace(path, text):
+    # like a writer should: write elsewhere, then rename over the file
+    with open(f"{path}.tmp", "w", newline="") as f:
+        f.write(text)
+    os.replace(f"{path}.tmp", path)
+
+
+def test_csv_tail_appended(tmp_path):
+    path = str(tmp_path / "series.csv")
+    replace(path, "Date,Value\n2020-01-01,1\n2021-01-01,\n")
+    tail = data.CsvTail(path)
+    assert tail.read_new() == b""
+    # the last row's value came in, and a new row
+    replace(path, "Date,Value\n2020-01-01,1\n2021-01-01,2\n2022-01-01,3\n")
+    assert tail.read_new() == b"2021-01-01,2\n2022-01-01,3\n"
+    assert tail.read_new() == b""
+    replace(path, "Date,Value\n2020-01-01,1\n2021-01-01,2\n2022-01-01,3\n2023-01-01,4\n")
+    assert tail.read_new() == b"2023-01-01,4\n"
+
+
+def test_csv_tail_prepended(tmp_path):
+    path = str(tmp_path / "weekly.csv")
+    replace(path, "Date,Value\n01/08/2024,2\n01/01/2024,1\n")
+    tail = data.CsvTail(path)
+    replace(path, "Date,Value\n01/22/2024,4\n01/15/2024,3\n01/08/2024,2\n01/01/2024,1\n")
+    assert tail.read_new() == b"01/22/2024,4\n01/15/2024,3\n"
+
+
+@pytest.mark.parametrize("text", [
+    "Date,Value\n2020-01-01,9\n2021-01-01,\n",
+    "Date,Value\n2020-01-01,1\n",
+    "Date,Price\n2020-01-01,1\n2021-01-01,\n2022-01-01,3\n",
+    "Date,Value\n2019-01-01,0\n2020-01-01,1\n2021-01-01,\n2022-01-01,3\n",
+])
+def test_csv_tail_rejects_other_changes(tmp_path, text):
+    path = str(tmp_path / "series.csv")
+    replace(path, "Date,Value\n2020-01-01,1\n2021-01-01,\n")
+    tail = data.CsvTail(path)
+    replace(path, text)
+    with pytest.raises(ValueError):
+        tail.read_new()
+
+
+def split_assets(directory):
+    # copies of the asset files without their newest rows, and the sources
+    # reading them
+    sources = []
+    full = {}
+    for indicator in indicators.REGISTRY:
+        with open(os.path.join(HERE, indicator.file), newline="") as f:
+            lines = f.readlines()
+        path = str(directory / os.path.basename(indicator.file))
+        if indicator.key == data.GAS_KEY:
+            # newest first
+            replace(path, lines[0] + "".join(lines[12:]))
+        else:
+            replace(path, "".join(lines[:-3]))
+        full[path] = "".join(lines)
+        sources.append(indicator.with_source(path, indicator.series_id))
+    return tuple(sources), full
+
+
+def test_refresh_matches_full_reload(tmp_path):
+    sources, full = split_assets(tmp_path)
+    dataset = data.Dataset(data.load_frames(sources), sources)
+    watcher = data.AssetWatcher({indicator.key: indicator.file for indicator in sources})
+    for path, text in full.items():
+        replace(path, text)
+
+    updated, affected = dataset.updated(watcher.poll())
+    reloaded = data.Dataset(data.load_frames(sources), sources)
+    assert affected
+    pd.testing.assert_frame_equal(updated.df, reloaded.df)
+    for name, values in reloaded.gas_weekly.columns.items():
+        np.testing.assert_array_equal(updated.gas_weekly.columns[name], values)
+    assert updated.indicator_years == reloaded.indicator_years
+    for indicator in indicators.selectable():
+        first, last = reloaded.indicator_years[indicator.name]
+        assert updated.stats.query(indicator.name, first, last) == pytest.approx(
+            reloaded.stats.query(indicator.name, first, last), nan_ok=True
+        )
+    for frequency in data.GAS_FREQUENCIES:
+        old, new = updated.regional_gas[frequency], reloaded.regional_gas[frequency]
+        np.testing.assert_array_equal(old.region_names, new.region_names)
+        np.testing.assert_array_equal(old.periods, new.periods)
+        np.testing.assert_allclose(old.prices, new.prices)
+        np.testing.assert_allclose(old.spreads, new.spreads, atol=1e-12)
+
+
+
+"""
+==========================================================================
+DatasetCache
+"""
+
+def test_dataset_cache_evicts_least_recently_used():
+    evicted = []
+    cache = data.DatasetCache(2, lambda key: f"dataset {key}", evicted.append)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    assert cache.get("c") == "dataset c"
+    assert evicted == ["b"]
+    assert "a" in cache and "b" not in cache
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import figures
+
+
+def series(n, seed=2):
+    rng = np.random.default_rng(seed)
+    return np.arange(n, dtype=np.float64), np.cumsum(rng.normal(0, 1, n))
+
+
+@pytest.mark.parametrize("n, threshold", [(10, 3), (100, 10), (1000, 999), (1001, 50), (5000, 1000)])
+def test_lttb_keeps_endpoints_and_size(n, threshold):
+    x, y = series(n)
+    index = figures.lttb(x, y, threshold)
+    assert len(index) == threshold
+    assert index[0] == 0
+    assert index[-1] == n - 1
+    assert (np.diff(index) > 0).all()
+
+
+@pytest.mark.parametrize("threshold", [0, 2, 100, 150])
+def test_lttb_keeps_everything_when_it_cannot_reduce(threshold):
+    x, y = series(100)
+    assert figures.lttb(x, y, threshold).tolist() == list(range(100))
+
+
+def test_lttb_keeps_peaks():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[337] = 10
+    y[712] = -10
+    index = figures.lttb(x, y, 20)
+    assert 337 in index
+    assert 712 in index
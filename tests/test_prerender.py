@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pandas as pd
+import pytest
+
+import data
+import figures
+import indicators
+import prerender
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    sources = tuple(
+        indicator.with_source(os.path.join(prerender.HERE, indicator.file), indicator.series_id)
+        for indicator in indicators.REGISTRY
+    )
+    return data.Dataset(data.load_frames(sources), sources)
+
+
+def test_state_digests_cover_every_state(dataset):
+    digests = prerender.state_digests(dataset)
+    expected = {
+        prerender.state_id(indicator.name, year_range)
+        for indicator in indicators.selectable()
+        for year_range in dataset.year_ranges(indicator.name)
+    }
+    assert set(digests) == expected
+
+
+def test_state_digests_change_with_their_years(dataset):
+    indicator = indicators.by_key("unemployment")
+    year = dataset.indicator_years[indicator.name][1] - 2
+    rows = pd.DataFrame({indicator.date_column: [f"{year}-01-01"], indicator.series_id: [99.9]})
+    updated, affected = dataset.updated({indicator.key: rows})
+    assert affected == {year}
+
+    old = prerender.state_digests(dataset)
+    new = prerender.state_digests(updated)
+    assert set(old) == set(new)
+    for state, digest in old.items():
+        start, end = (int(value) for value in state.split("/")[1].split("-"))
+        assert (digest != new[state]) == (start <= year <= end)
+
+
+def test_render_state_pages(dataset, monkeypatch):
+    monkeypatch.setitem(prerender._worker, "dataset", dataset)
+    monkeypatch.setitem(prerender._worker, "figures", figures)
+    indicator = indicators.selectable()[0]
+    first, last = dataset.indicator_years[indicator.name]
+    state = prerender.render_state(indicator.name, (first, last))
+    rows = [row for page in state["pages"] for row in page]
+    assert [row["Year"] for row in rows] == [
+        int(year) for year in dataset.repository.keys if first <= year <= last
+    ]
+    assert all(len(page) <= prerender.PAGE_SIZE for page in state["pages"])
+    assert len(state["pages"][0]) == min(prerender.PAGE_SIZE, len(rows))
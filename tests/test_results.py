@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import results
+
+
+def make_table(years, change=None):
+    # a results table as figures.make_table() returns it, one row per year
+    rows = len(years)
+    table = {"Year": np.array(years, dtype=np.int64)}
+    for name, dtype in results.table_columns().items():
+        if name != "Year":
+            table[name] = np.full(rows, np.nan if dtype is np.float64 else None, dtype=dtype)
+    values = np.arange(rows, dtype=np.float64) if change is None else np.array(change, dtype=np.float64)
+    table["_change"] = values
+    table["Change"] = np.array([f"{value:+.1f}%" for value in values], dtype=object)
+    return table
+
+
+def years(rows):
+    return [row["Year"] for row in rows]
+
+
+
+"""
+==========================================================================
+Filtering
+"""
+
+def test_parse_filter():
+    query = '{Year} >= 2010 && {Change} icontains "up" && {CAGR} s< 0.5'
+    assert results.parse_filter(query) == [
+        ("Year", "ge", "2010", True),
+        ("Change", "contains", "up", False),
+        ("CAGR", "lt", "0.5", True),
+    ]
+
+
+def test_parse_filter_unquotes_values():
+    assert results.parse_filter(r"{Change} = 'it\'s'") == [("Change", "eq", "it's", True)]
+    assert results.parse_filter('{Change} = "a"') == [("Change", "eq", "a", True)]
+
+
+@pytest.mark.parametrize("query", [
+    None, "", "Year > 2000", "{Year}", "{Year} >", "{Year} ~ 2000", "{} = 1", "{Year} between 1 2",
+])
+def test_parse_filter_skips_bad_parts(query):
+    assert results.parse_filter(query) == []
+
+
+def test_parse_filter_keeps_good_parts():
+    assert results.parse_filter("garbage && {Year} > 2000 && {Year} ??") == [("Year", "gt", "2000", True)]
+
+
+def test_select_filters():
+    columns = results.from_rows(results.to_rows(make_table([2001, 2002, 2003, 2004]), hidden=True))
+    order = np.arange(4)
+    assert columns["Year"][results.select(columns, order, filter_query="{Year} > 2002")].tolist() == [2003, 2004]
+    assert columns["Year"][results.select(columns, order, filter_query="{Year} le 2002 && {Year} ne 2001")].tolist() == [2002]
+    # Change is text, but compared as its number
+    assert columns["Year"][results.select(columns, order, filter_query="{Change} >= 2")].tolist() == [2003, 2004]
+    assert columns["Year"][results.select(columns, order, filter_query="{Change} contains 1.0")].tolist() == [2002]
+    assert columns["Year"][results.select(columns, order, filter_query="{Change} = +3.0%")].tolist() == [2004]
+
+
+def test_select_rejects_bad_values():
+    columns = results.from_rows(results.to_rows(make_table([2001, 2002, 2003]), hidden=True))
+    order = np.arange(3)
+    # a number column against text matches nothing, or everything for !=
+    assert len(results.select(columns, order, filter_query="{Year} > abc")) == 0
+    assert len(results.select(columns, order, filter_query="{Year} != abc")) == 3
+    # unknown columns and unparsable parts don't filter
+    assert len(results.select(columns, order, filter_query="{Nope} > 1")) == 3
+    assert len(results.select(columns, order, filter_query="{Year} >")) == 3
+
+
+
+"""
+==========================================================================
+Sorting
+"""
+
+def test_select_sorts():
+    columns = results.from_rows(results.to_rows(make_table([2001, 2002, 2003, 2004], [5, -1, 5, 2]), hidden=True))
+    order = np.arange(4)
+    sort = lambda *sort_by: columns["Year"][results.select(columns, order, sort_by)].tolist()
+    assert sort(("Year", "desc")) == [2004, 2003, 2002, 2001]
+    # Change sorts by its number, not its text, and ties keep their order
+    assert sort(("Change", "asc")) == [2002, 2004, 2001, 2003]
+    assert sort(("Change", "desc")) == [2001, 2003, 2004, 2002]
+    assert sort(("Change", "desc"), ("Year", "desc")) == [2003, 2001, 2004, 2002]
+    assert sort(("Nope", "asc")) == [2001, 2002, 2003, 2004]
+
+
+def test_query_rows_pages():
+    rows = results.to_rows(make_table(list(range(2000, 2020))), hidden=True)
+    page, pages = results.query_rows(rows, page_current=1, page_size=15, sort_by=[("Year", "desc")])
+    assert pages == 2
+    assert years(page) == [2004, 2003, 2002, 2001, 2000]
+    assert "_change" not in page[0]
+
+
+
+"""
+==========================================================================
+History
+"""
+
+def test_history_wraps_around():
+    history = results.ResultsHistory(max_rows=7, initial_size=2)
+    expected = []
+    for start in range(2000, 2040, 3):
+        batch = [start, start + 1, start + 2]
+        history.add(make_table(batch))
+        expected = (batch + expected)[:7]
+        assert len(history) == len(expected)
+        assert history.allocated() <= 7
+        assert years(history.query(page_size=100)[0]) == expected
+    assert years(history.query(page_current=1, page_size=3)[0]) == expected[3:6]
+    assert years(history.query(page_size=100, sort_by=[("Year", "asc")])[0]) == sorted(expected)
+
+
+def test_history_keeps_the_newest_rows_of_a_large_batch():
+    history = results.ResultsHistory(max_rows=4)
+    history.add(make_table(list(range(2000, 2010))))
+    assert years(history.query()[0]) == [2000, 2001, 2002, 2003]
+
+
+def test_history_query_is_redone_after_add():
+    history = results.ResultsHistory(max_rows=10)
+    history.add(make_table([2001, 2002]))
+    assert years(history.query(sort_by=[("Year", "desc")])[0]) == [2002, 2001]
+    history.add(make_table([2003]))
+    assert years(history.query(sort_by=[("Year", "desc")])[0]) == [2003, 2002, 2001]
+
+
+def test_history_store_evicts_least_recently_used():
+    store = results.HistoryStore(max_rows=5, max_sessions=2)
+    first, _ = store.add(None, make_table([2001]))
+    second, _ = store.add(None, make_table([2002]))
+    token, history = store.add(first, make_table([2003]))
+    assert (token, history.version) == (first, 2)
+    store.add(None, make_table([2004]))
+    assert first in store
+    assert second not in store
+
+
+def test_shared_history_store(tmp_path):
+    diskcache = pytest.importorskip("diskcache")
+    store = results.SharedHistoryStore(diskcache.Cache(str(tmp_path)), max_rows=5)
+    token, _ = store.add(None, make_table([2001, 2002]))
+    # another worker, with its own connection to the same directory
+    other = results.SharedHistoryStore(diskcache.Cache(str(tmp_path)), max_rows=5)
+    assert token in other
+    assert other.add(token, make_table([2003, 2004]))[1].version == 2
+    history = store.get(token)
+    assert years(history.query()[0]) == [2003, 2004, 2001, 2002]
+    assert years(history.query(sort_by=[("Year", "desc")])[0]) == [2004, 2003, 2002, 2001]
+    assert store.get("unknown") is None
+    assert store.add("unknown", make_table([2005]))[0] != "unknown"
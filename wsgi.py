@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py
+
+or with any other WSGI server pointed at wsgi:server. Settings come from
+APP_* environment variables (see app_test.production_config), with debug off
+and the results history shared through a diskcache when there are several
+workers.
+The data is loaded and the layout built here, at import, so with a preloading
+server every worker shares one copy of it.
+"""
+from app_test import create_app, production_config
+
+config = production_config()
+config["warm_up"] = True
+
+app = create_app(config)
+server = app.server